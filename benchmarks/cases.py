@@ -0,0 +1,310 @@
+import contextlib
+import itertools
+import json
+import os
+import random
+import tempfile
+import typing
+
+from PIL import Image
+
+from written_book.asset_resource import (
+    AssetResource,
+    Feature2D,
+    Feature2DOverride,
+    shared_asset_cache,
+)
+from written_book.encode import COMPRESSION_PROFILES, Encoder
+from written_book.layout import Layout, parse
+from written_book.theme import Theme
+from written_book.types import JSON
+
+from .corpus import CorpusSpec, generate_book, generate_theme
+
+__all__ = [
+    "BENCHMARKS",
+    "Params",
+    "Workload",
+    "sweep",
+]
+
+Params: typing.TypeAlias = typing.Mapping[str, JSON]
+
+
+class Workload(typing.NamedTuple):
+    # does one iteration
+    run: typing.Callable[[], typing.Any]
+    # how much one iteration does, for throughput
+    items: int
+    # what items are, like "pixels"
+    unit: str
+
+
+# sets up a workload from its parameters, yields it, then cleans up
+Benchmark: typing.TypeAlias = typing.Callable[[Params], typing.ContextManager[Workload]]
+
+
+def _tile_image(size: int, seed: int) -> Image.Image:
+    rng = random.Random(seed)
+    color = (rng.randrange(256), rng.randrange(256), rng.randrange(256), 255)
+    image = Image.new("RGBA", (size, size), color)
+    image.paste((0, 0, 0, 128), (1, 1, size - 1, size - 1))
+    return image
+
+
+def _write_png(directory: str, name: str, size: int, seed: int) -> str:
+    path = os.path.join(directory, name)
+    _tile_image(size, seed).save(path)
+    return path
+
+
+@contextlib.contextmanager
+def tile(params: Params) -> typing.Generator[Workload, None, None]:
+    """
+    Feature2D.tile() of a page sized area, with a fraction of the tiles in view
+    overridden.
+    """
+    width = typing.cast(int, params["width"])
+    height = typing.cast(int, params["height"])
+    density = typing.cast(float, params["density"])
+    cold = params["cache"] == "cold"
+    size = 16
+    asset = AssetResource.from_image(_tile_image(size, 0))
+    columns, rows = width // size + 1, height // size + 1
+    cells = list(
+        itertools.product(range(-columns // 2, columns // 2 + 1), range(0, rows))
+    )
+    rng = random.Random(1)
+    overrides = [
+        Feature2DOverride(AssetResource.from_image(_tile_image(size, i + 1)), x, y)
+        for i, (x, y) in enumerate(rng.sample(cells, int(len(cells) * density)))
+    ]
+    feature = Feature2D(asset, "top center", overrides)
+
+    def run():
+        if cold:
+            feature.tile_cache.clear()
+        feature.tile(width, height)
+
+    run()
+    yield Workload(run, width * height, "pixels")
+
+
+@contextlib.contextmanager
+def asset_load(params: Params) -> typing.Generator[Workload, None, None]:
+    """
+    Decoding the sources of many assets, each from its own PNG file.
+    """
+    count = typing.cast(int, params["assets"])
+    size = typing.cast(int, params["size"])
+    cold = params["cache"] == "cold"
+    with tempfile.TemporaryDirectory() as directory:
+        resources = [
+            AssetResource(_write_png(directory, f"{i}.png", size, i))
+            for i in range(count)
+        ]
+
+        def run():
+            if cold:
+                shared_asset_cache.clear()
+            for resource in resources:
+                # decodes the source, unless it is already in the cache
+                resource.source
+
+        run()
+        try:
+            yield Workload(run, count, "assets")
+        finally:
+            shared_asset_cache.clear()
+
+
+@contextlib.contextmanager
+def theme_import(params: Params) -> typing.Generator[Workload, None, None]:
+    """
+    Loading a theme with a background and many overrides of it, each with its own
+    source, with or without a compiled theme from an earlier build.
+    """
+    count = typing.cast(int, params["overrides"])
+    cold = params["cache"] == "cold"
+    with tempfile.TemporaryDirectory() as directory:
+        cache_directory = os.path.join(directory, "cache")
+        os.mkdir(cache_directory)
+        _write_png(directory, "background.png", 16, 0)
+        overrides: typing.List[JSON] = []
+        for i in range(count):
+            _write_png(directory, f"override{i}.png", 16, i + 1)
+            overrides.append(
+                {
+                    "feature": "background",
+                    "source": f"override{i}.png",
+                    "index": [i % 32, i // 32],
+                }
+            )
+        theme_path = os.path.join(directory, "theme.json")
+        with open(theme_path, "w") as f:
+            json.dump(
+                {
+                    "features": [{"feature": "background", "source": "background.png"}],
+                    "overrides": overrides,
+                },
+                f,
+            )
+
+        def run():
+            if cold:
+                for name in os.listdir(cache_directory):
+                    os.remove(os.path.join(cache_directory, name))
+                shared_asset_cache.clear()
+            Theme(theme_path, cache_directory)
+
+        run()
+        try:
+            yield Workload(run, count + 1, "assets")
+        finally:
+            shared_asset_cache.clear()
+
+
+@contextlib.contextmanager
+def corpus_theme(params: Params) -> typing.Generator[Workload, None, None]:
+    """
+    Loading a generated theme, with every feature and a dense square grid of
+    overrides cropped from an atlas.
+    """
+    grid = typing.cast(int, params["grid"])
+    cold = params["cache"] == "cold"
+    with tempfile.TemporaryDirectory() as directory:
+        cache_directory = os.path.join(directory, "cache")
+        os.mkdir(cache_directory)
+        theme_path = generate_theme(
+            os.path.join(directory, "theme"), CorpusSpec(override_grid=(grid, grid))
+        )
+        with open(theme_path) as f:
+            document = json.load(f)
+        entries = sum(
+            1 + len(entry.get("overrides", []))
+            for section in ("features", "overrides", "overlays")
+            for entry in document[section]
+        )
+
+        def run():
+            if cold:
+                for name in os.listdir(cache_directory):
+                    os.remove(os.path.join(cache_directory, name))
+                shared_asset_cache.clear()
+            Theme(theme_path, cache_directory)
+
+        run()
+        try:
+            yield Workload(run, entries, "assets")
+        finally:
+            shared_asset_cache.clear()
+
+
+@contextlib.contextmanager
+def corpus_layout(params: Params) -> typing.Generator[Workload, None, None]:
+    """
+    Parsing and laying out a generated book.
+    """
+    spec = CorpusSpec(
+        override_grid=(4, 4), documents=typing.cast(int, params["documents"])
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        theme = Theme(generate_theme(os.path.join(directory, "theme"), spec))
+        book = os.path.join(directory, "book")
+        sources: typing.List[str] = []
+        for name in generate_book(book, spec):
+            with open(os.path.join(book, name), encoding="utf-8") as f:
+                sources.append(f.read())
+        pages = 0
+
+        def run():
+            nonlocal pages
+            layout = Layout(theme, (146, 180))
+            pages = sum(len(layout.paginate(parse(source))) for source in sources)
+
+        run()
+        try:
+            yield Workload(run, pages, "pages")
+        finally:
+            shared_asset_cache.clear()
+
+
+@contextlib.contextmanager
+def encode(params: Params) -> typing.Generator[Workload, None, None]:
+    """
+    Encoding page sized images as PNG files, made of a few tiles or of noise.
+    """
+    profile = COMPRESSION_PROFILES[typing.cast(str, params["profile"])]
+    threads = typing.cast(int, params["threads"])
+    rng = random.Random(0)
+    images: typing.List[Image.Image] = []
+    for _ in range(16):
+        if params["colors"] == "few":
+            image = Image.new("RGBA", (146, 180))
+            for x in range(0, 146, 16):
+                for y in range(0, 180, 16):
+                    image.paste(_tile_image(16, rng.randrange(8)), (x, y))
+        else:
+            image = Image.frombytes("RGBA", (146, 180), rng.randbytes(146 * 180 * 4))
+        images.append(image)
+
+    def run():
+        with Encoder(profile, threads) as encoder:
+            for future in [encoder.submit(image) for image in images]:
+                future.result()
+
+    run()
+    yield Workload(run, len(images), "pages")
+
+
+def sweep(**axes: typing.Sequence[JSON]) -> typing.List[Params]:
+    """
+    Every combination of the values of some parameters.
+    """
+    return [dict(zip(axes, values)) for values in itertools.product(*axes.values())]
+
+
+# name -> (benchmark, full sweep, quick sweep)
+BENCHMARKS: typing.Dict[
+    str, typing.Tuple[Benchmark, typing.List[Params], typing.List[Params]]
+] = {
+    "tile": (
+        tile,
+        sweep(
+            width=[64, 256, 1024],
+            height=[64, 256, 1024],
+            density=[0.0, 0.1, 0.5],
+            cache=["cold", "warm"],
+        ),
+        sweep(width=[256], height=[256], density=[0.0, 0.5], cache=["cold", "warm"]),
+    ),
+    "asset_load": (
+        asset_load,
+        sweep(assets=[1, 16, 128], size=[16, 256], cache=["cold", "warm"]),
+        sweep(assets=[16], size=[16], cache=["cold", "warm"]),
+    ),
+    "theme_import": (
+        theme_import,
+        sweep(overrides=[0, 64, 512], cache=["cold", "warm"]),
+        sweep(overrides=[64], cache=["cold", "warm"]),
+    ),
+    "corpus_theme": (
+        corpus_theme,
+        sweep(grid=[8, 32, 64], cache=["cold", "warm"]),
+        sweep(grid=[16], cache=["cold", "warm"]),
+    ),
+    "corpus_layout": (
+        corpus_layout,
+        sweep(documents=[10, 100, 1000]),
+        sweep(documents=[10]),
+    ),
+    "encode": (
+        encode,
+        sweep(
+            profile=list(COMPRESSION_PROFILES),
+            colors=["few", "many"],
+            threads=[0, 2, 4],
+        ),
+        sweep(profile=["speed", "size"], colors=["few", "many"], threads=[0]),
+    ),
+}
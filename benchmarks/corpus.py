@@ -0,0 +1,312 @@
+import json
+import os
+import random
+import typing
+
+import click
+from PIL import Image
+
+from written_book.asset_resource import Feature, Feature1D, Feature2D
+from written_book.compiled import validate_theme
+from written_book.types import JSON, JSONObject
+
+__all__ = [
+    "Corpus",
+    "CorpusSpec",
+    "generate",
+    "generate_book",
+    "generate_theme",
+    "validate",
+]
+
+ANCHORS = [
+    "top left",
+    "top center",
+    "top right",
+    "center left",
+    "center",
+    "center right",
+    "bottom left",
+    "bottom center",
+    "bottom right",
+]
+
+JUSTIFY_1D = ["start", "center", "end"]
+
+WORDS = (
+    "the of and to in is it that for on with as was be by this are or from at an "
+    "which but not have has all were when can there been one will more if no out "
+    "so said what up its about into than them only other new some could time "
+    "these two may then first any like now my such make over our even most me "
+    "state after also made many did must before back see through way where get "
+    "much go well your know should down work year because come people just say "
+    "datapack function predicate advancement loot table tag recipe structure "
+    "scoreboard objective selector entity block item biome dimension resource"
+).split()
+
+
+class CorpusSpec(typing.NamedTuple):
+    """
+    How big a generated corpus is. The same spec always generates the same files.
+    """
+
+    seed: int = 0
+    # width and height of every tile, corner and edge
+    tile_size: int = 8
+    # width and height of each atlas image the assets are cropped from
+    atlas_size: int = 512
+    # (columns, rows) of the grid the overrides of 2D features are placed on
+    override_grid: typing.Tuple[int, int] = (32, 32)
+    # fraction of the grid that is overridden
+    override_density: float = 0.5
+    # overrides of each 1D feature
+    edge_overrides: int = 16
+    overlays: int = 8
+    # markdown files in the book
+    documents: int = 1000
+    # blocks (paragraphs, lists, code...) in each document
+    blocks: int = 40
+
+
+class Corpus(typing.NamedTuple):
+    directory: str
+    # relative to the directory, like the plugin options
+    theme: str
+    documents: typing.List[str]
+
+
+class _Atlas:
+    """
+    Hands out tiles of atlas images, starting a new image when one is full.
+    """
+
+    def __init__(self, directory: str, spec: CorpusSpec, rng: random.Random):
+        self.directory = directory
+        self.tile_size = spec.tile_size
+        self.size = max(spec.atlas_size, spec.tile_size)
+        self.per_row = self.size // self.tile_size
+        self.rng = rng
+        self.images: typing.List[Image.Image] = []
+        self.used = self.per_row**2
+
+    def tile(self) -> JSONObject:
+        if self.used == self.per_row**2:
+            self.images.append(Image.new("RGBA", (self.size, self.size)))
+            self.used = 0
+        t = self.tile_size
+        x, y = self.used % self.per_row * t, self.used // self.per_row * t
+        self.used += 1
+        color = tuple(self.rng.randrange(256) for _ in range(3))
+        image = self.images[-1]
+        image.paste((*color, 255), (x, y, x + t, y + t))
+        if t > 2:
+            image.paste(
+                (*color, self.rng.randrange(256)), (x + 1, y + 1, x + t - 1, y + t - 1)
+            )
+        return {
+            "source": f"atlas{len(self.images) - 1}.png",
+            "crop": [x, y, x + t, y + t],
+        }
+
+    def save(self):
+        for i, image in enumerate(self.images):
+            image.save(os.path.join(self.directory, f"atlas{i}.png"))
+
+
+def generate_theme(directory: str, spec: CorpusSpec = CorpusSpec()) -> str:
+    """
+    Write a theme that has every feature, dense overrides of the tiled ones and
+    some overlays, with all of its assets cropped from a few large atlases.
+    :param directory: Where to write theme.json and the atlases.
+    :param spec: How big the theme is.
+    :return: Path of theme.json.
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(spec.seed)
+    atlas = _Atlas(directory, spec, rng)
+    features: typing.List[JSON] = []
+    overrides: typing.List[JSON] = []
+    columns, rows = spec.override_grid
+    cells: typing.List[JSON] = [
+        [x - columns // 2, y - rows // 2] for y in range(rows) for x in range(columns)
+    ]
+    for name in Feature2D.FEATURE_TYPES:
+        entry: JSONObject = {
+            "feature": name,
+            **atlas.tile(),
+            "justify": rng.choice(ANCHORS),
+        }
+        placed: typing.List[JSONObject] = [
+            {"index": index, **atlas.tile()}
+            for index in rng.sample(cells, int(len(cells) * spec.override_density))
+        ]
+        # some inside the feature, the rest in the overrides section
+        inline = rng.randrange(len(placed) + 1)
+        if inline:
+            entry["overrides"] = typing.cast(typing.List[JSON], placed[:inline])
+        overrides.extend({"feature": name, **o} for o in placed[inline:])
+        features.append(entry)
+    for name in Feature1D.FEATURE_TYPES:
+        entry = {"feature": name, **atlas.tile(), "justify": rng.choice(JUSTIFY_1D)}
+        for index in rng.sample(range(-64, 64), min(spec.edge_overrides, 128)):
+            overrides.append({"feature": name, "index": index, **atlas.tile()})
+        features.append(entry)
+    for name in Feature.FEATURE_TYPES:
+        features.append({"feature": name, **atlas.tile()})
+    overlays: typing.List[JSON] = [
+        {
+            "mode": rng.choice(["inside", "outside", "edge"]),
+            "anchor": rng.choice(ANCHORS),
+            "above": rng.random() < 0.5,
+            **atlas.tile(),
+        }
+        for _ in range(spec.overlays)
+    ]
+    atlas.save()
+    path = os.path.join(directory, "theme.json")
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "features": features,
+                "overrides": overrides,
+                "overlays": overlays,
+                "colors": {},
+            },
+            f,
+        )
+    return path
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def _paragraph(rng: random.Random) -> str:
+    return " ".join(
+        _sentence(rng, rng.randint(4, 16)) for _ in range(rng.randint(1, 6))
+    )
+
+
+def _block(rng: random.Random) -> str:
+    kind = rng.choices(
+        ["paragraph", "heading", "list", "numbered", "quote", "code", "rule"],
+        [10, 2, 2, 1, 1, 2, 1],
+    )[0]
+    if kind == "heading":
+        return f"{'#' * rng.randint(2, 3)} {_sentence(rng, rng.randint(2, 5))[:-1]}"
+    if kind == "list":
+        return "\n".join(
+            f"- {_sentence(rng, rng.randint(2, 10))}" for _ in range(rng.randint(2, 6))
+        )
+    if kind == "numbered":
+        return "\n".join(
+            f"{i + 1}. {_sentence(rng, rng.randint(2, 10))}"
+            for i in range(rng.randint(2, 6))
+        )
+    if kind == "quote":
+        return "> " + _paragraph(rng)
+    if kind == "code":
+        lines = [
+            "  " * rng.randint(0, 3) + " ".join(rng.choices(WORDS, k=rng.randint(1, 8)))
+            for _ in range(rng.randint(1, 12))
+        ]
+        return "```\n" + "\n".join(lines) + "\n```"
+    if kind == "rule":
+        return "---"
+    return _paragraph(rng)
+
+
+def generate_book(directory: str, spec: CorpusSpec = CorpusSpec()) -> typing.List[str]:
+    """
+    Write markdown documents with headings, paragraphs, lists, quotes, code blocks
+    and rules, in chapter directories of 100 documents.
+    :param directory: Where to write them.
+    :param spec: How many documents, and how long.
+    :return: Paths of the documents, relative to the directory.
+    """
+    rng = random.Random(spec.seed)
+    names: typing.List[str] = []
+    for i in range(spec.documents):
+        name = f"chapter{i // 100:03}/page{i:05}.md"
+        path = os.path.join(directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        blocks = [f"# {_sentence(rng, rng.randint(2, 6))[:-1]}"]
+        blocks.extend(_block(rng) for _ in range(spec.blocks))
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n\n".join(blocks) + "\n")
+        names.append(name)
+    return names
+
+
+def generate(directory: str, spec: CorpusSpec = CorpusSpec()) -> Corpus:
+    """
+    Write a beet project: a theme in theme/, a book in book/, and a beet.json
+    that builds it with the written_book plugin.
+    :param directory: Where to write the project.
+    :param spec: How big it is.
+    :return: What was written.
+    """
+    generate_theme(os.path.join(directory, "theme"), spec)
+    documents = [
+        f"book/{name}" for name in generate_book(os.path.join(directory, "book"), spec)
+    ]
+    with open(os.path.join(directory, "beet.json"), "w") as f:
+        json.dump(
+            {
+                "name": "written-book-corpus",
+                "output": "out",
+                "pipeline": ["written_book"],
+                "meta": {"written_book": {"theme": "theme/theme.json"}},
+            },
+            f,
+            indent=2,
+        )
+    return Corpus(directory, "theme/theme.json", documents)
+
+
+def validate(theme_path: str) -> JSONObject:
+    """
+    Check a generated theme the way a build would.
+    :param theme_path: Path of theme.json.
+    :return: The validated document.
+    """
+    with open(theme_path) as f:
+        document: JSON = json.load(f)
+    return validate_theme(document, os.path.dirname(os.path.abspath(theme_path)))
+
+
+_DEFAULTS = CorpusSpec._field_defaults
+
+
+@click.command()
+@click.argument("directory", type=click.Path(file_okay=False))
+@click.option("--seed", default=_DEFAULTS["seed"])
+@click.option("--tile-size", default=_DEFAULTS["tile_size"])
+@click.option("--atlas-size", default=_DEFAULTS["atlas_size"])
+@click.option("--override-grid", nargs=2, type=int, default=_DEFAULTS["override_grid"])
+@click.option("--override-density", default=_DEFAULTS["override_density"])
+@click.option("--edge-overrides", default=_DEFAULTS["edge_overrides"])
+@click.option("--overlays", default=_DEFAULTS["overlays"])
+@click.option("--documents", default=_DEFAULTS["documents"])
+@click.option("--blocks", default=_DEFAULTS["blocks"])
+def main(directory: str, **options: typing.Any):
+    """
+    Generate a large theme and book into DIRECTORY.
+    """
+    options["override_grid"] = tuple(options["override_grid"])
+    corpus = generate(directory, CorpusSpec(**options))
+    document = validate(os.path.join(directory, corpus.theme))
+    sourced = 0
+    for section in ("features", "overrides", "overlays"):
+        for entry in typing.cast(typing.List[JSONObject], document.get(section, [])):
+            sourced += 1 + len(
+                typing.cast(typing.List[JSON], entry.get("overrides", []))
+            )
+    click.echo(
+        f"{sourced} theme entries, {len(corpus.documents)} documents in {directory}"
+    )
+
+
+if __name__ == "__main__":
+    main()
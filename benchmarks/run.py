@@ -0,0 +1,299 @@
+import fnmatch
+import json
+import multiprocessing
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+import typing
+
+import click
+import PIL
+
+from written_book.types import JSON, JSONObject
+
+from .cases import BENCHMARKS, Params
+
+__all__ = [
+    "Regression",
+    "Result",
+    "compare",
+    "measure",
+    "run_suite",
+]
+
+FORMAT_VERSION = 1
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+
+def _max_rss() -> typing.Optional[int]:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes, except on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+class Result(typing.NamedTuple):
+    benchmark: str
+    params: Params
+    # iterations timed
+    iterations: int
+    # median time of an iteration
+    seconds: float
+    # fastest iteration
+    min_seconds: float
+    # items per second, at the median time
+    throughput: float
+    unit: str
+    # most memory allocated by Python (and not Pillow) during an iteration
+    peak_python_bytes: int
+    # high-water mark of the resident memory of the process, if known
+    max_rss_bytes: typing.Optional[int]
+
+    @property
+    def name(self) -> str:
+        return case_name(self.benchmark, self.params)
+
+    def to_json(self) -> JSONObject:
+        return {"name": self.name, **self._asdict(), "params": dict(self.params)}
+
+    @classmethod
+    def from_json(cls, body: JSONObject) -> "Result":
+        return cls(**{field: body[field] for field in cls._fields})  # type: ignore
+
+
+def case_name(benchmark: str, params: Params) -> str:
+    return f"{benchmark}[{','.join(f'{k}={v}' for k, v in params.items())}]"
+
+
+def measure(
+    benchmark: str,
+    params: Params,
+    min_time: float = 0.2,
+    min_iterations: int = 5,
+) -> Result:
+    """
+    Time a benchmark, after setting it up (and running it once) untimed.
+    :param benchmark: Name of the benchmark.
+    :param params: Its parameters.
+    :param min_time: Keep iterating for at least this many seconds...
+    :param min_iterations: ...and at least this many times.
+    :return: The result.
+    """
+    function = BENCHMARKS[benchmark][0]
+    with function(params) as workload:
+        times: typing.List[float] = []
+        peak = 0
+        tracemalloc.start()
+        try:
+            started = time.perf_counter()
+            while (
+                len(times) < min_iterations or time.perf_counter() - started < min_time
+            ):
+                # only what an iteration allocates, not the list of times
+                tracemalloc.reset_peak()
+                allocated, _ = tracemalloc.get_traced_memory()
+                before = time.perf_counter()
+                workload.run()
+                times.append(time.perf_counter() - before)
+                peak = max(peak, tracemalloc.get_traced_memory()[1] - allocated)
+        finally:
+            tracemalloc.stop()
+    median = statistics.median(times)
+    return Result(
+        benchmark,
+        params,
+        len(times),
+        median,
+        min(times),
+        workload.items / median if median else float("inf"),
+        workload.unit,
+        peak,
+        _max_rss(),
+    )
+
+
+def _measure_child(args: typing.Tuple[str, Params, float, int]) -> Result:
+    return measure(*args)
+
+
+def run_suite(
+    pattern: str = "*",
+    quick: bool = False,
+    isolate: bool = True,
+    min_time: float = 0.2,
+    report: typing.Callable[[Result], None] = lambda result: None,
+) -> typing.List[Result]:
+    """
+    Run every benchmark case matching a pattern.
+    :param pattern: fnmatch pattern of case names, like "tile[*cold*".
+    :param quick: Run the small sweeps instead of the full ones.
+    :param isolate: Run every case in a new process, so that the peak memory of
+        one doesn't hide the next and caches start out the same.
+    :param min_time: Seconds to keep timing each case for.
+    :param report: Called with every result as soon as it is ready.
+    :return: The results, in order.
+    """
+    cases = [
+        (name, params)
+        for name, (_, full, small) in BENCHMARKS.items()
+        for params in (small if quick else full)
+        if fnmatch.fnmatchcase(case_name(name, params), pattern)
+    ]
+    results: typing.List[Result] = []
+    context = multiprocessing.get_context("spawn")
+    for name, params in cases:
+        if isolate:
+            with context.Pool(1) as pool:
+                result = pool.apply(_measure_child, ((name, params, min_time, 5),))
+        else:
+            result = measure(name, params, min_time)
+        report(result)
+        results.append(result)
+    return results
+
+
+def environment() -> JSONObject:
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "pillow": PIL.__version__,
+    }
+
+
+def dump(results: typing.Sequence[Result]) -> JSONObject:
+    return {
+        "version": FORMAT_VERSION,
+        "environment": environment(),
+        "results": [result.to_json() for result in results],
+    }
+
+
+def load(document: JSON) -> typing.List[Result]:
+    document = typing.cast(JSONObject, document)
+    if document.get("version") != FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported benchmark results version {document.get('version')}"
+        )
+    return [
+        Result.from_json(typing.cast(JSONObject, body))
+        for body in typing.cast(typing.List[JSON], document["results"])
+    ]
+
+
+class Regression(typing.NamedTuple):
+    name: str
+    # "seconds" or "peak_python_bytes"
+    metric: str
+    baseline: float
+    current: float
+
+    @property
+    def ratio(self) -> float:
+        return self.current / self.baseline if self.baseline else float("inf")
+
+
+def compare(
+    baseline: typing.Sequence[Result],
+    current: typing.Sequence[Result],
+    threshold: float = 0.1,
+    memory_floor: int = 64 * 1024,
+) -> typing.List[Regression]:
+    """
+    Find the cases that got slower, or use more memory, than in a baseline.
+    Cases that are only in one of the two are ignored.
+    :param baseline: Earlier results.
+    :param current: New results.
+    :param threshold: How much worse is a regression, 0.1 for 10%.
+    :param memory_floor: Memory differences smaller than this (in bytes) are noise.
+    :return: The regressions.
+    """
+    before = {result.name: result for result in baseline}
+    regressions: typing.List[Regression] = []
+    for result in current:
+        old = before.get(result.name)
+        if old is None:
+            continue
+        if result.seconds > old.seconds * (1 + threshold):
+            regressions.append(
+                Regression(result.name, "seconds", old.seconds, result.seconds)
+            )
+        peak, old_peak = result.peak_python_bytes, old.peak_python_bytes
+        if peak > old_peak * (1 + threshold) and peak - old_peak > memory_floor:
+            regressions.append(
+                Regression(result.name, "peak_python_bytes", old_peak, peak)
+            )
+    return regressions
+
+
+def _report(result: Result):
+    click.echo(
+        f"{result.name:<60} {result.seconds * 1000:10.3f} ms "
+        f"{result.throughput:14.1f} {result.unit}/s "
+        f"{result.peak_python_bytes / 1024:10.1f} KiB",
+        err=True,
+    )
+
+
+@click.command()
+@click.option("-k", "pattern", default="*", help="Only run cases matching this.")
+@click.option("--quick", is_flag=True, help="Run the small sweeps.")
+@click.option(
+    "--in-process", is_flag=True, help="Run every case in this process, faster."
+)
+@click.option("--min-time", default=0.2, help="Seconds to time each case for.")
+@click.option(
+    "-o", "--output", type=click.Path(dir_okay=False), help="Write results as JSON."
+)
+@click.option(
+    "--compare",
+    "baseline_path",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Fail if anything regressed against these results.",
+)
+@click.option("--threshold", default=0.1, help="Regression threshold, 0.1 for 10%.")
+def main(
+    pattern: str,
+    quick: bool,
+    in_process: bool,
+    min_time: float,
+    output: typing.Optional[str],
+    baseline_path: typing.Optional[str],
+    threshold: float,
+):
+    """
+    Benchmark tiling, asset loading and theme import.
+    """
+    results = run_suite(pattern, quick, not in_process, min_time, _report)
+    document = dump(results)
+    if output:
+        with open(output, "w") as f:
+            json.dump(document, f, indent=2)
+    else:
+        click.echo(json.dumps(document, indent=2))
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = load(json.load(f))
+        regressions = compare(baseline, results, threshold)
+        for regression in regressions:
+            click.secho(
+                f"{regression.name}: {regression.metric} "
+                f"{regression.baseline:.6g} -> {regression.current:.6g} "
+                f"({regression.ratio:.2f}x)",
+                fg="red",
+                err=True,
+            )
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import itertools
+
+import pytest
+
+from written_book.asset_resource import Anchor2D
+from written_book.exceptions import ValidationError
+
+X = Anchor2D.X
+Y = Anchor2D.Y
+Mode = Anchor2D.AnchorMode
+
+
+def reference_valid(x_anchor: X, y_anchor: Y, mode: Mode) -> bool:
+    return (
+        X.valid(x_anchor, mode)
+        and Y.valid(y_anchor, mode)
+        and not (x_anchor in Anchor2D.ONLY_ONE_OF and y_anchor in Anchor2D.ONLY_ONE_OF)
+    )
+
+
+@pytest.mark.parametrize("x_anchor,y_anchor,mode", list(itertools.product(X, Y, Mode)))
+def test_combinations(x_anchor: X, y_anchor: Y, mode: Mode):
+    expected = reference_valid(x_anchor, y_anchor, mode)
+    assert Anchor2D.valid(x_anchor, y_anchor, mode) == expected
+    assert (
+        Anchor2D.valid(x_anchor.value[0], y_anchor.value[0], mode.value.upper())
+        == expected
+    )
+    code = f"{y_anchor.value[0]} {x_anchor.value[0]}"
+    assert Anchor2D.lookup(code) == (
+        x_anchor,
+        y_anchor,
+        frozenset(m for m in Mode if reference_valid(x_anchor, y_anchor, m)),
+    )
+
+
+def test_unknown_words():
+    assert not Anchor2D.valid("sideways", "top", "inside")
+    assert not Anchor2D.valid("left", "top", "nowhere")
+
+
+def test_parse():
+    assert Anchor2D.parse("inside-top left") == (X.LEFT, Y.INSIDE_TOP)
+    assert Anchor2D.parse("  Top   RIGHT ") == (X.RIGHT, Y.TOP)
+    assert Anchor2D.parse("left") == (X.LEFT, Y.CENTER)
+
+
+@pytest.mark.parametrize(
+    "code", ["", "middle", "left top", "top left right", "top sideways"]
+)
+def test_invalid_anchor(code: str):
+    with pytest.raises(ValidationError):
+        Anchor2D.parse(code)
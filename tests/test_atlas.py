@@ -0,0 +1,121 @@
+import os
+import pathlib
+import random
+
+import pytest
+from PIL import Image, PngImagePlugin
+
+from written_book.asset_resource import AssetResource
+from written_book.atlas import ATLAS_VERSION, INDEX_KEY, Atlas, pack
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_pack_no_overlap(seed: int):
+    rng = random.Random(seed)
+    sizes = [(rng.randint(1, 40), rng.randint(1, 40)) for _ in range(200)]
+    sizes.append((100, 10))  # bigger than a page
+    placements, pages = pack(sizes, 64)
+    taken: dict[int, set[tuple[int, int]]] = {}
+    for (width, height), (page, x, y) in zip(sizes, placements):
+        assert x + width <= pages[page][0] and y + height <= pages[page][1]
+        cells = {(x + dx, y + dy) for dx in range(width) for dy in range(height)}
+        assert not cells & taken.setdefault(page, set())
+        taken[page] |= cells
+    assert all(max(page) <= 64 for page in pages if page != (100, 10))
+
+
+def make_sheet(path: pathlib.Path, seed: int) -> str:
+    rng = random.Random(seed)
+    image = Image.new("RGBA", (24, 16))
+    image.putdata(
+        [tuple(rng.randrange(256) for _ in range(4)) for _ in range(24 * 16)]  # type: ignore
+    )
+    image.save(path)
+    return str(path)
+
+
+def make_resources(tmp_path: pathlib.Path) -> list[AssetResource]:
+    first, second = str(tmp_path / "a.png"), str(tmp_path / "b.png")
+    if not os.path.exists(first):
+        make_sheet(tmp_path / "a.png", 1)
+        make_sheet(tmp_path / "b.png", 2)
+    return [
+        AssetResource(first),
+        AssetResource(first, (0, 0, 8, 8)),
+        AssetResource(first, (8, 0, 24, 5)),
+        AssetResource(second, (3, 3, 10, 16)),
+        AssetResource(second, (3, 3, 10, 16)),
+        AssetResource.from_image(Image.new("RGBA", (2, 2))),
+    ]
+
+
+def test_atlas_round_trip(tmp_path: pathlib.Path):
+    resources = make_resources(tmp_path)
+    expected = [r.get().tobytes() for r in resources]
+    path = str(tmp_path / "cache" / "theme.atlas.png")
+    atlas = Atlas.build(resources, path, max_size=24)
+    assert len(atlas.regions) == 4
+    assert atlas.page_count > 1
+    atlas.apply(resources)
+    assert all(r.source_path in atlas.pages for r in resources[:5])
+    assert [r.get().tobytes() for r in resources] == expected
+
+    # warm start: the index comes from the first page alone
+    fresh = make_resources(tmp_path)
+    loaded = Atlas.load(path)
+    assert loaded is not None
+    assert loaded.regions == atlas.regions
+    loaded.apply(fresh)
+    assert [r.get().tobytes() for r in fresh] == expected
+
+
+def test_atlas_invalidated_by_source_change(tmp_path: pathlib.Path):
+    resources = make_resources(tmp_path)
+    path = str(tmp_path / "theme.atlas.png")
+    Atlas.build(resources, path)
+    os.utime(tmp_path / "a.png", ns=(1, 1))
+    assert Atlas.load(path) is None
+    atlas = Atlas.load_or_build(make_resources(tmp_path), path)
+    assert Atlas.load(path) is not None
+    assert atlas.valid()
+
+
+def test_atlas_missing(tmp_path: pathlib.Path):
+    assert Atlas.load(str(tmp_path / "nothing.png")) is None
+
+
+def test_empty_atlas(tmp_path: pathlib.Path):
+    path = str(tmp_path / "theme.atlas.png")
+    # nothing from files, so nothing to pack
+    resources = [AssetResource.from_image(Image.new("RGBA", (2, 2)))]
+    atlas = Atlas.build(resources, path)
+    assert not atlas.regions
+    loaded = Atlas.load(path)
+    assert loaded is not None and not loaded.regions
+    assert Atlas.load_or_build([], path).pages == atlas.pages
+
+
+@pytest.mark.parametrize(
+    "index",
+    [
+        "not json",
+        "[]",
+        "{}",
+        '{"version": %d}' % ATLAS_VERSION,
+        '{"version": %d, "pages": 1, "sources": [], "regions": []}' % ATLAS_VERSION,
+        '{"version": %d, "pages": "x", "sources": {}, "regions": []}' % ATLAS_VERSION,
+        '{"version": %d, "pages": 1, "sources": {}, "regions": [["a.png", [0, 0], 0, [0, 0, 1, 1]]]}'
+        % ATLAS_VERSION,
+        '{"version": %d, "pages": 1, "sources": {"a.png": null}, "regions": []}'
+        % ATLAS_VERSION,
+    ],
+)
+def test_atlas_damaged_index(tmp_path: pathlib.Path, index: str):
+    path = str(tmp_path / "theme.atlas.png")
+    info = PngImagePlugin.PngInfo()
+    info.add_itxt(INDEX_KEY, index, zip=True)
+    Image.new("RGBA", (1, 1)).save(path, pnginfo=info)
+    assert Atlas.load(path) is None
+    resources = make_resources(tmp_path)
+    atlas = Atlas.load_or_build(resources, path)
+    assert atlas.regions and Atlas.load(path) is not None
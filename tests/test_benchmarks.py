@@ -0,0 +1,33 @@
+import json
+
+import pytest
+
+from benchmarks.cases import BENCHMARKS
+from benchmarks.run import compare, dump, load, measure
+
+
+@pytest.mark.parametrize("benchmark", list(BENCHMARKS))
+def test_benchmarks_run(benchmark: str):
+    _, _, quick = BENCHMARKS[benchmark]
+    result = measure(benchmark, quick[0], min_time=0, min_iterations=2)
+    assert result.iterations == 2
+    assert result.seconds > 0 and result.throughput > 0
+    assert result.name.startswith(f"{benchmark}[")
+
+
+def test_compare():
+    baseline = measure("tile", BENCHMARKS["tile"][2][0], 0, 2)
+    (round_trip,) = load(json.loads(json.dumps(dump([baseline]))))
+    assert round_trip == baseline
+    assert compare([baseline], [baseline]) == []
+
+    slower = baseline._replace(seconds=baseline.seconds * 1.5)
+    (regression,) = compare([baseline], [slower], threshold=0.2)
+    assert regression.metric == "seconds" and regression.ratio == pytest.approx(1.5)
+    assert compare([baseline], [slower], threshold=0.6) == []
+
+    bigger = baseline._replace(peak_python_bytes=baseline.peak_python_bytes + 2**20)
+    assert [r.metric for r in compare([baseline], [bigger])] == ["peak_python_bytes"]
+    # small differences are noise
+    bigger = baseline._replace(peak_python_bytes=baseline.peak_python_bytes + 1024)
+    assert compare([baseline], [bigger], threshold=0) == []
@@ -0,0 +1,258 @@
+import os
+import pathlib
+import typing
+
+import pytest
+from PIL import Image
+
+from written_book.asset_resource import (
+    AssetResource,
+    Feature2D,
+    Feature2DOverride,
+    shared_asset_cache,
+)
+from written_book.cache import AssetCache, LRUCache, image_nbytes, readonly_view
+from written_book.exceptions import ValidationError
+from written_book.types import JSON
+
+i8 = Image.new("RGBA", (8, 8), (255, 0, 0, 255))
+i8_2 = Image.new("RGBA", (8, 8), (0, 255, 0, 255))
+
+
+def test_lru_budget():
+    cache: LRUCache[str, bytes] = LRUCache(10, len)
+    cache.put("a", b"1234")
+    cache.put("b", b"1234")
+    assert cache.get("a") == b"1234"  # a is now the most recently used
+    cache.put("c", b"1234")
+    assert "b" not in cache
+    assert cache.keys() == ["a", "c"]
+    assert cache.stats.nbytes == 8
+    assert cache.stats.evictions == 1
+
+
+def test_lru_oversized_value():
+    cache: LRUCache[str, bytes] = LRUCache(4, len)
+    cache.put("a", b"123456")
+    assert len(cache) == 0
+    assert cache.get("a") is None
+    assert cache.stats.misses == 1
+
+
+def test_lru_evict_and_clear():
+    cache: LRUCache[str, bytes] = LRUCache(100, len)
+    cache.put("a", b"12")
+    cache.put("b", b"34")
+    assert cache.evict("a")
+    assert not cache.evict("a")
+    assert cache.nbytes == 2
+    cache.clear()
+    assert len(cache) == 0 and cache.nbytes == 0
+
+
+def test_readonly_view_is_copy_on_write():
+    source = i8.copy()
+    view = readonly_view(source)
+    view.paste((0, 0, 255, 255), (0, 0, 4, 4))
+    assert view.getpixel((0, 0)) == (0, 0, 255, 255)
+    assert source.getpixel((0, 0)) == (255, 0, 0, 255)
+    with pytest.raises(ValueError):
+        readonly_view(source).load()[0, 0] = (0, 0, 0, 0)  # type: ignore
+
+
+def test_tile_cache_hits():
+    feature = Feature2D(AssetResource.from_image(i8), "center")
+    first = feature.tile(20, 20)
+    second = feature.tile(20, 20)
+    assert feature.tile_cache.stats.hits == 1
+    assert feature.tile_cache.stats.misses == 1
+    assert first.tobytes() == second.tobytes()
+    assert feature.tile_cache.nbytes == image_nbytes(first)
+    # a different size or justification is a different entry
+    feature.tile(21, 20)
+    feature.justifyX, feature.justifyY = Feature2D.get_justify("top left")
+    feature.tile(20, 20)
+    assert len(feature.tile_cache) == 3
+
+
+def test_tile_cache_cleared_by_overrides():
+    feature = Feature2D(AssetResource.from_image(i8), "center")
+    before = feature.tile(8, 8)
+    feature.set_overrides([Feature2DOverride(AssetResource.from_image(i8_2), 0, 0)])
+    assert len(feature.tile_cache) == 0
+    after = feature.tile(8, 8)
+    assert before.tobytes() != after.tobytes()
+
+
+def test_tile_results_cant_change_cache():
+    feature = Feature2D(AssetResource.from_image(i8), "center")
+    feature.tile(8, 8).paste((0, 0, 0, 0), (0, 0, 8, 8))
+    assert feature.tile(8, 8).getpixel((0, 0)) == (255, 0, 0, 255)
+
+
+def test_tile_cache_budget():
+    feature = Feature2D(AssetResource.from_image(i8), "center", cache_bytes=0)
+    feature.tile(8, 8)
+    feature.tile(8, 8)
+    assert len(feature.tile_cache) == 0
+    assert feature.tile_cache.stats.hits == 0
+
+
+def save_png(path: pathlib.Path, image: Image.Image, mtime_ns: int) -> str:
+    image.save(path)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+    return str(path)
+
+
+@pytest.mark.parametrize("validate", AssetCache.VALIDATION_MODES)
+def test_asset_cache_reloads_changed_files(tmp_path: pathlib.Path, validate: str):
+    cache = AssetCache(1024 * 1024, validate)
+    path = save_png(tmp_path / "a.png", i8, 1_000_000_000)
+    first = cache.get(path)
+    assert cache.get(path) is first
+    save_png(tmp_path / "a.png", i8_2, 2_000_000_000)
+    second = cache.get(path)
+    assert second is not first
+    assert second.getpixel((0, 0)) == (0, 255, 0, 255)
+    stats = cache.stats
+    assert (stats.hits, stats.misses, stats.stale) == (1, 2, 1)
+
+
+def test_asset_cache_budget(tmp_path: pathlib.Path):
+    cache = AssetCache(image_nbytes(i8) * 2)
+    paths = [save_png(tmp_path / f"{n}.png", i8, 1_000_000_000) for n in range(3)]
+    for path in paths:
+        cache.get(path)
+    assert len(cache) == 2
+    assert paths[0] not in cache
+    assert cache.stats.evictions == 1
+    assert cache.evict(paths[1])
+    assert len(cache) == 1
+    cache.clear()
+    assert cache.stats.nbytes == 0
+
+
+def test_asset_cache_validation_mode():
+    with pytest.raises(ValueError):
+        AssetCache(1, "never")
+
+
+def test_asset_resource_uses_shared_cache(tmp_path: pathlib.Path):
+    path = save_png(tmp_path / "shared.png", i8, 1_000_000_000)
+    first = AssetResource(path)
+    assert first.source is shared_asset_cache.get(first.source_path)
+    assert AssetResource(path).source is first.source
+    assert shared_asset_cache.evict(first.source_path)
+
+
+def test_asset_resource_decodes_lazily(tmp_path: pathlib.Path):
+    path = save_png(tmp_path / "lazy.png", Image.new("RGBA", (6, 4)), 1_000_000_000)
+    resource = AssetResource(path)
+    assert resource.crop == (0, 0, 6, 4)
+    assert resource.source_path not in shared_asset_cache
+    assert resource.get().size == (6, 4)
+    assert resource.source_path in shared_asset_cache
+    shared_asset_cache.evict(resource.source_path)
+
+
+def test_asset_resource_missing_file(tmp_path: pathlib.Path):
+    with pytest.raises(FileNotFoundError):
+        AssetResource(str(tmp_path / "missing.png"), (0, 0, 1, 1))
+
+
+def test_asset_resource_crops_once(tmp_path: pathlib.Path):
+    sheet = Image.new("RGBA", (8, 4), (255, 0, 0, 255))
+    sheet.paste((0, 0, 255, 255), (4, 0, 8, 4))
+    path = save_png(tmp_path / "sheet.png", sheet, 1_000_000_000)
+    left, right = AssetResource(path, (0, 0, 4, 4)), AssetResource(path, (4, 0, 8, 4))
+    also_left = AssetResource(path, (0, 0, 4, 4))
+    assert left.size == right.size == (4, 4)
+    assert left.get().getpixel((0, 0)) == (255, 0, 0, 255)
+    assert right.get().getpixel((0, 0)) == (0, 0, 255, 255)
+    entries = len(shared_asset_cache)
+    left.get()
+    also_left.get()
+    assert len(shared_asset_cache) == entries  # one copy of each region
+    mutable = left.get_copy()
+    mutable.load()[0, 0] = (0, 0, 0, 0)  # type: ignore
+    assert left.get().getpixel((0, 0)) == (255, 0, 0, 255)
+    shared_asset_cache.evict(left.source_path)
+    assert len(shared_asset_cache) == entries - 3
+
+
+def test_asset_resource_checks_the_file_once(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+):
+    path = save_png(tmp_path / "once.png", i8, 1_000_000_000)
+    resource = AssetResource(path, (0, 0, 4, 4))
+    stamps: typing.List[str] = []
+    stamp = shared_asset_cache._stamp  # type: ignore
+
+    def counted(source: str) -> typing.Tuple[int, ...] | str:
+        stamps.append(source)
+        return stamp(source)
+
+    monkeypatch.setattr(shared_asset_cache, "_stamp", counted)
+    for _ in range(3):
+        assert resource.get().getpixel((0, 0)) == (255, 0, 0, 255)
+    assert len(stamps) == 1
+    # dropping the file from the cache makes the resource look it up again
+    save_png(tmp_path / "once.png", i8_2, 2_000_000_000)
+    shared_asset_cache.evict(resource.source_path)
+    assert resource.get().getpixel((0, 0)) == (0, 255, 0, 255)
+    assert len(stamps) == 2
+    shared_asset_cache.evict(resource.source_path)
+
+
+def test_preload_decodes_each_file_once(tmp_path: pathlib.Path):
+    cache = AssetCache(1024 * 1024)
+    paths = [save_png(tmp_path / f"{n}.png", i8, 1_000_000_000) for n in range(4)]
+    assert cache.preload(paths + paths[:2], workers=3) == 4
+    assert len(cache) == 4
+    assert cache.preload(paths) == 0
+    assert cache.get(paths[0]).size == (8, 8)
+
+
+def test_only_lookups_count(tmp_path: pathlib.Path):
+    cache = AssetCache(1024 * 1024)
+    paths = [save_png(tmp_path / f"{n}.png", i8, 1_000_000_000) for n in range(2)]
+    cache.preload(paths)
+    cache.preload(paths)
+    assert (cache.stats.hits, cache.stats.misses) == (0, 0)
+    cache.get(paths[0])
+    # preloaded, so only cropped
+    cache.get_crop(paths[1], (0, 0, 4, 4))
+    cache.evict(paths[1])
+    cache.get_crop(paths[1], (0, 0, 4, 4))
+    assert (cache.stats.hits, cache.stats.misses) == (2, 1)
+
+
+def test_preload_errors_in_order(tmp_path: pathlib.Path):
+    cache = AssetCache(1024 * 1024)
+    good = save_png(tmp_path / "good.png", i8, 1_000_000_000)
+    bad = [tmp_path / "bad1.png", tmp_path / "bad2.png"]
+    for path in bad:
+        path.write_bytes(b"not an image")
+    with pytest.raises(Exception) as exc_info:
+        cache.preload([good, str(bad[1]), str(bad[0])], workers=4)
+    assert "bad2" in str(exc_info.value)
+
+
+def test_import_many(tmp_path: pathlib.Path):
+    save_png(tmp_path / "one.png", i8, 1_000_000_000)
+    save_png(tmp_path / "two.png", i8_2, 1_000_000_000)
+    bodies: typing.List[JSON] = [
+        {"source": "one.png"},
+        {"source": "two.png", "crop": [0, 0, 4, 4]},
+        {"source": "one.png", "crop": [4, 4, 8, 8]},
+    ]
+    resources = AssetResource.import_many(bodies, str(tmp_path), workers=2)
+    assert [r.size for r in resources] == [(8, 8), (4, 4), (4, 4)]
+    assert all(r.source_path in shared_asset_cache for r in resources)
+    for resource in resources:
+        shared_asset_cache.evict(resource.source_path)
+    with pytest.raises(ValidationError) as exc_info:
+        AssetResource.import_many(
+            [{"source": "one.png"}, {"source": 1}, {"crop": []}], str(tmp_path)
+        )
+    assert exc_info.value.error_code == ValidationError.ErrorCode.WRONG_TYPE.value
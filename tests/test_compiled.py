@@ -0,0 +1,155 @@
+import json
+import os
+import pathlib
+import typing
+
+import pytest
+from PIL import Image
+
+from written_book import compiled
+from written_book.asset_resource import shared_asset_cache
+from written_book.cache import AssetCache, LRUCache
+from written_book.compiled import (
+    EXTENSION,
+    CompiledTheme,
+    compile_theme,
+    load_theme_document,
+    theme_digest,
+)
+from written_book.exceptions import ValidationError
+from written_book.types import JSONObject
+
+
+def write_theme(directory: pathlib.Path) -> str:
+    Image.new("RGBA", (8, 8), (255, 0, 0, 255)).save(directory / "bg.png")
+    Image.new("RGBA", (8, 8), (0, 255, 0, 255)).save(directory / "bg_center.png")
+    Image.new("RGBA", (4, 6), (0, 0, 255, 255)).save(directory / "overlay.png")
+    theme: JSONObject = {
+        "features": [
+            {"feature": "background", "source": "bg.png", "justify": "center"},
+            {"feature": "top_edge", "source": "bg.png", "crop": [0, 0, 8, 2]},
+            {"feature": "bullet", "source": "overlay.png"},
+        ],
+        "overrides": [
+            {"index": [0, 0], "source": "bg_center.png", "feature": "background"}
+        ],
+        "overlays": [
+            {"mode": "inside", "anchor": "top right", "source": "overlay.png"}
+        ],
+        "colors": {},
+    }
+    path = directory / "theme.json"
+    path.write_text(json.dumps(theme))
+    return str(path)
+
+
+def forget(directory: pathlib.Path):
+    for path in directory.glob("*.png"):
+        shared_asset_cache.evict(str(path))
+
+
+def test_compile_round_trip(tmp_path: pathlib.Path):
+    compiled = compile_theme(write_theme(tmp_path))
+    assert compiled.document["features"][0]["source"] == str(tmp_path / "bg.png")  # type: ignore
+    assert compiled.document["overlays"][0]["crop"] == [0, 0, 4, 6]  # type: ignore
+    compiled.save(str(tmp_path / "out" / "theme.wbtheme"))
+    loaded = CompiledTheme.load(str(tmp_path / "out" / "theme.wbtheme"))
+    assert loaded is not None
+    assert loaded.digest == compiled.digest
+    assert loaded.document == compiled.document
+    assert {k: v.tobytes() for k, v in loaded.images.items()} == {
+        k: v.tobytes() for k, v in compiled.images.items()
+    }
+    forget(tmp_path)
+
+
+# ways a compiled theme can end up damaged on disk
+DAMAGE: typing.List[typing.Callable[[bytes], bytes]] = [
+    lambda raw: raw[: len(raw) // 2],
+    lambda raw: raw[:20],
+    lambda raw: raw.replace(b'"images"', b'"imagez"'),
+    lambda raw: raw.replace(b'"size": [8, 8]', b'"size": 8', 1),
+]
+
+
+@pytest.mark.parametrize("damage", DAMAGE)
+def test_damaged_file_is_a_miss(
+    tmp_path: pathlib.Path, damage: typing.Callable[[bytes], bytes]
+):
+    theme = write_theme(tmp_path)
+    cache = tmp_path / "cache"
+    document = load_theme_document(theme, str(cache))
+    (path,) = cache.glob("*" + EXTENSION)
+    path.write_bytes(damage(path.read_bytes()))
+    assert CompiledTheme.load(str(path)) is None
+    assert load_theme_document(theme, str(cache)) == document
+    assert CompiledTheme.load(str(path)) is not None
+    forget(tmp_path)
+
+
+def test_warm_start_skips_decoding(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+):
+    theme = write_theme(tmp_path)
+    cache = tmp_path / "cache"
+    document = load_theme_document(theme, str(cache))
+    assert len(list(cache.glob("*" + EXTENSION))) == 1
+    forget(tmp_path)
+
+    def fail(path: str) -> Image.Image:
+        raise AssertionError(f"decoded {path}")
+
+    monkeypatch.setattr(AssetCache, "decode", staticmethod(fail))
+    assert load_theme_document(theme, str(cache)) == document
+    assert shared_asset_cache.get(str(tmp_path / "bg.png")).size == (8, 8)
+    forget(tmp_path)
+
+
+def test_asset_change_recompiles(tmp_path: pathlib.Path):
+    theme = write_theme(tmp_path)
+    cache = tmp_path / "cache"
+    before = theme_digest(theme)
+    load_theme_document(theme, str(cache))
+    Image.new("RGBA", (8, 8), (1, 2, 3, 255)).save(tmp_path / "bg.png")
+    after = theme_digest(theme)
+    assert before != after
+    load_theme_document(theme, str(cache))
+    (path,) = cache.glob("*" + EXTENSION)
+    assert path.name.endswith(after + EXTENSION)
+    forget(tmp_path)
+
+
+def test_digest_uses_stamps(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch):
+    theme = write_theme(tmp_path)
+    cache = str(tmp_path / "cache")
+    # old enough to trust the modification times
+    for path in tmp_path.glob("*.png"):
+        os.utime(path, ns=(0, 10**18))
+    before = theme_digest(theme, cache)
+    # as if in a new process, which only has the hashes in the cache directory
+    hashes: LRUCache[str, typing.Tuple[int, int, str]] = LRUCache(
+        compiled.MAX_HASHES, lambda _: 1
+    )
+    stored: LRUCache[str, typing.Set[str]] = LRUCache(
+        compiled.MAX_HASH_DIRECTORIES, lambda _: 1
+    )
+    monkeypatch.setattr(compiled, "_hashes", hashes)
+    monkeypatch.setattr(compiled, "_stored", stored)
+    # same size and modification time, so it isn't read again
+    size = (tmp_path / "bg.png").stat().st_size
+    (tmp_path / "bg.png").write_bytes(b"x" * size)
+    os.utime(tmp_path / "bg.png", ns=(0, 10**18))
+    assert theme_digest(theme, cache) == before
+    os.utime(tmp_path / "bg.png", ns=(0, 10**18 + 1))
+    assert theme_digest(theme, cache) != before
+    assert theme_digest(theme) == theme_digest(theme, cache)
+
+
+def test_invalid_theme(tmp_path: pathlib.Path):
+    theme = write_theme(tmp_path)
+    document = json.loads(pathlib.Path(theme).read_text())
+    document["features"][0]["justify"] = "sideways"
+    pathlib.Path(theme).write_text(json.dumps(document))
+    with pytest.raises(ValidationError):
+        load_theme_document(theme, str(tmp_path / "cache"))
+    assert not list((tmp_path / "cache").glob("*" + EXTENSION))
@@ -0,0 +1,47 @@
+import json
+import pathlib
+import typing
+
+from benchmarks.corpus import CorpusSpec, generate, validate
+from written_book.asset_resource import Feature2D
+from written_book.layout import Layout, parse
+from written_book.theme import Theme
+from written_book.types import JSON
+
+SPEC = CorpusSpec(seed=3, atlas_size=64, override_grid=(8, 8), documents=12, blocks=10)
+
+
+def test_corpus(tmp_path: pathlib.Path):
+    corpus = generate(str(tmp_path), SPEC)
+    document = validate(str(tmp_path / corpus.theme))
+    assert len(typing.cast(typing.List[JSON], document["features"])) == 25
+    # 8x8 tiles a page, so the atlas has to go on to a second one
+    assert (tmp_path / "theme" / "atlas1.png").is_file()
+    config = json.loads((tmp_path / "beet.json").read_text())
+    assert config["meta"]["written_book"]["theme"] == corpus.theme
+
+    theme = Theme(str(tmp_path / corpus.theme))
+    background = theme.get("background", Feature2D)
+    assert background is not None
+    # half of the grid, whether inside the feature or in the overrides section
+    assert len(background.resources()) - 1 == 32
+
+    assert len(corpus.documents) == 12
+    layout = Layout(theme, (146, 180))
+    for name in corpus.documents:
+        assert layout.paginate(parse((tmp_path / name).read_text("utf-8")))
+
+
+def test_corpus_is_seeded(tmp_path: pathlib.Path):
+    generate(str(tmp_path / "a"), SPEC)
+    generate(str(tmp_path / "b"), SPEC)
+    generate(str(tmp_path / "c"), SPEC._replace(seed=4))
+    files = sorted(p.relative_to(tmp_path / "a") for p in (tmp_path / "a").rglob("*"))
+    for path in files:
+        if path.suffix in (".md", ".json", ".png"):
+            assert (tmp_path / "a" / path).read_bytes() == (
+                tmp_path / "b" / path
+            ).read_bytes()
+    assert (tmp_path / "a" / "theme" / "theme.json").read_bytes() != (
+        tmp_path / "c" / "theme" / "theme.json"
+    ).read_bytes()
@@ -0,0 +1,98 @@
+import io
+import random
+
+import pytest
+from PIL import Image
+
+from written_book.encode import (
+    COMPRESSION_PROFILES,
+    MAX_PALETTE_COLORS,
+    CompressionProfile,
+    Encoder,
+    exact_palette,
+    png_bytes,
+)
+
+
+def few_colors() -> Image.Image:
+    image = Image.new("RGBA", (40, 30), (10, 20, 30, 255))
+    image.paste((255, 0, 0, 128), (2, 2, 10, 10))
+    # invisible, but still a different color
+    image.paste((0, 255, 0, 0), (12, 2, 20, 10))
+    image.paste((0, 0, 0, 0), (22, 2, 30, 10))
+    return image
+
+
+def many_colors() -> Image.Image:
+    rng = random.Random(0)
+    return Image.frombytes("RGBA", (40, 30), rng.randbytes(40 * 30 * 4))
+
+
+def decode(png: bytes) -> Image.Image:
+    return Image.open(io.BytesIO(png))
+
+
+def test_exact_palette():
+    image = few_colors()
+    paletted = exact_palette(image)
+    assert paletted is not None and paletted.mode == "P"
+    assert paletted.convert("RGBA").tobytes() == image.tobytes()
+    # the opaque color doesn't need an alpha
+    assert len(paletted.info["transparency"]) == 3
+
+    opaque = image.convert("RGB")
+    paletted = exact_palette(opaque)
+    assert paletted is not None and "transparency" not in paletted.info
+    assert paletted.convert("RGB").tobytes() == opaque.tobytes()
+
+    assert exact_palette(many_colors()) is None
+    assert exact_palette(image.convert("L")) is None
+
+
+def test_palette_limit():
+    image = Image.new("RGBA", (MAX_PALETTE_COLORS + 1, 1))
+    for x in range(MAX_PALETTE_COLORS):
+        image.putpixel((x, 0), (x, 0, 0, 255))
+    # the extra pixel is another color only with alpha
+    image.putpixel((MAX_PALETTE_COLORS, 0), (0, 0, 0, 254))
+    assert exact_palette(image) is None
+    assert exact_palette(image.crop((1, 0, MAX_PALETTE_COLORS + 1, 1))) is not None
+
+
+@pytest.mark.parametrize("name", list(COMPRESSION_PROFILES))
+def test_lossless(name: str):
+    profile = COMPRESSION_PROFILES[name]
+    for image in (few_colors(), many_colors()):
+        png = png_bytes(image, profile)
+        assert decode(png).convert("RGBA").tobytes() == image.tobytes()
+    assert decode(png_bytes(few_colors(), profile)).mode == "P"
+    assert decode(png_bytes(many_colors(), profile)).mode == "RGBA"
+    full_color = png_bytes(few_colors(), profile._replace(palette=False))
+    assert decode(full_color).mode == "RGBA"
+    assert len(png_bytes(few_colors(), profile)) < len(full_color)
+
+
+def test_profiles():
+    image = few_colors().resize((400, 300))
+    image.paste(many_colors(), (100, 100))
+    speed, size = (
+        len(png_bytes(image, COMPRESSION_PROFILES[name])) for name in ("speed", "size")
+    )
+    assert size < speed
+
+
+@pytest.mark.parametrize("threads", [0, 2])
+def test_encoder(threads: int):
+    images = [few_colors(), many_colors()]
+    profile = CompressionProfile(level=1)
+    with Encoder(profile, threads) as encoder:
+        futures = [encoder.submit(image) for image in images]
+        # the encoder doesn't need them any more
+        for image in images:
+            image.close()
+        encoded = [future.result() for future in futures]
+    assert encoded == [
+        png_bytes(image, profile) for image in (few_colors(), many_colors())
+    ]
+    with pytest.raises(ValueError):
+        Encoder(threads=-1)
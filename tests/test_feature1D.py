@@ -3,7 +3,15 @@ import random
 import pytest
 from PIL import Image
 
-from written_book.asset_resource import AssetResource, Direction, Feature1D, Justify1D
+from written_book.asset_resource import (
+    AssetResource,
+    Direction,
+    Feature1D,
+    Feature1DOverride,
+    Justify1D,
+    next_multiple,
+    odd,
+)
 
 all_anchors = {
     "start": Justify1D.START,
@@ -35,6 +43,14 @@ i13 = {
     Direction.VERTICAL: i13v,
 }
 
+# the same flat image both ways, so one side is always longer than the tile step
+i5x2 = Image.new("RGBA", (5, 2), (255, 0, 0, 255))
+i5x2.putpixel((4, 1), (0, 0, 0, 128))
+flat = {
+    Direction.HORIZONTAL: i5x2,
+    Direction.VERTICAL: i5x2,
+}
+
 
 @pytest.mark.parametrize("anchor,expected", all_anchors.items())
 def test_anchor_parsing(anchor: str, expected: Justify1D):
@@ -69,3 +85,96 @@ def test_rendering(
     else:
         assert image.width == pool[direction].width
         assert image.height == size
+
+
+def reference_tile(feature: Feature1D, length: int) -> Image.Image:
+    """
+    The original paste-per-tile implementation, kept to check the fast path against.
+    """
+    img = feature._asset.get()  # type: ignore
+    if feature.direction == Direction.VERTICAL:
+        img = img.transpose(Image.Transpose.ROTATE_90)
+    tiled = Image.new("RGBA", (odd(next_multiple(length, img.width)), img.height))
+    tile_count = tiled.width // img.width
+    center_pos = 0
+    if feature.justify == Justify1D.CENTER:
+        center_pos = tile_count // 2
+    elif feature.justify == Justify1D.END:
+        center_pos = tile_count - 1
+    for x in range(tile_count):
+        vx = x - center_pos
+        if vx in feature.overrides:
+            tiled.paste(feature.overrides[vx].asset.get(), (x * img.width, 0))
+        else:
+            tiled.paste(img, (x * img.width, 0))
+    crop_from = 0
+    if feature.justify == Justify1D.CENTER:
+        crop_from = (tiled.width - length) // 2
+    elif feature.justify == Justify1D.END:
+        crop_from = tiled.width - length
+    tiled = tiled.crop((crop_from, 0, crop_from + length, img.height))
+    if feature.direction == Direction.VERTICAL:
+        tiled = tiled.transpose(Image.Transpose.ROTATE_270)
+    return tiled
+
+
+patch_image = Image.new("RGBA", (3, 5), (0, 255, 0, 255))
+patch_image.putpixel((0, 0), (0, 0, 255, 255))
+patch_asset = AssetResource.from_image(patch_image)
+wide_image = Image.new("RGBA", (40, 40), (0, 0, 255, 255))
+wide_image.putpixel((39, 0), (255, 255, 0, 255))
+wide_asset = AssetResource.from_image(wide_image)
+flat_image = Image.new("RGBA", (5, 2), (255, 0, 255, 255))
+flat_image.putpixel((4, 0), (0, 255, 255, 255))
+flat_asset = AssetResource.from_image(flat_image)
+tall_image = Image.new("RGBA", (2, 7), (255, 255, 0, 255))
+tall_image.putpixel((1, 6), (0, 0, 255, 128))
+tall_asset = AssetResource.from_image(tall_image)
+override_sets = {
+    "none": [],
+    "sparse": [Feature1DOverride(patch_asset, x) for x in (-2, 0, 1, 50)],
+    "oversized": [Feature1DOverride(wide_asset, x) for x in range(-30, 30, 3)],
+    "last": [Feature1DOverride(flat_asset, -1)],
+    # a big override showing through the tiles after it, past plain ones
+    "through": [
+        Feature1DOverride(wide_asset, -2),
+        Feature1DOverride(patch_asset, 1),
+        Feature1DOverride(tall_asset, 3),
+    ],
+    # runs of overrides of different shapes, spilling into each other
+    "runs": [
+        Feature1DOverride(asset, x)
+        for asset, x in [
+            (flat_asset, -3),
+            (tall_asset, -2),
+            (patch_asset, -1),
+            (flat_asset, 1),
+            (flat_asset, 2),
+            (tall_asset, 4),
+            (flat_asset, 5),
+        ]
+    ],
+}
+
+
+@pytest.mark.parametrize("anchor", all_anchors.keys())
+@pytest.mark.parametrize("direction", [Direction.HORIZONTAL, Direction.VERTICAL])
+@pytest.mark.parametrize("pool", [i16, i13, flat])
+@pytest.mark.parametrize("overrides", override_sets.keys())
+@pytest.mark.parametrize("size", [20, 19, 1, 101, 22])
+def test_tile_matches_reference(
+    anchor: str,
+    direction: Direction,
+    pool: dict[Direction, Image.Image],
+    overrides: str,
+    size: int,
+):
+    feature = Feature1D(
+        AssetResource.from_image(pool[direction]),
+        anchor,
+        direction,
+        override_sets[overrides],
+    )
+    assert feature.tile(size).tobytes() == reference_tile(feature, size).tobytes()
+    # again, now that the rotated overrides are cached
+    assert feature.tile(size).tobytes() == reference_tile(feature, size).tobytes()
@@ -8,7 +8,10 @@ from written_book.asset_resource import (
     Feature2D,
     Feature2DOverride,
     Justify2D,
+    next_multiple,
+    odd,
 )
+from written_book.exceptions import ValidationError
 
 verbose = {
     "top left": (Justify2D.X.LEFT, Justify2D.Y.TOP),
@@ -60,6 +63,21 @@ def test_anchor_parsing(anchor: str, expected: typing.Tuple[Justify2D.X, Justify
     assert Feature2D.get_justify(anchor) == expected
 
 
+@pytest.mark.parametrize("anchor,expected", all_anchors.items())
+def test_other_spellings(anchor: str, expected: typing.Tuple[Justify2D.X, Justify2D.Y]):
+    assert Feature2D.get_justify(anchor.upper()) == expected
+    assert Feature2D.get_justify(anchor.replace(" ", "-")) == expected
+    assert Feature2D.get_justify(f"  {anchor}  ") == expected
+
+
+@pytest.mark.parametrize(
+    "code", ["", "middle", "left top", "top left right", "top_left", "top sideways"]
+)
+def test_invalid_justify(code: str):
+    with pytest.raises(ValidationError):
+        Feature2D.get_justify(code)
+
+
 @pytest.mark.parametrize("anchor,expected", all_anchors.items())
 def test_initializer(anchor: str, expected: typing.Tuple[Justify2D.X, Justify2D.Y]):
     assert Feature2D(dummy_image_16, anchor).justify == expected
@@ -84,3 +102,67 @@ def test_even_tile_size(
     f = Feature2D(image, anchor)
     t = f.tile(*size)
     assert t.size == size
+
+
+def reference_tile(feature: Feature2D, width: int, height: int) -> Image.Image:
+    """
+    The original paste-per-tile implementation, kept to check the fast path against.
+    """
+    img = feature._asset.get()  # type: ignore
+    tiled = Image.new(
+        "RGBA",
+        (
+            odd(next_multiple(width, img.width)),
+            odd(next_multiple(height, img.height)),
+        ),
+    )
+    tile_count = tiled.width // img.width, tiled.height // img.height
+    center_pos = [0, 0]
+    if feature.justifyX == Justify2D.X.CENTER:
+        center_pos[0] = tile_count[0] // 2
+    elif feature.justifyX == Justify2D.X.RIGHT:
+        center_pos[0] = tile_count[0] - 1
+    if feature.justifyY == Justify2D.Y.CENTER:
+        center_pos[1] = tile_count[1] // 2
+    elif feature.justifyY == Justify2D.Y.BOTTOM:
+        center_pos[1] = tile_count[1] - 1
+    overrides = feature.overrides
+    for x in range(tile_count[0]):
+        for y in range(tile_count[1]):
+            vx, vy = x - center_pos[0], y - center_pos[1]
+            if (vx, vy) in overrides:
+                tiled.paste(
+                    overrides[(vx, vy)].asset.get(), (x * img.width, y * img.height)
+                )
+            else:
+                tiled.paste(img, (x * img.width, y * img.height))
+    crop_from = [0, 0]
+    if feature.justifyX == Justify2D.X.CENTER:
+        crop_from[0] = (tiled.width - width) // 2
+    elif feature.justifyX == Justify2D.X.RIGHT:
+        crop_from[0] = tiled.width - width
+    if feature.justifyY == Justify2D.Y.CENTER:
+        crop_from[1] = (tiled.height - height) // 2
+    elif feature.justifyY == Justify2D.Y.BOTTOM:
+        crop_from[1] = tiled.height - height
+    return tiled.crop(
+        (crop_from[0], crop_from[1], crop_from[0] + width, crop_from[1] + height)
+    )
+
+
+override_grid_16 = [
+    Feature2DOverride(dummy_image_16_2, x, y)
+    for x, y in [(0, 0), (1, 0), (-1, 2), (3, -3), (40, 40)]
+]
+
+
+@pytest.mark.parametrize("anchor", all_anchors.keys())
+@pytest.mark.parametrize("overrides", [[], override_grid_16])
+@pytest.mark.parametrize("size", [(20, 20), (19, 19), (97, 64), (64, 97), (1, 1)])
+def test_tile_matches_reference(
+    anchor: str,
+    overrides: typing.List[Feature2DOverride],
+    size: typing.Tuple[int, int],
+):
+    f = Feature2D(dummy_image_16, anchor, overrides)
+    assert f.tile(*size).tobytes() == reference_tile(f, *size).tobytes()
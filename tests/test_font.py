@@ -0,0 +1,113 @@
+import json
+import os
+import pathlib
+import typing
+
+from PIL import Image, ImageDraw
+
+from written_book.font import Fonts, FontStyle, GlyphAtlas, fonts_digest
+from written_book.render import Page, PageRenderer, TextCommand
+from written_book.theme import Theme
+
+RED = (255, 0, 0, 255)
+WHITE = (255, 255, 255, 255)
+
+
+def test_glyphs_are_rasterized_once():
+    fonts = Fonts({"body": FontStyle(10), "quote": FontStyle(10, color=RED)})
+    fonts.render("hello", "body")
+    assert fonts.rasterized == 4
+    fonts.render("hello hello", "body")
+    # same font and size, only the color is different
+    fonts.render("hello", "quote")
+    assert fonts.rasterized == 5
+    assert len(fonts.atlas) == 5
+
+
+def test_metrics():
+    fonts = Fonts()
+    assert fonts.width("", "body") == 0
+    assert fonts.width("abc", "body") == round(sum(fonts.advances("abc", "body")))
+    assert fonts.width("abc", "h1") > fonts.width("abc", "body")
+    assert fonts.line_height("h1") > fonts.line_height("body")
+    # unknown styles look like body text
+    assert fonts.width("abc", "nothing") == fonts.width("abc", "body")
+
+
+def test_render_matches_pillow():
+    fonts = Fonts()
+    for text in ["Hello, world!", "The quick brown fox jumps"]:
+        line = fonts.render(text, "body")
+        assert line is not None
+        expected = Image.new("L", line.size)
+        ImageDraw.Draw(expected).text((0, 0), text, 255, fonts.font("body"))
+        assert line.getchannel("A").getbbox() == expected.getbbox()
+        assert line.getchannel("R").getextrema() == (0, 0)
+    assert fonts.render("   ", "body") is None
+    assert fonts.render("", "body") is None
+
+
+def test_atlas_pages():
+    atlas = GlyphAtlas(page_size=16)
+    for i in range(20):
+        atlas.add("font", chr(65 + i), Image.new("L", (5, 7), 10 * i + 5), (0, 0), 6)
+    assert len(atlas.pages) > 1
+    for i in range(20):
+        mask = atlas.mask("font", chr(65 + i))
+        assert mask is not None and mask.getextrema() == (10 * i + 5, 10 * i + 5)
+    atlas.add("font", " ", None, (0, 0), 2)
+    assert atlas.mask("font", " ") is None
+
+
+def test_warm_start(tmp_path: pathlib.Path):
+    fonts = Fonts.load({"body": FontStyle(12)}, str(tmp_path))
+    cold = fonts.render("Warm builds", "body")
+    fonts.save(str(tmp_path))
+    assert [p.name for p in tmp_path.iterdir()] == [
+        pathlib.Path(Fonts.atlas_path(fonts.styles, str(tmp_path))).name
+    ]
+
+    warm_fonts = Fonts.load({"body": FontStyle(12)}, str(tmp_path))
+    warm = warm_fonts.render("Warm builds", "body")
+    assert warm_fonts.rasterized == 0
+    assert cold is not None and warm is not None
+    assert warm.tobytes() == cold.tobytes()
+
+    # different styles get a new atlas, replacing the old one
+    other = Fonts.load({"body": FontStyle(14)}, str(tmp_path))
+    other.render("a", "body")
+    other.save(str(tmp_path))
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_fonts_digest_uses_stamps(tmp_path: pathlib.Path):
+    font = tmp_path / "font.ttf"
+    font.write_bytes(b"a" * 16)
+    os.utime(font, ns=(0, 10**18))
+    styles = {"body": FontStyle(10, str(font))}
+    before = fonts_digest(styles)
+    assert fonts_digest({"body": FontStyle(11, str(font))}) != before
+    # same size and modification time, so it isn't read
+    font.write_bytes(b"b" * 16)
+    os.utime(font, ns=(0, 10**18))
+    assert fonts_digest(styles) == before
+    os.utime(font, ns=(0, 10**18 + 1))
+    assert fonts_digest(styles) != before
+
+
+def test_page_renderer_draws_text(tmp_path: pathlib.Path):
+    Image.new("RGBA", (4, 4), WHITE).save(tmp_path / "white.png")
+    (tmp_path / "theme.json").write_text(
+        json.dumps({"features": [{"feature": "background", "source": "white.png"}]})
+    )
+    fonts = Fonts({"body": FontStyle(10, color=RED)})
+    renderer = PageRenderer(Theme(str(tmp_path / "theme.json")), fonts=fonts)
+    image = renderer.render(Page(0, (60, 20), [TextCommand((5, 5), "Text")]))
+    box = image.convert("RGB").point(lambda v: 255 - v).getbbox()
+    assert box is not None
+    left, top, right, _ = box
+    assert left >= 5 and top >= 5 and right <= 5 + fonts.width("Text", "body") + 1
+    # red text on white
+    assert image.getchannel("R").getextrema() == (255, 255)
+    low, _ = typing.cast(typing.Tuple[int, int], image.getchannel("G").getextrema())
+    assert low < 128
@@ -0,0 +1,145 @@
+import json
+import pathlib
+import typing
+
+import pytest
+from PIL import Image
+
+from written_book.asset_resource import (
+    AssetResource,
+    Direction,
+    Feature,
+    Feature1D,
+    Feature2D,
+)
+from written_book.frame import BLOCK_QUOTE, CODE, Bar, Frame
+from written_book.theme import Theme
+
+RED = (255, 0, 0, 255)
+GREEN = (0, 255, 0, 255)
+BLUE = (0, 0, 255, 255)
+WHITE = (255, 255, 255, 255)
+GREY = (128, 128, 128, 128)
+CLEAR = (0, 0, 0, 0)
+
+
+def solid(
+    size: typing.Tuple[int, int], color: typing.Tuple[int, int, int, int]
+) -> AssetResource:
+    return AssetResource.from_image(Image.new("RGBA", size, color))
+
+
+def make_frame() -> Frame:
+    corner = Feature(solid((3, 2), RED))
+    return Frame(
+        corner,
+        corner,
+        corner,
+        corner,
+        Feature1D(solid((4, 2), GREEN), "start", Direction.HORIZONTAL),
+        Feature1D(solid((4, 1), GREEN), "start", Direction.HORIZONTAL),
+        Feature1D(solid((2, 4), BLUE), "start", Direction.VERTICAL),
+        Feature1D(solid((3, 4), BLUE), "start", Direction.VERTICAL),
+        Feature2D(solid((5, 5), GREY), "top left"),
+    )
+
+
+def reference_frame(width: int, height: int) -> Image.Image:
+    """
+    Paint the frame one pixel at a time.
+    """
+    image = Image.new("RGBA", (width, height))
+    for x in range(width):
+        for y in range(height):
+            left, right = x < 3, x >= width - 3
+            top, bottom = y < 2, y >= height - 2
+            if (left or right) and (top or bottom):
+                color = RED
+            elif 3 <= x < width - 3 and (y < 2 or y >= height - 1):
+                color = GREEN
+            elif 2 <= y < height - 2 and (x < 2 or x >= width - 3):
+                color = BLUE
+            elif 3 <= x < width - 3 and 2 <= y < height - 2:
+                color = GREY
+            else:
+                color = CLEAR
+            image.putpixel((x, y), color)
+    return image
+
+
+def test_border():
+    frame = make_frame()
+    assert frame.border == (3, 2, 3, 2)
+    assert frame.inside(20, 10) == (3, 2, 17, 8)
+    assert frame.inside(4, 3) == (3, 2, 3, 2)
+
+
+@pytest.mark.parametrize("size", [(20, 10), (7, 5), (6, 4), (33, 17)])
+def test_render(size: typing.Tuple[int, int]):
+    frame = make_frame()
+    rendered = frame.render(*size)
+    assert rendered.tobytes() == reference_frame(*size).tobytes()
+    # the edges and fill come out of the feature caches the second time
+    assert frame.render(*size).tobytes() == rendered.tobytes()
+    assert frame.fill is not None
+    assert frame.fill.tile_cache.hits == frame.fill.tile_cache.misses
+
+
+def test_draw():
+    frame = make_frame()
+    page = Image.new("RGBA", (30, 20), WHITE)
+    expected = page.copy()
+    expected.alpha_composite(frame.render(12, 9), (5, 4))
+    frame.draw(page, (5, 4, 17, 13))
+    assert page.tobytes() == expected.tobytes()
+    # clipped at the edges of the image
+    page = Image.new("RGBA", (10, 10), WHITE)
+    frame.draw(page, (4, 4, 16, 13))
+    assert page.getpixel((9, 9)) == (191, 191, 191, 255)
+
+
+def test_missing_parts():
+    frame = Frame(fill=Feature2D(solid((2, 2), GREY)))
+    assert frame.border == (0, 0, 0, 0)
+    assert frame.render(5, 3).getcolors() == [(15, GREY)]
+
+
+def test_bar():
+    bar = Bar(
+        Feature(solid((2, 4), RED)),
+        Feature1D(solid((4, 2), GREEN), "start", Direction.HORIZONTAL),
+        Feature(solid((1, 4), BLUE)),
+    )
+    assert bar.thickness == 4
+    rendered = bar.render(10)
+    assert rendered.size == (10, 4)
+    assert [rendered.getpixel((x, 0)) for x in (0, 1, 2, 8, 9)] == [
+        RED,
+        RED,
+        CLEAR,
+        CLEAR,
+        BLUE,
+    ]
+    # the middle is centered across the bar
+    assert [rendered.getpixel((5, y)) for y in range(4)] == [CLEAR, GREEN, GREEN, CLEAR]
+
+
+def test_from_theme(tmp_path: pathlib.Path):
+    Image.new("RGBA", (4, 4), RED).save(tmp_path / "red.png")
+    theme = {
+        "features": [
+            {"feature": "code_background", "source": "red.png"},
+            {"feature": "code_top_left_corner", "source": "red.png"},
+            {"feature": "code_left_edge", "source": "red.png"},
+            {"feature": "block_quote", "source": "red.png", "crop": [0, 0, 2, 4]},
+        ]
+    }
+    (tmp_path / "theme.json").write_text(json.dumps(theme))
+    loaded = Theme(str(tmp_path / "theme.json"))
+    frame = Frame.from_theme(loaded, CODE)
+    assert frame.border == (4, 4, 0, 0)
+    # no top edge: the strip right of the corner stays clear
+    assert sorted(frame.render(9, 9).getcolors() or []) == [(20, CLEAR), (61, RED)]
+    bar = Bar.from_theme(loaded, BLOCK_QUOTE)
+    assert bar.direction == Direction.VERTICAL
+    assert bar.render(10).size == (2, 10)
@@ -0,0 +1,102 @@
+import json
+import pathlib
+import threading
+import time
+
+import pytest
+
+from written_book import instrument
+from written_book.cache import LRUCache
+from written_book.instrument import count, disable, enable, span, traced
+
+
+@pytest.fixture(autouse=True)
+def disabled():
+    disable()
+    yield
+    disable()
+
+
+@traced("work")
+def work(seconds: float) -> str:
+    time.sleep(seconds)
+    return "done"
+
+
+def test_disabled():
+    assert instrument.recorder() is None
+    assert span("a") is span("b")
+    count("a")
+    assert work(0) == "done"
+    assert instrument.recorder() is None
+
+
+def test_spans():
+    recorder = enable()
+    with span("outer"):
+        time.sleep(0.01)
+        assert work(0.02) == "done"
+        assert work(0) == "done"
+    assert disable() is recorder
+    with span("outer"):
+        pass
+    outer, inner = recorder.spans["outer"], recorder.spans["work"]
+    assert outer.calls == 1 and inner.calls == 2
+    assert outer.total >= inner.total >= 0.02
+    # time in nested spans only counts once
+    assert outer.own == pytest.approx(outer.total - inner.total)
+    assert not recorder.events
+
+
+def test_threads():
+    recorder = enable(trace=True)
+
+    def run():
+        with span("thread"):
+            work(0.01)
+
+    with span("main"):
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    disable()
+    assert recorder.spans["thread"].calls == 4
+    # spans in other threads don't nest in the main one
+    assert recorder.spans["main"].own == recorder.spans["main"].total
+    assert len({thread for *_, thread in recorder.events}) == 5
+
+
+def test_counters_and_caches():
+    cache: LRUCache[str, bytes] = LRUCache(100, len)
+    cache.put("a", b"a")
+    cache.get("a")
+    recorder = enable()
+    recorder.watch("bytes", cache)
+    cache.get("a")
+    cache.get("a")
+    cache.get("b")
+    count("things")
+    count("things", 2)
+    assert recorder.counters == {"things": 3}
+    assert recorder.caches() == {"bytes": (2, 1)}
+    summary = recorder.summary()
+    assert "things" in summary and "66.7%" in summary
+
+
+def test_chrome_trace(tmp_path: pathlib.Path):
+    recorder = enable(trace=True)
+    with span("outer"):
+        work(0)
+    recorder.write_trace(str(tmp_path / "trace.json"))
+    trace = json.loads((tmp_path / "trace.json").read_text())
+    # inner spans finish first
+    assert [event["name"] for event in trace["traceEvents"]] == ["work", "outer"]
+    work_event, outer_event = trace["traceEvents"]
+    assert work_event["ph"] == "X"
+    assert outer_event["ts"] <= work_event["ts"]
+    assert (
+        work_event["ts"] + work_event["dur"]
+        <= outer_event["ts"] + outer_event["dur"] + 1
+    )
@@ -0,0 +1,188 @@
+import json
+import pathlib
+import typing
+
+import pytest
+from PIL import Image
+
+from written_book.frame import BLOCK_QUOTE, CODE, HORIZONTAL_RULE
+from written_book.layout import (
+    Code,
+    Items,
+    Layout,
+    ParseCache,
+    Quote,
+    Rule,
+    Text,
+    parse,
+)
+from written_book.render import (
+    BarCommand,
+    FeatureCommand,
+    FrameCommand,
+    Page,
+    TextCommand,
+)
+from written_book.theme import Theme
+
+GREY = (128, 128, 128, 255)
+PAGE = (100, 80)
+
+
+@pytest.fixture
+def theme(tmp_path: pathlib.Path) -> Theme:
+    Image.new("RGBA", (4, 4), GREY).save(tmp_path / "grey.png")
+    theme = {
+        "features": [
+            {"feature": "background", "source": "grey.png"},
+            {"feature": "left_edge", "source": "grey.png"},
+            {"feature": "code_background", "source": "grey.png"},
+            {"feature": "code_top_edge", "source": "grey.png", "crop": [0, 0, 4, 2]},
+            {"feature": "code_left_edge", "source": "grey.png", "crop": [0, 0, 2, 4]},
+            {"feature": "bullet", "source": "grey.png", "crop": [0, 0, 2, 2]},
+            {"feature": "block_quote", "source": "grey.png", "crop": [0, 0, 2, 4]},
+            {"feature": "horizontal_rule", "source": "grey.png", "crop": [0, 0, 4, 1]},
+        ]
+    }
+    (tmp_path / "theme.json").write_text(json.dumps(theme))
+    return Theme(str(tmp_path / "theme.json"))
+
+
+def test_parse():
+    assert parse(
+        "# Title\n\nSome *text*\nhere.\n\n> quote\n> > nested\n\n---\n\n"
+        "```py\ncode\n  indented\n```\n\n| a | b |\n|---|---|\n| 1 | 2 |\n"
+    ) == (
+        Text("h1", "Title"),
+        Text("body", "Some text here."),
+        Quote((Text("body", "quote"), Quote((Text("body", "nested"),)))),
+        Rule(),
+        Code("code\n  indented"),
+        Text("body", "a | b"),
+        Text("body", "1 | 2"),
+    )
+
+
+def test_parse_lists():
+    assert parse("- a\n- b\n  - c\n\n3. three\n\n   more\n") == (
+        Items(
+            None,
+            (
+                (Text("body", "a"),),
+                (Text("body", "b"), Items(None, ((Text("body", "c"),),))),
+            ),
+        ),
+        Items(3, ((Text("body", "three"), Text("body", "more")),)),
+    )
+
+
+def test_parse_cache(tmp_path: pathlib.Path):
+    trees = ParseCache(str(tmp_path))
+    tree = trees.get("# Hi\n")
+    assert trees.get("# Hi\n") is tree
+    assert trees.parsed == 1
+
+    # a new cache, like in the next build, reads the tree back
+    trees = ParseCache(str(tmp_path))
+    assert trees.get("# Hi\n") == tree
+    assert trees.get("# Bye\n", "bye") == (Text("h1", "Bye"),)
+    assert trees.parsed == 1
+    trees.prune(["bye"])
+    assert [p.name for p in tmp_path.iterdir()] == ["bye.1.tree"]
+
+
+def test_parse_cache_format(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch):
+    ParseCache(str(tmp_path)).get("# Hi\n", "hi")
+    # trees pickled in another format are never loaded
+    monkeypatch.setattr(ParseCache, "FORMAT", 2)
+    trees = ParseCache(str(tmp_path))
+    assert trees.get("# Hi\n", "hi") == (Text("h1", "Hi"),)
+    assert trees.parsed == 1
+    trees.prune(["hi"])
+    assert [p.name for p in tmp_path.iterdir()] == ["hi.2.tree"]
+
+
+@pytest.mark.parametrize(
+    "pickled",
+    [
+        b"cwritten_book.layout\nGone\n.",
+        b"cwritten_book.no_such_module\nText\n.",
+        b"\x80\x04",
+    ],
+)
+def test_parse_cache_bad_tree(tmp_path: pathlib.Path, pickled: bytes):
+    # trees of classes that are gone, or damaged ones, are parsed again
+    (tmp_path / f"hi.{ParseCache.FORMAT}{ParseCache.EXTENSION}").write_bytes(pickled)
+    trees = ParseCache(str(tmp_path))
+    assert trees.get("# Hi\n", "hi") == (Text("h1", "Hi"),)
+    assert trees.parsed == 1
+
+
+def test_empty_document(theme: Theme):
+    assert len(Layout(theme, PAGE).paginate(())) == 1
+
+
+def test_commands(theme: Theme):
+    layout = Layout(theme, PAGE)
+    # inside the page frame border and padding
+    assert layout.content == (8, 4, 96, 76)
+    (page,) = layout.paginate(parse("> quote\n\n- item\n\n---\n\n```\ncode\n```"))
+    assert page.commands == [
+        FrameCommand((8, 37, 96, 53), CODE),
+        BarCommand((8, 4), 10, BLOCK_QUOTE),
+        BarCommand((8, 32), 88, HORIZONTAL_RULE),
+        FeatureCommand((12, 22), "bullet"),
+        TextCommand((14, 4), "quote"),
+        TextCommand((18, 18), "item"),
+        TextCommand((12, 41), "code", "code"),
+    ]
+
+
+def test_pages_stay_inside(theme: Theme):
+    layout = Layout(theme, PAGE)
+    blocks = parse(
+        "\n\n".join(
+            [
+                " ".join(f"word{i}" for i in range(100)),
+                "> " + " ".join(f"quoted{i}" for i in range(40)),
+                "```\n" + "\n".join(f"line {i}" for i in range(30)) + "\n```",
+                "- " + "\n- ".join(f"item {i}" for i in range(20)),
+            ]
+        )
+    )
+    pages = layout.paginate(blocks)
+    assert [page.number for page in pages] == list(range(len(pages)))
+    left, top, _, bottom = layout.content
+    text: typing.List[str] = []
+    frames = 0
+    for page in pages:
+        for command in page.commands:
+            if isinstance(command, TextCommand):
+                x, y = command.position
+                assert left <= x and top <= y and y + 10 <= bottom
+                text.append(command.text)
+            elif isinstance(command, FrameCommand):
+                frames += 1
+                assert top <= command.box[1] and command.box[3] <= bottom
+    assert text[:2] == ["word0 word1", "word2 word3"]
+    assert [t for t in text if t.startswith("line")] == [f"line {i}" for i in range(30)]
+    # the code block was split over pages, with a frame on each
+    assert frames > 1
+
+
+def test_optimal_breaking(theme: Theme):
+    text = "aaa bbbbbbbb c ddddd ee fffffff"
+    greedy = Layout(theme, PAGE).paginate(parse(text))
+    optimal = Layout(theme, PAGE, breaking="optimal").paginate(parse(text))
+
+    def lines(pages: typing.List[Page]) -> typing.List[str]:
+        return [
+            command.text
+            for page in pages
+            for command in page.commands
+            if isinstance(command, TextCommand)
+        ]
+
+    assert " ".join(lines(optimal)) == " ".join(lines(greedy)) == text
+    assert lines(greedy) == ["aaa bbbbbbbb c", "ddddd ee", "fffffff"]
+    assert lines(optimal) == ["aaa bbbbbbbb", "c ddddd ee", "fffffff"]
@@ -0,0 +1,102 @@
+import typing
+
+import pytest
+from PIL import Image
+
+from written_book.asset_resource import Anchor2D, AssetResource, Overlay
+from written_book.overlay import OverlayLayer, placement
+from written_book.tiling import composite
+
+X = Anchor2D.X
+Y = Anchor2D.Y
+Mode = Anchor2D.AnchorMode
+
+RED = (255, 0, 0, 255)
+WHITE = (255, 255, 255, 255)
+PAGE = (20, 10)
+SIZE = (4, 6)
+
+
+def overlay(code: str, mode: str = "inside", above: bool = False) -> Overlay:
+    asset = AssetResource.from_image(Image.new("RGBA", SIZE, RED))
+    x_anchor, y_anchor = Anchor2D.parse(code)
+    return Overlay(asset, Anchor2D.mode_word[mode], (x_anchor, y_anchor), above)
+
+
+@pytest.mark.parametrize(
+    "mode,code,expected",
+    [
+        ("inside", "top left", (0, 0)),
+        ("inside", "center", (8, 2)),
+        ("inside", "bottom right", (16, 4)),
+        ("edge", "top left", (-2, -3)),
+        ("edge", "bottom center", (8, 7)),
+        ("edge", "center right", (18, 2)),
+        ("outside", "top left", (-4, -6)),
+        ("outside", "bottom right", (20, 10)),
+        ("outside", "inside-top left", (-4, 0)),
+        ("outside", "bottom inside-right", (16, 10)),
+    ],
+)
+def test_placement(mode: str, code: str, expected: typing.Tuple[int, int]):
+    place = placement(Anchor2D.mode_word[mode], Anchor2D.parse(code))
+    assert place.position(PAGE, SIZE) == expected
+
+
+def test_every_valid_anchor_has_a_placement():
+    for x_anchor, y_anchor, mode in Anchor2D.combinations:
+        placement(mode, (x_anchor, y_anchor))
+
+
+def test_layers():
+    layer = OverlayLayer(
+        [
+            overlay("top left"),
+            overlay("bottom right", above=True),
+            overlay("center", "edge"),
+        ]
+    )
+    assert len(layer) == 3
+    assert [p for _, p in layer.positions(*PAGE)] == [(0, 0), (8, 2)]
+    assert [p for _, p in layer.positions(*PAGE, above=True)] == [(16, 4)]
+
+
+def test_bounds():
+    layer = OverlayLayer([overlay("top left", "outside"), overlay("bottom", "edge")])
+    assert layer.bounds(*PAGE) == (-4, -6, 20, 13)
+    assert OverlayLayer([]).bounds(*PAGE) == (0, 0, 20, 10)
+
+
+def test_composite_matches_full_size_layers():
+    overlays = [
+        overlay("top left", "outside"),
+        overlay("bottom right", "edge"),
+        overlay("center"),
+        overlay("inside-top right", "outside"),
+    ]
+    layer = OverlayLayer(overlays)
+    page = Image.new("RGBA", PAGE, WHITE)
+    expected = page.copy()
+    for o, (x, y) in layer.positions(*PAGE):
+        # the slow way: a whole page sized layer per overlay
+        full = Image.new("RGBA", (PAGE[0] + 8, PAGE[1] + 12))
+        full.paste(o.asset.get(), (x + 4, y + 6))
+        expected.alpha_composite(full.crop((4, 6, 4 + PAGE[0], 6 + PAGE[1])))
+    layer.composite(page)
+    assert page.tobytes() == expected.tobytes()
+
+
+def test_composite_page_box():
+    layer = OverlayLayer([overlay("top left", "outside")])
+    left, top, right, bottom = layer.bounds(*PAGE)
+    image = Image.new("RGBA", (right - left, bottom - top))
+    layer.composite(image, page=(-left, -top, -left + PAGE[0], -top + PAGE[1]))
+    assert image.getbbox() == (0, 0, 4, 6)
+
+
+def test_composite_clips():
+    image = Image.new("RGBA", (3, 3))
+    composite(image, Image.new("RGBA", (4, 4), RED), (-2, 1))
+    assert image.getbbox() == (0, 1, 2, 3)
+    composite(image, Image.new("RGBA", (4, 4), RED), (5, 5))
+    assert image.getbbox() == (0, 1, 2, 3)
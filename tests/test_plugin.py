@@ -0,0 +1,228 @@
+import json
+import pathlib
+import typing
+
+import pytest
+from beet import PluginError, run_beet
+from PIL import Image
+
+from written_book.exceptions import ValidationError
+from written_book.font import DEFAULT_STYLES, FontStyle
+from written_book.plugin import PAGES_KEY, BuildStats, Options, build
+
+GREY = (128, 128, 128, 255)
+
+
+def write_project(directory: pathlib.Path, documents: int = 3):
+    theme = directory / "theme"
+    theme.mkdir()
+    Image.new("RGBA", (4, 4), GREY).save(theme / "grey.png")
+    (theme / "theme.json").write_text(
+        json.dumps({"features": [{"feature": "background", "source": "grey.png"}]})
+    )
+    book = directory / "book"
+    book.mkdir()
+    for i in range(documents):
+        (book / f"Chapter {i}.md").write_text(f"# Chapter {i}\n")
+
+
+def run(
+    directory: pathlib.Path, **meta: typing.Any
+) -> typing.Tuple[BuildStats, typing.List[typing.Tuple[str, typing.Tuple[int, int]]]]:
+    config = {"meta": {"written_book": {"theme": "theme/theme.json", **meta}}}
+    with run_beet(config, directory=directory, cache=True) as ctx:
+        stats = build(ctx, Options.from_meta(ctx.meta["written_book"]))
+        textures = sorted(ctx.assets.textures.items())
+        return stats, [
+            (key, typing.cast(Image.Image, texture.ensure_deserialized()).size)
+            for key, texture in textures
+        ]
+
+
+def pages(directory: pathlib.Path) -> typing.List[bytes]:
+    pages = directory / ".beet_cache" / "written_book" / "pages"
+    return sorted(path.read_bytes() for path in pages.iterdir())
+
+
+def test_options():
+    assert Options.from_meta({"theme": "a.json"}) == Options("a.json")
+    options = Options.from_meta(
+        {"theme": "a.json", "namespace": "docs", "page_size": [10, 20]}
+    )
+    assert options.namespace == "docs"
+    assert options.page_size == (10, 20)
+    with pytest.raises(ValidationError):
+        Options.from_meta({"documents": "*.md"})
+    with pytest.raises(ValidationError):
+        Options.from_meta({"theme": "a.json", "page_size": [10]})
+    with pytest.raises(ValidationError):
+        Options.from_meta({"theme": "a.json", "workers": 0})
+    with pytest.raises(ValidationError):
+        Options.from_meta({"theme": "a.json", "line_breaking": "fast"})
+    options = Options.from_meta({"theme": "a.json", "line_breaking": "optimal"})
+    assert options.line_breaking == "optimal"
+    with pytest.raises(ValidationError):
+        Options.from_meta({"theme": "a.json", "compression": "tiny"})
+    options = Options.from_meta({"theme": "a.json", "compression": "size"})
+    assert options.compression == "size"
+    options = Options.from_meta(
+        {"theme": "a.json", "fonts": {"h1": {"size": 20}, "quote": {"source": "a.ttf"}}}
+    )
+    assert options.fonts["h1"] == FontStyle(20)
+    assert options.fonts["quote"] == FontStyle(10, "a.ttf")
+    assert options.fonts["body"] == DEFAULT_STYLES["body"]
+
+
+def test_build(tmp_path: pathlib.Path):
+    write_project(tmp_path)
+    (tmp_path / "book" / "Copy.md").write_text("# Chapter 0\n")
+    stats, textures = run(tmp_path, page_size=[80, 60])
+    # the copy looks the same, so it isn't rendered and shares a texture
+    assert stats._replace(saved=0) == BuildStats(4, 0, 3, 1, 1)
+    assert stats.saved > 0
+    assert textures == [
+        (f"written_book:book/chapter_{i}/0", (80, 60)) for i in range(3)
+    ]
+
+
+def test_duplicate_images(tmp_path: pathlib.Path):
+    write_project(tmp_path, 2)
+    # pages that aren't laid out the same, but look the same
+    (tmp_path / "book" / "Spaces.md").write_text("# Chapter 0 \n\n\n")
+    (tmp_path / "book" / "Empty.md").write_text("")
+    (tmp_path / "book" / "Blank.md").write_text("---\n")
+    Image.new("RGBA", (4, 4), GREY).save(tmp_path / "theme" / "grey.png")
+    config = {"meta": {"written_book": {"theme": "theme/theme.json"}}}
+    with run_beet(config, directory=tmp_path, cache=True) as ctx:
+        stats = build(ctx, Options.from_meta(ctx.meta["written_book"]))
+        index = ctx.meta[PAGES_KEY]
+        textures = sorted(ctx.assets.textures)
+    assert index["book/Spaces.md"] == index["book/Chapter 0.md"]
+    assert index["book/Empty.md"] == index["book/Blank.md"]
+    assert textures == [
+        "written_book:book/blank/0",
+        "written_book:book/chapter_0/0",
+        "written_book:book/chapter_1/0",
+    ]
+    assert stats.duplicates == 2 and stats.saved > 0
+    # one file per image
+    assert len(pages(tmp_path)) == 3
+
+
+def test_long_documents(tmp_path: pathlib.Path):
+    write_project(tmp_path, 1)
+    (tmp_path / "book" / "Chapter 0.md").write_text(
+        " ".join(f"word{i}" for i in range(200))
+    )
+    stats, textures = run(tmp_path)
+    assert stats.rendered == len(textures) > 1
+    # the glyphs are kept for the next build
+    assert list((tmp_path / ".beet_cache" / "written_book").glob("glyphs-*.png"))
+
+
+def test_workers(tmp_path: pathlib.Path):
+    parallel, serial = tmp_path / "parallel", tmp_path / "serial"
+    for directory in (parallel, serial):
+        directory.mkdir()
+        write_project(directory)
+    stats, textures = run(parallel, workers=2)
+    assert stats == BuildStats(3, 0, 3, 0)
+    assert textures == run(serial, workers=1)[1]
+    assert pages(parallel) == pages(serial)
+
+
+def test_rebuild_skips_unchanged(tmp_path: pathlib.Path):
+    write_project(tmp_path)
+    first = run(tmp_path)[1]
+    stats, textures = run(tmp_path)
+    assert stats == BuildStats(3, 3, 0, 0)
+    assert textures == first
+
+    # parsed again, but laid out the same
+    (tmp_path / "book" / "Chapter 1.md").write_text("Chapter 1\n=========\n")
+    assert run(tmp_path)[0] == BuildStats(3, 2, 0, 1)
+    (tmp_path / "book" / "Chapter 1.md").write_text("# Changed\n")
+    assert run(tmp_path)[0] == BuildStats(3, 2, 1, 0)
+
+
+def test_theme_change_renders_again(tmp_path: pathlib.Path):
+    write_project(tmp_path)
+    run(tmp_path)
+    Image.new("RGBA", (4, 4), (0, 0, 0, 255)).save(tmp_path / "theme" / "grey.png")
+    # black text on black looks the same whatever it says
+    assert run(tmp_path)[0]._replace(saved=0) == BuildStats(3, 0, 3, 0, 2)
+    assert run(tmp_path)[0]._replace(saved=0) == BuildStats(3, 3, 0, 0, 2)
+
+
+def test_page_size_change_renders_again(tmp_path: pathlib.Path):
+    write_project(tmp_path)
+    run(tmp_path)
+    stats, textures = run(tmp_path, page_size=[80, 60])
+    assert stats == BuildStats(3, 0, 3, 0)
+    assert {size for _, size in textures} == {(80, 60)}
+    assert run(tmp_path, page_size=[80, 60])[0] == BuildStats(3, 3, 0, 0)
+
+
+def test_removed_documents_are_forgotten(tmp_path: pathlib.Path):
+    write_project(tmp_path)
+    run(tmp_path)
+    for document in (tmp_path / "book").iterdir():
+        document.unlink()
+    assert run(tmp_path) == (BuildStats(0, 0, 0, 0), [])
+    assert not pages(tmp_path)
+    assert not list((tmp_path / ".beet_cache" / "written_book" / "trees").iterdir())
+
+
+def test_plugin(tmp_path: pathlib.Path, capsys: pytest.CaptureFixture[str]):
+    write_project(tmp_path, 1)
+    config = {
+        "pipeline": ["written_book"],
+        "meta": {"written_book": {"theme": "theme/theme.json"}},
+    }
+    with run_beet(config, directory=tmp_path) as ctx:
+        assert list(ctx.assets.textures) == ["written_book:book/chapter_0/0"]
+    capsys.readouterr()
+    with run_beet({"pipeline": ["written_book"]}, directory=tmp_path) as ctx:
+        assert not ctx.assets.textures
+    # said whether or not there is anything to build, like it always has
+    assert "Loading documentation configuration files..." in capsys.readouterr().out
+    with pytest.raises(PluginError):
+        with run_beet(
+            {"pipeline": ["written_book"], "meta": {"written_book": {}}},
+            directory=tmp_path,
+        ):
+            pass
+
+
+def test_profile(
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture[str],
+):
+    write_project(tmp_path, 1)
+    meta: typing.Dict[str, typing.Any] = {
+        "theme": "theme/theme.json",
+        "profile": "trace.json",
+    }
+    config = {"pipeline": ["written_book"], "meta": {"written_book": meta}}
+    with run_beet(config, directory=tmp_path):
+        pass
+    assert "beet_default" in capsys.readouterr().out
+    trace = json.loads((tmp_path / "trace.json").read_text())
+    assert "build.layout" in {event["name"] for event in trace["traceEvents"]}
+
+    # "0" in the environment leaves it to the meta, "1" turns it on anyway
+    monkeypatch.setenv("WRITTEN_BOOK_PROFILE", "0")
+    meta["profile"] = True
+    with run_beet(config, directory=tmp_path):
+        pass
+    assert "beet_default" in capsys.readouterr().out
+    meta["profile"] = False
+    monkeypatch.setenv("WRITTEN_BOOK_PROFILE", "1")
+    with run_beet(config, directory=tmp_path):
+        pass
+    assert "beet_default" in capsys.readouterr().out
+    monkeypatch.delenv("WRITTEN_BOOK_PROFILE")
+    with run_beet(config, directory=tmp_path):
+        pass
+    assert "beet_default" not in capsys.readouterr().out
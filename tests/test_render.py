@@ -0,0 +1,180 @@
+import json
+import pathlib
+import threading
+import typing
+
+import pytest
+from PIL import Image
+
+from written_book.encode import png_bytes
+from written_book.frame import BLOCK_QUOTE
+from written_book.render import (
+    BarCommand,
+    FeatureCommand,
+    FrameCommand,
+    ImageCommand,
+    Page,
+    PageRenderer,
+    RenderPool,
+    encode_unique,
+)
+from written_book.theme import Theme
+
+RED = (255, 0, 0, 255)
+GREEN = (0, 255, 0, 255)
+BLUE = (0, 0, 255, 255)
+GREY = (128, 128, 128, 255)
+
+
+def write_theme(directory: pathlib.Path) -> Theme:
+    Image.new("RGBA", (4, 4), GREY).save(directory / "grey.png")
+    Image.new("RGBA", (4, 4), RED).save(directory / "red.png")
+    Image.new("RGBA", (2, 2), GREEN).save(directory / "green.png")
+    theme = {
+        "features": [
+            {"feature": "background", "source": "grey.png"},
+            {"feature": "code_background", "source": "red.png"},
+            {"feature": "bullet", "source": "green.png"},
+            {"feature": "block_quote", "source": "red.png", "crop": [0, 0, 1, 4]},
+        ],
+        "overlays": [
+            {"source": "green.png", "anchor": "top left"},
+            {"source": "red.png", "anchor": "bottom right", "above": True},
+        ],
+    }
+    (directory / "theme.json").write_text(json.dumps(theme))
+    return Theme(str(directory / "theme.json"))
+
+
+def book(count: int) -> typing.Iterator[Page]:
+    for number in range(count):
+        yield Page(
+            number,
+            (32, 24),
+            [
+                FrameCommand((8, 8, 16, 16)),
+                FeatureCommand((20, 2)),
+                BarCommand((2, 10), 8, BLOCK_QUOTE),
+                ImageCommand((number % 30, 20), Image.new("RGBA", (2, 2), BLUE)),
+            ],
+        )
+
+
+def is_open(image: Image.Image) -> bool:
+    try:
+        image.im
+    except ValueError:
+        return False
+    return True
+
+
+def test_render(tmp_path: pathlib.Path):
+    renderer = PageRenderer(write_theme(tmp_path))
+    image = renderer.render(next(book(1)))
+    assert image.size == (32, 24)
+    assert image.getpixel((0, 0)) == GREEN  # overlay below the content
+    assert image.getpixel((5, 5)) == GREY  # background
+    assert image.getpixel((12, 12)) == RED  # code block
+    assert image.getpixel((20, 2)) == GREEN  # bullet
+    assert image.getpixel((2, 14)) == RED  # block quote bar
+    assert image.getpixel((0, 20)) == BLUE  # image
+    assert image.getpixel((31, 23)) == RED  # overlay above the content
+
+
+@pytest.mark.parametrize("prefetch", [0, 1, 3])
+def test_pages_match_render(tmp_path: pathlib.Path, prefetch: int):
+    renderer = PageRenderer(write_theme(tmp_path), prefetch)
+    expected = [renderer.render(page).tobytes() for page in book(12)]
+    seen = [(page.number, image.tobytes()) for page, image in renderer.pages(book(12))]
+    assert seen == list(enumerate(expected))
+
+
+@pytest.mark.parametrize("prefetch", [0, 2])
+def test_memory_stays_flat(tmp_path: pathlib.Path, prefetch: int):
+    made: typing.List[Image.Image] = []
+
+    class Counting(PageRenderer):
+        def render(self, page: Page) -> Image.Image:
+            image = super().render(page)
+            made.append(image)
+            return image
+
+    renderer = Counting(write_theme(tmp_path), prefetch)
+    peak = 0
+    for _ in renderer.pages(book(40)):
+        peak = max(peak, sum(1 for i in made if is_open(i)))
+    assert len(made) == 40
+    # the page in use, the pages queued ahead and the one being rendered
+    assert peak <= prefetch + 2
+    assert not any(is_open(i) for i in made)
+
+
+def test_write(tmp_path: pathlib.Path):
+    renderer = PageRenderer(write_theme(tmp_path), prefetch=2)
+
+    def save(page: Page, image: Image.Image):
+        image.save(tmp_path / f"page_{page.number}.png")
+
+    assert renderer.write(book(5), save) == 5
+    assert len(list(tmp_path.glob("page_*.png"))) == 5
+
+
+def test_stopping_early(tmp_path: pathlib.Path):
+    renderer = PageRenderer(write_theme(tmp_path), prefetch=2)
+    pages = renderer.pages(book(1000))
+    next(pages)
+    pages.close()
+    assert not any(t.name == "written_book.render" for t in threading.enumerate())
+
+
+def test_errors_are_raised(tmp_path: pathlib.Path):
+    def broken() -> typing.Iterator[Page]:
+        yield from book(2)
+        raise RuntimeError("no more pages")
+
+    renderer = PageRenderer(write_theme(tmp_path), prefetch=1)
+    with pytest.raises(RuntimeError):
+        for _ in renderer.pages(broken()):
+            pass
+    with pytest.raises(ValueError):
+        PageRenderer(renderer.theme, prefetch=-1)
+
+
+def test_pool_matches_serial(tmp_path: pathlib.Path):
+    theme = write_theme(tmp_path)
+    renderer = PageRenderer(theme)
+    expected = [png_bytes(image) for _, image in renderer.pages(book(10))]
+    cache = str(tmp_path / "cache")
+    with RenderPool(theme.config_path, cache, workers=2) as pool:
+        rendered = list(pool.render(list(book(10))))
+    assert [page.number for page, _, _ in rendered] == list(range(10))
+    assert [png for _, _, png in rendered] == expected
+
+
+@pytest.mark.parametrize("threads", [1, 3])
+def test_encode_on_threads(tmp_path: pathlib.Path, threads: int):
+    renderer = PageRenderer(write_theme(tmp_path), prefetch=1)
+    pages = list(book(6)) * 2
+    expected = list(encode_unique(renderer.pages(pages)))
+    assert list(encode_unique(renderer.pages(pages), threads=threads)) == expected
+
+
+def test_duplicates_are_encoded_once(tmp_path: pathlib.Path):
+    theme = write_theme(tmp_path)
+    # the same 4 pages, 3 times over
+    pages = [page._replace(number=i) for i, page in enumerate(list(book(4)) * 3)]
+    renderer = PageRenderer(theme)
+    serial = list(encode_unique(renderer.pages(pages)))
+    assert [png is not None for _, _, png in serial] == [True] * 4 + [False] * 8
+    assert [digest for _, digest, _ in serial] == [
+        digest for _, digest, _ in serial[:4]
+    ] * 3
+    known = {digest for _, digest, _ in serial[:2]}
+    with RenderPool(theme.config_path, str(tmp_path / "cache"), workers=3) as pool:
+        rendered = list(pool.render(pages, known))
+    assert [digest for _, digest, _ in rendered] == [d for _, d, _ in serial]
+    encoded = [(digest, png) for _, digest, png in rendered if png is not None]
+    # each new image by one of the workers
+    assert sorted(encoded) == sorted(
+        (digest, png) for _, digest, png in serial[2:4] if png is not None
+    )
@@ -0,0 +1,144 @@
+import pathlib
+import typing
+
+import pytest
+from PIL import Image
+
+from written_book.asset_resource import AssetResource, Feature2DOverride, check_feature
+from written_book.compiled import validate_theme
+from written_book.exceptions import ValidationError, ValidationErrorGroup
+from written_book.schema import THEME_SCHEMA, SchemaCompiler, theme_schema
+from written_book.types import JSON, JSONObject
+
+CODES = ValidationError.ErrorCode
+
+
+def codes(errors: typing.List[ValidationError]) -> typing.List[int]:
+    return [error.error_code for error in errors]
+
+
+def test_types():
+    validator = theme_schema.validator({"type": "integer"})
+    assert validator.errors(3, "x") == []
+    assert validator.errors(3.0, "x") == []
+    assert codes(validator.errors(True, "x")) == [CODES.WRONG_TYPE.value]
+    assert codes(validator.errors(3.5, "x")) == [CODES.WRONG_TYPE.value]
+    either = theme_schema.validator({"type": ["string", "null"]})
+    assert either.errors(None, "x") == either.errors("a", "x") == []
+    assert "should be a string or null, not int" in str(either.errors(1, "x")[0])
+
+
+def test_enum_and_const():
+    validator = theme_schema.validator({"$ref": "#/definitions/1d_justify"})
+    assert validator.errors("start", "justify") == []
+    assert codes(validator.errors("sideways", "justify")) == [CODES.INVALID_VALUE.value]
+    # unhashable values and values that only compare equal don't match
+    assert validator.errors(["start"], "justify")
+    assert theme_schema.validator({"enum": [1]}).errors(True, "x")
+    assert theme_schema.validator({"const": 0}).errors(False, "x")
+
+
+def test_collects_every_error():
+    validator = AssetResource.SCHEMA
+    body: JSON = {"crop": [-1, 0.5, 0]}
+    errors = validator.errors(body, "JSON body for AssetResource")
+    assert codes(errors) == [
+        CODES.INVALID_VALUE.value,
+        CODES.INVALID_VALUE.value,
+        CODES.WRONG_TYPE.value,
+        CODES.MISSING_VALUE.value,
+    ]
+    assert "JSON body for AssetResource crop[1] should be an integer" in str(errors[2])
+    with pytest.raises(ValidationError) as exc_info:
+        validator(body, "JSON body for AssetResource")
+    assert exc_info.value.error_code == CODES.INVALID_VALUE.value
+
+
+def test_codes_follow_the_schema():
+    # every wrong type is WRONG_TYPE and every wrong count INVALID_VALUE, where
+    # the checks these validators replaced mixed them up in places
+    asset = AssetResource.SCHEMA
+    crops: typing.List[JSON] = [["a", 0, 0, 0], [1.5, 0, 0, 0]]
+    for crop in crops:
+        errors = asset.errors({"source": "a.png", "crop": crop}, "asset")
+        assert codes(errors) == [CODES.WRONG_TYPE.value]
+        assert errors[0].message.startswith("asset crop[0] should be an integer")
+    errors = Feature2DOverride.SCHEMA.errors({"source": "a.png", "index": [0]}, "o")
+    assert codes(errors) == [CODES.INVALID_VALUE.value]
+    assert errors[0].message == "o index should have at least 2 items, got 1"
+    with pytest.raises(ValidationError) as exc_info:
+        AssetResource.import_({})
+    assert exc_info.value.message == 'JSON body for AssetResource requires a "source".'
+    assert exc_info.value.error_code == CODES.MISSING_VALUE.value
+
+
+def test_one_of():
+    validator = theme_schema.validator({"$ref": "#/definitions/feature_justify"})
+    assert validator.errors({"feature": "top_edge", "justify": "end"}, "f") == []
+    assert validator.errors({"feature": "background", "justify": "end"}, "f")
+    assert validator.errors({"feature": "nothing"}, "f")
+    ambiguous = theme_schema.validator({"oneOf": [{"type": "integer"}, {"minimum": 0}]})
+    assert "more than one" in str(ambiguous.errors(1, "x")[0])
+
+
+def test_recursive_reference():
+    compiler = SchemaCompiler(
+        {
+            "definitions": {
+                "tree": {"type": "array", "items": {"$ref": "#/definitions/tree"}}
+            }
+        }
+    )
+    validator = compiler.validator({"$ref": "#/definitions/tree"})
+    assert validator.errors([[], [[]]], "tree") == []
+    assert "tree[1][0] should be a list" in str(validator.errors([[], [1]], "tree")[0])
+
+
+def test_unsupported_keyword():
+    with pytest.raises(ValueError):
+        theme_schema.validator({"pattern": "^a"})
+
+
+def test_theme_schema_compiles():
+    theme_schema.validator(THEME_SCHEMA).errors({}, "Theme")
+
+
+def test_check_feature():
+    assert check_feature({"feature": "bullet"}, ["bullet", "top_edge"]) == "bullet"
+    with pytest.raises(ValidationError) as exc_info:
+        check_feature({"feature": "nothing"}, ["bullet", "top_edge"])
+    assert str(exc_info.value).endswith("Valid features are:\n  bullet\n  top_edge")
+
+
+def test_validate_theme_all_errors(tmp_path: pathlib.Path):
+    Image.new("RGBA", (8, 8)).save(tmp_path / "bg.png")
+    document: JSONObject = {
+        "features": [
+            {"feature": "background", "source": "bg.png", "justify": "sideways"},
+            {"feature": "top_edge", "source": 1, "crop": [0, 0]},
+            {"feature": "bullet", "source": "bg.png"},
+            {"feature": "bullet", "source": "bg.png"},
+        ],
+        "overrides": [{"feature": "top_edge", "source": "bg.png", "index": 0}],
+        "overlays": [{"source": "bg.png", "anchor": "top left", "above": 1}],
+        "colors": [],
+    }
+    with pytest.raises(ValidationErrorGroup) as exc_info:
+        validate_theme(document, str(tmp_path))
+    messages = [error.message for error in exc_info.value.errors]
+    assert len(messages) == 7
+    assert messages[0].startswith("JSON body for Theme colors")
+    assert messages[1].startswith("Theme features[0]: Invalid justify code")
+    assert messages[2].startswith("Theme features[1] source")
+    assert messages[3].startswith("Theme features[1] crop")
+    assert "more than one" in messages[4]
+    assert "doesn't have" in messages[5]
+    assert messages[6].startswith("Theme overlays[0] above")
+    # a group is still a ValidationError, with the code of the first problem
+    assert isinstance(exc_info.value, ValidationError)
+    assert exc_info.value.error_code == CODES.WRONG_TYPE.value
+
+    with pytest.raises(ValidationError) as first:
+        validate_theme(document, str(tmp_path), all_errors=False)
+    assert not isinstance(first.value, ValidationErrorGroup)
+    assert first.value.message.startswith("JSON body for Theme colors")
@@ -0,0 +1,103 @@
+import random
+import typing
+
+import pytest
+
+from written_book.text import FixedMetrics, MeasuredText, TextFitter
+
+
+def naive_wrap(text: str, width: int, char_width: int) -> typing.List[str]:
+    lines: typing.List[str] = []
+    line = ""
+    for word in text.split(" "):
+        if not word:
+            continue
+        while len(word) * char_width > width:
+            if line:
+                lines.append(line)
+                line = ""
+            cut = max(1, width // char_width)
+            lines.append(word[:cut])
+            word = word[cut:]
+        candidate = f"{line} {word}" if line else word
+        if len(candidate) * char_width <= width:
+            line = candidate
+        else:
+            lines.append(line)
+            line = word
+    lines.append(line)
+    return lines
+
+
+def raggedness(lines: typing.List[str], width: int) -> int:
+    return sum((width - len(line) * 6) ** 2 for line in lines[:-1])
+
+
+@pytest.mark.parametrize(
+    "text,width,expected",
+    [
+        ("the quick brown fox", 60, ["the quick", "brown fox"]),
+        ("the quick brown fox", 1000, ["the quick brown fox"]),
+        ("a verylongword b", 30, ["a", "veryl", "ongwo", "rd b"]),
+        ("", 30, [""]),
+        ("   ", 30, [""]),
+        ("  indented code", 60, ["  indented", "code"]),
+    ],
+)
+def test_greedy(text: str, width: int, expected: typing.List[str]):
+    assert TextFitter(FixedMetrics()).lines(text, width) == expected
+
+
+def test_greedy_matches_naive():
+    rng = random.Random(4)
+    for _ in range(200):
+        words = ["x" * rng.randint(1, 12) for _ in range(rng.randint(0, 40))]
+        text = " ".join(words)
+        width = rng.randint(6, 120)
+        assert TextFitter(FixedMetrics()).lines(text, width) == naive_wrap(
+            text, width, 6
+        )
+
+
+def test_optimal():
+    fitter = TextFitter(FixedMetrics(), "optimal")
+    text = "aaa bbbbbbbb c ddddd ee fffffff"
+    greedy = TextFitter(FixedMetrics()).lines(text, 84)
+    optimal = fitter.lines(text, 84)
+    assert greedy == ["aaa bbbbbbbb c", "ddddd ee", "fffffff"]
+    assert optimal == ["aaa bbbbbbbb", "c ddddd ee", "fffffff"]
+    assert raggedness(optimal, 84) < raggedness(greedy, 84)
+
+    rng = random.Random(2)
+    for _ in range(100):
+        text = " ".join("x" * rng.randint(1, 8) for _ in range(rng.randint(1, 30)))
+        width = rng.randint(48, 120)
+        greedy = TextFitter(FixedMetrics()).lines(text, width)
+        optimal = fitter.lines(text, width)
+        assert " ".join(optimal) == text
+        assert all(len(line) * 6 <= width for line in optimal)
+        assert raggedness(optimal, width) <= raggedness(greedy, width)
+
+
+def test_proportional_advances():
+    measured = MeasuredText("ab cd", [1.5, 2.5, 1.0, 3.0, 3.0])
+    assert measured.width() == 11
+    assert measured.width(3) == 6
+    assert measured.greedy(7) == [(0, 2), (3, 5)]
+    assert measured.greedy(11) == [(0, 5)]
+
+
+def test_measurements_are_cached():
+    calls: typing.List[str] = []
+
+    class Metrics(FixedMetrics):
+        def advances(self, text: str, style: str) -> typing.Sequence[float]:
+            calls.append(text)
+            return super().advances(text, style)
+
+    fitter = TextFitter(Metrics())
+    for width in (30, 60, 90):
+        fitter.lines("the quick brown fox", width)
+    assert calls == ["the quick brown fox"]
+    with pytest.raises(ValueError):
+        TextFitter(FixedMetrics(), "fast")
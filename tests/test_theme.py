@@ -0,0 +1,155 @@
+import json
+import pathlib
+import typing
+
+import pytest
+from PIL import Image
+
+from written_book import asset_resource
+from written_book.asset_resource import (
+    Anchor2D,
+    Direction,
+    Feature,
+    Feature1D,
+    Feature2D,
+    Justify1D,
+)
+from written_book.exceptions import ValidationError
+from written_book.theme import Theme
+from written_book.types import JSONObject
+
+
+def write_theme(directory: pathlib.Path, **changes: typing.Any) -> str:
+    Image.new("RGBA", (8, 8), (255, 0, 0, 255)).save(directory / "bg.png")
+    Image.new("RGBA", (8, 8), (0, 255, 0, 255)).save(directory / "bg_center.png")
+    Image.new("RGBA", (4, 6), (0, 0, 255, 255)).save(directory / "small.png")
+    theme: JSONObject = {
+        "features": [
+            {"feature": "background", "source": "bg.png", "justify": "center center"},
+            {
+                "feature": "left_edge",
+                "source": "bg.png",
+                "crop": [0, 0, 2, 8],
+                "justify": "center",
+                "overrides": [{"index": 1, "source": "small.png"}],
+            },
+            {"feature": "bullet", "source": "small.png"},
+        ],
+        "overrides": [
+            {"index": [0, 0], "source": "bg_center.png", "feature": "background"}
+        ],
+        "overlays": [
+            {"mode": "inside", "anchor": "top right", "source": "small.png"},
+            {"mode": "outside", "anchor": "inside-top left", "source": "small.png"},
+        ],
+        "colors": {"text": "#000000"},
+    }
+    theme.update(changes)
+    path = directory / "theme.json"
+    path.write_text(json.dumps(theme))
+    return str(path)
+
+
+def test_theme_indexes_features(tmp_path: pathlib.Path):
+    theme = Theme(write_theme(tmp_path))
+    assert set(theme.features) == {"background", "left_edge", "bullet"}
+    background = theme.get("background", Feature2D)
+    assert background is not None
+    assert background.resources()[1].source_path == str(tmp_path / "bg_center.png")
+    edge = theme.get("left_edge", Feature1D)
+    assert edge is not None
+    assert edge.direction == Direction.VERTICAL
+    assert edge.justify == Justify1D.CENTER
+    assert set(edge.overrides) == {1}
+    assert type(theme.get("bullet")) is Feature
+    assert theme.get("top_edge") is None
+    assert "bullet" in theme
+    with pytest.raises(TypeError):
+        theme.get("bullet", Feature2D)
+    assert len(theme.resources()) == 7
+    assert theme.colors["text"] == "#000000"
+
+
+def test_theme_overlays(tmp_path: pathlib.Path):
+    theme = Theme(write_theme(tmp_path))
+    inside, outside = theme.overlays
+    assert inside.mode == Anchor2D.AnchorMode.INSIDE
+    assert inside.anchor == (Anchor2D.X.RIGHT, Anchor2D.Y.TOP)
+    assert outside.mode == Anchor2D.AnchorMode.OUTSIDE
+    assert outside.anchor == (Anchor2D.X.LEFT, Anchor2D.Y.INSIDE_TOP)
+    # small.png is 4x6
+    assert [p for _, p in theme.overlay_layer.positions(20, 10)] == [(16, 0), (-4, 0)]
+
+
+def test_theme_is_read_only(tmp_path: pathlib.Path):
+    theme = Theme(write_theme(tmp_path))
+    with pytest.raises(AttributeError):
+        theme.config_path = "elsewhere"  # type: ignore
+    with pytest.raises(TypeError):
+        theme.features["background"] = theme.features["bullet"]  # type: ignore
+    with pytest.raises(TypeError):
+        theme.colors["text"] = "#ffffff"  # type: ignore
+
+
+def test_theme_compiled_cache(tmp_path: pathlib.Path):
+    path = write_theme(tmp_path)
+    cold = Theme(path, str(tmp_path / "cache"))
+    warm = Theme(path, str(tmp_path / "cache"))
+    for name in cold.features:
+        assert [r.crop for r in cold.features[name].resources()] == [
+            r.crop for r in warm.features[name].resources()
+        ]
+
+
+@pytest.mark.parametrize(
+    "changes",
+    [
+        {"features": [{"feature": "background", "source": "bg.png"}] * 2},
+        {"overrides": [{"index": [0, 0], "source": "bg.png", "feature": "top_edge"}]},
+        {"overrides": [{"index": [0, 0], "source": "bg.png", "feature": "bullet"}]},
+        {"overrides": [{"index": 0, "source": "bg.png", "feature": "background"}]},
+        {
+            "overlays": [
+                {"mode": "edge", "anchor": "inside-top left", "source": "bg.png"}
+            ]
+        },
+        {"overlays": [{"mode": "sideways", "anchor": "top", "source": "bg.png"}]},
+        {"overlays": [{"mode": "inside", "source": "bg.png"}]},
+        {"colors": []},
+        {"features": {}},
+        {
+            "overrides": [
+                {"index": [0, 0], "source": "small.png", "feature": "background"}
+            ]
+        },
+        {
+            "features": [
+                {
+                    "feature": "background",
+                    "source": "bg.png",
+                    "overrides": [{"index": [1, 1], "source": "small.png"}],
+                }
+            ]
+        },
+    ],
+)
+def test_invalid_themes(tmp_path: pathlib.Path, changes: JSONObject):
+    with pytest.raises(ValidationError):
+        Theme(write_theme(tmp_path, **changes))
+
+
+def test_theme_reads_headers_once(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+):
+    path = write_theme(tmp_path)
+    read: typing.List[str] = []
+    read_size = asset_resource._read_size  # type: ignore
+
+    def counted(source: str) -> typing.Tuple[int, int]:
+        read.append(source)
+        return read_size(source)
+
+    monkeypatch.setattr(asset_resource, "_read_size", counted)
+    Theme(path)
+    # every entry without a crop
+    assert len(read) == 6
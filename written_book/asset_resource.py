@@ -1,4 +1,6 @@
 import enum
+import errno
+import functools
 import os
 import os.path
 import re
@@ -6,11 +8,15 @@ import typing
 
 from PIL import Image
 
+from .cache import AssetCache, LRUCache, image_nbytes, readonly_view
 from .exceptions import ValidationError
+from .instrument import count, traced
+from .schema import theme_schema
+from .tiling import repeat
 from .types import JSON, JSONObject
 
 
-def _normalize(path: str) -> str:
+def normalize_path(path: str) -> str:
     """
     Standardize a path to a file, hopefully making it the same regardless of relative paths.
     :param path: The path to normalize.
@@ -19,6 +25,16 @@ def _normalize(path: str) -> str:
     return os.path.abspath(os.path.expanduser(path))
 
 
+def _read_size(path: str) -> typing.Tuple[int, int]:
+    """
+    Get the size of an image file without decoding it.
+    :param path: The image file.
+    :return: (width, height)
+    """
+    with Image.open(path) as image:
+        return image.size
+
+
 def next_multiple(value: int, multiple: int) -> int:
     """
     Get the next multiple of a number.
@@ -38,7 +54,20 @@ def odd(value: int) -> int:
     return value + 1 if value % 2 == 0 else value
 
 
-def check_feature(json_body: JSONObject, allowed: typing.List[str]) -> str:
+@functools.lru_cache(maxsize=None)
+def _feature_rules(
+    allowed: typing.Tuple[str, ...]
+) -> typing.Tuple[typing.FrozenSet[str], str]:
+    """
+    Build the lookup set and the listing for error messages of some feature types,
+    once per list of types.
+    :param allowed: The feature types.
+    :return: (set of the types, listing of the types)
+    """
+    return frozenset(allowed), "\n".join(f"  {feature}" for feature in allowed)
+
+
+def check_feature(json_body: JSONObject, allowed: typing.Sequence[str]) -> str:
     if "feature" not in json_body:
         raise ValidationError(
             'Feature(s) require a "feature".',
@@ -51,22 +80,21 @@ def check_feature(json_body: JSONObject, allowed: typing.List[str]) -> str:
             ValidationError.ErrorCode.WRONG_TYPE,
         )
 
-    if feature not in allowed:
-        msg = (
-            f'JSON body for Feature feature should be a valid 0-dimensional feature, not "{feature}".\n'
-            f"Valid features are:\n"
-        )
-        for feature_type in allowed:
-            msg += f"  {feature_type}\n"
-        msg = msg[:-1]
+    valid, listing = _feature_rules(tuple(allowed))
+    if feature not in valid:
         raise ValidationError(
-            msg,
+            f'JSON body for Feature feature should be a valid 0-dimensional feature, not "{feature}".\n'
+            f"Valid features are:\n{listing}",
             ValidationError.ErrorCode.INVALID_VALUE,
         )
     return feature
 
 
-shared_asset_cache: typing.Dict[str, Image.Image] = {}
+DEFAULT_TILE_CACHE_BYTES = 32 * 1024 * 1024
+
+DEFAULT_ASSET_CACHE_BYTES = 256 * 1024 * 1024
+
+shared_asset_cache = AssetCache(DEFAULT_ASSET_CACHE_BYTES)
 
 
 class AssetResource:
@@ -74,48 +102,118 @@ class AssetResource:
     Represents an image asset that is used during the compositing process.
     """
 
+    SCHEMA = theme_schema.validator({"$ref": "#/definitions/sourced"})
+
     def __init__(
         self,
         source: str,
         crop: typing.Optional[typing.Tuple[int, int, int, int]] = None,
         source_image: typing.Optional[Image.Image] = None,
     ):
-        self.source_path = _normalize(source)
-        self._static = False
-        self.source: Image.Image = source_image or self._load()
+        """
+        Nothing is decoded here; the source is only read on the first get().
+        :param source: Path to the source image.
+        :param crop: Region of the source to use, defaults to all of it.
+        :param source_image: Image to use instead of reading the source path.
+        """
+        self.source_path = normalize_path(source)
+        self._source = source_image
+        self._cropped: typing.Optional[Image.Image] = None
+        # shared_asset_cache.generation when _cropped was looked up
+        self._generation = -1
         if crop is None:
-            self.crop: typing.Tuple[int, int, int, int] = (
-                0,
-                0,
-                self.source.width,
-                self.source.height,
-            )
+            if source_image is not None:
+                source_size = source_image.size
+            else:
+                # only reads the header
+                source_size = _read_size(self.source_path)
+            self.crop: typing.Tuple[int, int, int, int] = (0, 0, *source_size)
         else:
+            if source_image is None and not os.path.isfile(self.source_path):
+                # still fail early for missing files
+                raise FileNotFoundError(
+                    errno.ENOENT, os.strerror(errno.ENOENT), self.source_path
+                )
             self.crop: typing.Tuple[int, int, int, int] = crop
 
+    @property
+    def source(self) -> Image.Image:
+        """
+        The whole source image, decoded on first use.
+        """
+        return self._load()
+
+    @traced("asset.load")
     def _load(self) -> Image.Image:
         """
         Load the source image into memory.
         :return:
         """
-        if self._static:
-            return self.source
-        if self.source_path in shared_asset_cache:
-            return shared_asset_cache[self.source_path]
-        else:
-            source: Image.Image = Image.open(self.source_path).convert("RGBA")
-            source.load()
-            shared_asset_cache[self.source_path] = source
-            return source
+        if self._source is not None:
+            return self._source
+        return shared_asset_cache.get(self.source_path)
+
+    @property
+    def is_file(self) -> bool:
+        """
+        Whether the source is read from a file, rather than an in-memory image.
+        """
+        return self._source is None
+
+    def relocate(self, source: str, crop: typing.Tuple[int, int, int, int]):
+        """
+        Point this resource at a different file, like a region of a texture atlas.
+        The new region must hold the same pixels as the old one.
+        :param source: Path to the new source image.
+        :param crop: Region of the new source to use.
+        """
+        self.source_path = normalize_path(source)
+        self.crop = crop
+        self._source = None
+        self._cropped = None
+
+    @property
+    def size(self) -> typing.Tuple[int, int]:
+        """
+        Size of the cropped image, without decoding anything.
+        """
+        return self.crop[2] - self.crop[0], self.crop[3] - self.crop[1]
+
+    def _get(self) -> Image.Image:
+        """
+        The cropped image, shared with every other user of it.
+        The file is only checked for changes the first time, so an edited asset
+        shows up once the theme is loaded again, like it is for every build.
+        """
+        if self._source is None:
+            if (
+                self._cropped is None
+                or self._generation != shared_asset_cache.generation
+            ):
+                self._cropped = shared_asset_cache.get_crop(self.source_path, self.crop)
+                self._generation = shared_asset_cache.generation
+        elif self._cropped is None:
+            self._cropped = self._source.crop(self.crop)
+        return self._cropped
 
     def get(self) -> Image.Image:
         """
         Get the source image, cropped.
+        The crop is only done once, so this is a read-only copy of a shared image;
+        use get_copy() if direct pixel access is needed.
+        :return:
+        """
+        return readonly_view(self._get())
+
+    def get_copy(self) -> Image.Image:
+        """
+        Get the source image, cropped, as a new image that is safe to modify.
         :return:
         """
-        return self.source.crop(self.crop)
+        return self._get().copy()
 
     @classmethod
+    @traced("import.AssetResource")
     def import_(
         cls, json_body: JSON, theme_directory: typing.Optional[str] = None
     ) -> "AssetResource":
@@ -127,70 +225,74 @@ class AssetResource:
         :param theme_directory: Path of the theme file or None for the cwd
         :return: ...new
         """
+        cls.SCHEMA(json_body, "JSON body for AssetResource")
+        return cls.from_validated(typing.cast(JSONObject, json_body), theme_directory)
+
+    @classmethod
+    def from_validated(
+        cls, json_body: JSONObject, theme_directory: typing.Optional[str] = None
+    ) -> "AssetResource":
+        """
+        Make an AssetResource from JSON that already passed SCHEMA.
+        :param json_body: JSON python representation, by json.load[s].
+        :param theme_directory: Path of the theme file or None for the cwd
+        :return: ...new
+        """
         theme_directory = (
             theme_directory or os.getcwd()
         )  # ideally don't support this later
-        if not isinstance(json_body, dict):
-            raise ValidationError(
-                f"JSON body for AssetResource should be a dict, not {json_body.__class__.__name__}",
-                ValidationError.ErrorCode.WRONG_TYPE,
-            )
-        # required: source
-        if "source" not in json_body:
-            raise ValidationError(
-                'AssetResource(s) require a "source".',
-                ValidationError.ErrorCode.MISSING_VALUE,
-            )
-        source = json_body["source"]  # relative to theme file
-        if not isinstance(source, str):
-            raise ValidationError(
-                f"JSON body for AssetResource source should be a string, not {source.__class__.__name__}",
-                ValidationError.ErrorCode.WRONG_TYPE,
-            )
-        # IF there is a crop, it must be exactly four integers.
+        source = typing.cast(str, json_body["source"])  # relative to theme file
+        new_crop: typing.Optional[typing.Tuple[int, int, int, int]] = None
         if "crop" in json_body:
-            crop = json_body["crop"]
-            if not isinstance(crop, list):
-                raise ValidationError(
-                    f"JSON body for AssetResource crop should be a list, not {crop.__class__.__name__}",
-                    ValidationError.ErrorCode.WRONG_TYPE,
-                )
-            if len(crop) != 4:
-                raise ValidationError(
-                    f'"crop" must be exactly 4 integers or omitted, got {len(crop)} instead',
-                    ValidationError.ErrorCode.INVALID_VALUE,
-                )
-            intermediate: typing.List[int] = []
-            for crop_att in crop:
-                try:
-                    assert (
-                        isinstance(crop_att, float) and crop_att.is_integer()
-                    ) or isinstance(crop_att, int)
-                    assert int(crop_att) >= 0
-                    intermediate.append(int(crop_att))
-                except (ValueError, AssertionError):
-                    raise ValidationError(
-                        f"Cropping values must be integers that are at least 0. (got {crop_att})",
-                        ValidationError.ErrorCode.INVALID_VALUE,
-                    )
             # noinspection PyTypeChecker
-            new_crop: typing.Optional[typing.Tuple[int, int, int, int]] = tuple(
-                intermediate
+            new_crop = tuple(
+                int(c) for c in typing.cast(typing.List[float], json_body["crop"])
             )
-        else:
-            new_crop = None
         # try to resolve the source path on the theme path if it's not absolute
         if not os.path.isabs(source):
             source = os.path.join(theme_directory, source)
         # ensure it's absolute and all that
-        source = _normalize(source)
+        source = normalize_path(source)
         return cls(source, new_crop)
 
+    @classmethod
+    def import_many(
+        cls,
+        json_bodies: typing.Iterable[JSON],
+        theme_directory: typing.Optional[str] = None,
+        workers: typing.Optional[int] = None,
+    ) -> typing.List["AssetResource"]:
+        """
+        Import several AssetResources from JSON, then decode their sources in parallel.
+        Validation happens first and in order, so the same ValidationError is
+        raised as when importing them one at a time.
+        :param json_bodies: JSON python representations, by json.load[s].
+        :param theme_directory: Path of the theme file or None for the cwd
+        :param workers: Number of decoding threads, see preload().
+        :return: ...new, in the same order
+        """
+        resources = [cls.import_(body, theme_directory) for body in json_bodies]
+        preload(resources, workers)
+        return resources
+
     @classmethod
     def from_image(cls, image: Image.Image):
-        i = cls("", None, image)
-        i._static = True
-        return i
+        return cls("", None, image)
+
+
+def preload(
+    resources: typing.Iterable[AssetResource], workers: typing.Optional[int] = None
+) -> int:
+    """
+    Decode the sources of several resources ahead of time, on a thread pool.
+    Resources sharing a source file are only decoded once.
+    :param resources: The resources to decode.
+    :param workers: Number of threads, defaults to the thread pool default.
+    :return: How many files were decoded.
+    """
+    return shared_asset_cache.preload(
+        (r.source_path for r in resources if r.is_file), workers
+    )
 
 
 class Feature:
@@ -209,25 +311,42 @@ class Feature:
         "horizontal_rule_right_cap",
         "bullet",
     ]
+    SCHEMA = theme_schema.validator(
+        {
+            "allOf": [{"$ref": "#/definitions/sourced"}],
+            "properties": {"feature": {"type": "string"}},
+            "required": ["feature"],
+        }
+    )
 
     def __init__(self, asset: AssetResource):
         self._asset = asset
 
+    @property
+    def asset(self) -> AssetResource:
+        return self._asset
+
+    def resources(self) -> typing.List[AssetResource]:
+        """
+        Every asset this feature uses, including overrides.
+        """
+        return [self._asset]
+
     @classmethod
+    @traced("import.Feature")
     def import_(cls, json_body: JSON, theme_directory: typing.Optional[str] = None):
-        if not isinstance(json_body, dict):
-            raise ValidationError(
-                f"JSON body for Feature should be a dict, not {json_body.__class__.__name__}",
-                ValidationError.ErrorCode.WRONG_TYPE,
-            )
-        asset = AssetResource.import_(json_body, theme_directory)
-        if "feature" not in json_body:
-            raise ValidationError(
-                'Feature(s) require a "feature".',
-                ValidationError.ErrorCode.MISSING_VALUE,
-            )
-        check_feature(json_body, cls.FEATURE_TYPES)
+        cls.SCHEMA(json_body, "JSON body for Feature")
+        return cls.from_validated(typing.cast(JSONObject, json_body), theme_directory)
 
+    @classmethod
+    def from_validated(
+        cls, json_body: JSONObject, theme_directory: typing.Optional[str] = None
+    ):
+        """
+        Make the feature from JSON that already passed SCHEMA.
+        """
+        asset = AssetResource.from_validated(json_body, theme_directory)
+        check_feature(json_body, cls.FEATURE_TYPES)
         return cls(asset)
 
 
@@ -262,6 +381,36 @@ class Justify2D:
 
     y_word = {"top": Y.TOP, "center": Y.CENTER, "bottom": Y.BOTTOM}
 
+    # every plain spelling ("top left", "left", ...) -> (x, y); see Feature2D.get_justify
+    codes: typing.Dict[str, typing.Tuple[X, Y]] = {}
+
+
+_X = typing.TypeVar("_X", bound=enum.Enum)
+_Y = typing.TypeVar("_Y", bound=enum.Enum)
+
+
+def _spellings(
+    x_word: typing.Mapping[str, _X], y_word: typing.Mapping[str, _Y]
+) -> typing.Dict[str, typing.Tuple[_X, _Y]]:
+    """
+    List every plain spelling of a justify or anchor code: "y x" pairs and the
+    one-word aliases.
+    :param x_word: Words for x, like Justify2D.x_word.
+    :param y_word: Words for y, like Justify2D.y_word.
+    :return: spelling -> (x, y)
+    """
+    spellings = {
+        f"{y} {x}": (x_value, y_value)
+        for y, y_value in y_word.items()
+        for x, x_value in x_word.items()
+    }
+    for word, (y, x) in Justify2D.one_word_aliases.items():
+        spellings[word] = x_word[x], y_word[y]
+    return spellings
+
+
+Justify2D.codes = _spellings(Justify2D.x_word, Justify2D.y_word)
+
 
 class Anchor2D:
     @enum.unique
@@ -302,25 +451,122 @@ class Anchor2D:
 
     ONLY_ONE_OF = (X.INSIDE_LEFT, X.INSIDE_RIGHT, Y.INSIDE_TOP, Y.INSIDE_BOTTOM)
 
+    x_word = {x.value[0]: x for x in X}
+
+    y_word = {y.value[0]: y for y in Y}
+
+    mode_word = {mode.value: mode for mode in AnchorMode}
+
+    # every plain spelling -> (x, y, modes it can be used with); see parse()
+    codes: typing.Dict[str, typing.Tuple[X, Y, typing.FrozenSet[AnchorMode]]] = {}
+
+    # every (x, y, mode) that can be used together
+    combinations: typing.FrozenSet[typing.Tuple[X, Y, AnchorMode]] = frozenset()
+
+    @staticmethod
+    def parse(code: str) -> typing.Tuple["Anchor2D.X", "Anchor2D.Y"]:
+        """
+        Get the anchor enums from an anchor code.
+        :param code: string like "top right" or "inside-top left"
+        :return: (x anchor, y anchor)
+        """
+        x_anchor, y_anchor, _ = Anchor2D.lookup(code)
+        return x_anchor, y_anchor
+
+    @staticmethod
+    def lookup(
+        code: str,
+    ) -> typing.Tuple[
+        "Anchor2D.X", "Anchor2D.Y", typing.FrozenSet["Anchor2D.AnchorMode"]
+    ]:
+        """
+        Get the anchor enums from an anchor code, along with the modes they can
+        be used with.
+        :param code: string like "top right" or "inside-top left"
+        :return: (x anchor, y anchor, valid modes)
+        """
+        found = Anchor2D.codes.get(code)
+        if found is None:
+            found = _parse_anchor(code)
+        return found
+
     @staticmethod
     def valid(
         x_anchor: typing.Union[X, str],
         y_anchor: typing.Union[Y, str],
         anchor: typing.Union[AnchorMode, str],
     ) -> bool:
+        """
+        Check if an x anchor, y anchor and mode can be used together.
+        Each can be given as its enum or as its word, like "inside-left".
+        """
         if isinstance(x_anchor, str):
-            x_anchor = Anchor2D.X(x_anchor.upper())
+            x_anchor = Anchor2D.x_word.get(x_anchor.lower())  # type: ignore
         if isinstance(y_anchor, str):
-            y_anchor = Anchor2D.Y(y_anchor.upper())
+            y_anchor = Anchor2D.y_word.get(y_anchor.lower())  # type: ignore
         if isinstance(anchor, str):
-            anchor = Anchor2D.AnchorMode(anchor.upper())
-        return (
-            Anchor2D.X.valid(x_anchor, anchor)
-            and Anchor2D.Y.valid(y_anchor, anchor)
-            and not (
-                x_anchor in Anchor2D.ONLY_ONE_OF and y_anchor in Anchor2D.ONLY_ONE_OF
+            anchor = Anchor2D.mode_word.get(anchor.lower())  # type: ignore
+        return (x_anchor, y_anchor, anchor) in Anchor2D.combinations
+
+
+Anchor2D.combinations = frozenset(
+    (x_anchor, y_anchor, mode)
+    for x_anchor in Anchor2D.X
+    for y_anchor in Anchor2D.Y
+    for mode in Anchor2D.AnchorMode
+    if Anchor2D.X.valid(x_anchor, mode)
+    and Anchor2D.Y.valid(y_anchor, mode)
+    and not (x_anchor in Anchor2D.ONLY_ONE_OF and y_anchor in Anchor2D.ONLY_ONE_OF)
+)
+
+Anchor2D.codes = {
+    code: (
+        x_anchor,
+        y_anchor,
+        frozenset(
+            mode
+            for mode in Anchor2D.AnchorMode
+            if (x_anchor, y_anchor, mode) in Anchor2D.combinations
+        ),
+    )
+    for code, (x_anchor, y_anchor) in _spellings(
+        Anchor2D.x_word, Anchor2D.y_word
+    ).items()
+}
+
+
+@functools.lru_cache(maxsize=256)
+def _parse_anchor(
+    code: str,
+) -> typing.Tuple[Anchor2D.X, Anchor2D.Y, typing.FrozenSet[Anchor2D.AnchorMode]]:
+    """
+    Anchor2D.lookup() for codes that aren't spelled like the table: other
+    casing or spacing. Remembers recent codes.
+    """
+    words = code.lower().split()
+    if len(words) == 1:
+        if words[0] not in Justify2D.one_word_aliases:
+            raise ValidationError(
+                f"Invalid anchor code: {code}; the 1-word code '{words[0]}' is not supported",
+                ValidationError.ErrorCode.INVALID_VALUE,
             )
+        words = list(Justify2D.one_word_aliases[words[0]])
+    if len(words) != 2:
+        raise ValidationError(
+            f"Invalid anchor code: {code}; must be 1 or 2 words, got {len(words)}",
+            ValidationError.ErrorCode.INVALID_VALUE,
         )
+    if words[1] not in Anchor2D.x_word:
+        raise ValidationError(
+            f"Invalid anchor code: {code}; the second word '{words[1]}' is not a supported x anchor",
+            ValidationError.ErrorCode.INVALID_VALUE,
+        )
+    if words[0] not in Anchor2D.y_word:
+        raise ValidationError(
+            f"Invalid anchor code: {code}; the first word '{words[0]}' is not a supported y anchor",
+            ValidationError.ErrorCode.INVALID_VALUE,
+        )
+    return Anchor2D.codes[" ".join(words)]
 
 
 @enum.unique
@@ -331,15 +577,18 @@ class Justify1D(enum.Enum):
 
     @classmethod
     def from_name(cls, name: str) -> "Justify1D":
-        return {
-            "start": cls.START,
-            "center": cls.CENTER,
-            "end": cls.END,
-            "left": cls.START,
-            "right": cls.END,
-            "top": cls.START,
-            "bottom": cls.END,
-        }[name.lower()]
+        return _JUSTIFY_1D_WORDS[name.lower()]
+
+
+_JUSTIFY_1D_WORDS = {
+    "start": Justify1D.START,
+    "center": Justify1D.CENTER,
+    "end": Justify1D.END,
+    "left": Justify1D.START,
+    "right": Justify1D.END,
+    "top": Justify1D.START,
+    "bottom": Justify1D.END,
+}
 
 
 @enum.unique
@@ -349,7 +598,10 @@ class Direction(enum.Enum):
 
     @classmethod
     def from_name(cls, name: str) -> "Direction":
-        return {"horizontal": cls.HORIZONTAL, "vertical": cls.VERTICAL}[name.lower()]
+        return _DIRECTION_WORDS[name.lower()]
+
+
+_DIRECTION_WORDS = {"horizontal": Direction.HORIZONTAL, "vertical": Direction.VERTICAL}
 
 
 class FeatureOverride:
@@ -358,49 +610,78 @@ class FeatureOverride:
 
 
 class Feature2DOverride(FeatureOverride):
+    SCHEMA = theme_schema.validator({"$ref": "#/definitions/feature_override_2d"})
+
     def __init__(self, asset: AssetResource, x: int, y: int):
         super().__init__(asset)
         self.x = x
         self.y = y
 
     @classmethod
+    @traced("import.Feature2DOverride")
     def import_(cls, json_body: JSON, theme_directory: typing.Optional[str] = None):
-        if not isinstance(json_body, dict):
-            raise ValidationError(
-                f"JSON body for FeatureOverride should be a dict, not {json_body.__class__.__name__}",
-                ValidationError.ErrorCode.WRONG_TYPE,
-            )
-        asset = AssetResource.import_(json_body, theme_directory)
-        if "index" not in json_body:
-            raise ValidationError(
-                'FeatureOverride(s) require a "index".',
-                ValidationError.ErrorCode.MISSING_VALUE,
-            )
-        index = json_body["index"]
-        if not isinstance(index, list):
-            raise ValidationError(
-                f"FeatureOverride index should be a list, not {index.__class__.__name__}",
-                ValidationError.ErrorCode.WRONG_TYPE,
-            )
-        if len(index) != 2:
-            raise ValidationError(
-                f"FeatureOverride index should be a list of length 2, not length {len(index)}",
-                ValidationError.ErrorCode.WRONG_TYPE,
-            )
-        if not all(
-            isinstance(i, int) or (isinstance(i, float) and i.is_integer())
-            for i in index
-        ):
+        cls.SCHEMA(json_body, "JSON body for FeatureOverride")
+        return cls.from_validated(typing.cast(JSONObject, json_body), theme_directory)
+
+    @classmethod
+    def from_validated(
+        cls, json_body: JSONObject, theme_directory: typing.Optional[str] = None
+    ):
+        x, y = typing.cast(typing.List[float], json_body["index"])
+        return cls(
+            AssetResource.from_validated(json_body, theme_directory), int(x), int(y)
+        )
+
+
+@functools.lru_cache(maxsize=256)
+def _parse_justify(code: str) -> typing.Tuple[Justify2D.X, Justify2D.Y]:
+    """
+    Feature2D.get_justify() for codes that aren't spelled like the table: other
+    casing or separators. Remembers recent codes.
+    """
+    words = re.findall(r"(?:^|(?<=[^A-Za-z0-9]))(\w+)(?=[^A-Za-z0-9]|$)", code.lower())
+    if not 1 <= len(words) <= 2:
+        raise ValidationError(
+            f"Invalid justify code: {code}; must be 1 or 2 words, got {len(words)}",
+            ValidationError.ErrorCode.INVALID_VALUE,
+        )
+    if len(words) == 1:
+        if words[0] in Justify2D.one_word_aliases:
+            words = list(Justify2D.one_word_aliases[words[0]])
+        else:
             raise ValidationError(
-                f"FeatureOverride index should be a list of ints. (provided: {index})",
-                ValidationError.ErrorCode.WRONG_TYPE,
+                f"Invalid justify code: {code}; the 1-word code '{words[0]}' is not supported",
+                ValidationError.ErrorCode.INVALID_VALUE,
             )
-        index = typing.cast(typing.List[int | float], index)
-        return cls(asset, int(index[0]), int(index[1]))
+    if words[1] not in Justify2D.x_word:
+        raise ValidationError(
+            f"Invalid justify code: {code}; the second word '{words[1]}' is not a supported x justification",
+            ValidationError.ErrorCode.INVALID_VALUE,
+        )
+    if words[0] not in Justify2D.y_word:
+        raise ValidationError(
+            f"Invalid justify code: {code}; the first word '{words[0]}' is not a supported y justification",
+            ValidationError.ErrorCode.INVALID_VALUE,
+        )
+    return Justify2D.codes[" ".join(words)]
 
 
 class Feature2D(Feature):
     FEATURE_TYPES = ["background", "code_background"]
+    SCHEMA = theme_schema.validator(
+        {
+            "allOf": [{"$ref": "#/definitions/sourced"}],
+            "properties": {
+                "feature": {"type": "string"},
+                "justify": {"type": "string"},
+                "overrides": {
+                    "type": "array",
+                    "items": {"$ref": "#/definitions/feature_override_2d"},
+                },
+            },
+            "required": ["feature"],
+        }
+    )
 
     @staticmethod
     def get_justify(code: str) -> typing.Tuple[Justify2D.X, Justify2D.Y]:
@@ -410,33 +691,9 @@ class Feature2D(Feature):
         :param code: string like "top left" or similar
         :return: (x justify, y justify)
         """
-        words = re.findall(
-            r"(?:^|(?<=[^A-Za-z0-9]))(\w+)(?=[^A-Za-z0-9]|$)", code.lower()
-        )
-        if 1 < len(words) > 2:
-            raise ValidationError(
-                f"Invalid justify code: {code}; must be 1 or 2 words, got {len(words)}",
-                ValidationError.ErrorCode.INVALID_VALUE,
-            )
-        if len(words) == 1:
-            if words[0] in Justify2D.one_word_aliases:
-                words = Justify2D.one_word_aliases[words[0]]
-            else:
-                raise ValidationError(
-                    f"Invalid justify code: {code}; the 1-word code '{words[0]}' is not supported",
-                    ValidationError.ErrorCode.INVALID_VALUE,
-                )
-        if words[1] not in Justify2D.x_word:
-            raise ValidationError(
-                f"Invalid justify code: {code}; the second word '{words[1]}' is not a supported x justification",
-                ValidationError.ErrorCode.INVALID_VALUE,
-            )
-        if words[0] not in Justify2D.y_word:
-            raise ValidationError(
-                f"Invalid justify code: {code}; the first word '{words[0]}' is not a supported y justification",
-                ValidationError.ErrorCode.INVALID_VALUE,
-            )
-        justify = Justify2D.x_word[words[1]], Justify2D.y_word[words[0]]
+        justify = Justify2D.codes.get(code)
+        if justify is None:
+            justify = _parse_justify(code)
         return justify
 
     def __init__(
@@ -444,8 +701,12 @@ class Feature2D(Feature):
         asset: AssetResource,
         justify: typing.Union[str, typing.Tuple[Justify2D.X, Justify2D.Y]] = "center",
         overrides: typing.Optional[typing.List[Feature2DOverride]] = None,
+        cache_bytes: int = DEFAULT_TILE_CACHE_BYTES,
     ):
         super().__init__(asset)
+        self.tile_cache: LRUCache[
+            typing.Tuple[int, int, Justify2D.X, Justify2D.Y], Image.Image
+        ] = LRUCache(cache_bytes, image_nbytes)
         self._overrides = {}
         self.set_overrides(overrides)
         if isinstance(justify, str):
@@ -456,36 +717,66 @@ class Feature2D(Feature):
         self._overrides: typing.Dict[typing.Tuple[int, int], Feature2DOverride] = {
             (o.x, o.y): o for o in (overrides or [])
         }
+        self.tile_cache.clear()
         for override in self._overrides.values():
-            if override.asset.get().size != self._asset.get().size:
-                raise ValueError(
-                    "Override asset size must match the base asset size.\n    "
-                    f"got {override.asset.get().size}, expected {self._asset.get().size}\n    "
-                    "(hint: try resizing the override with the 'crop' option)\n    "
-                    "(hint: if you don't want to do that, use an overlay instead)"
-                )
+            self.check_override(override)
+
+    def check_override(self, override: Feature2DOverride):
+        """
+        Make sure an override can replace a tile of this feature.
+        :param override: The override.
+        """
+        if override.asset.size != self._asset.size:
+            raise ValidationError(
+                "Override asset size must match the base asset size.\n    "
+                f"got {override.asset.size}, expected {self._asset.size}\n    "
+                "(hint: try resizing the override with the 'crop' option)\n    "
+                "(hint: if you don't want to do that, use an overlay instead)",
+                ValidationError.ErrorCode.INVALID_VALUE,
+            )
+
+    @property
+    def overrides(self) -> typing.Mapping[typing.Tuple[int, int], Feature2DOverride]:
+        """
+        Every override, by tile index.
+        """
+        return self._overrides
 
     @property
     def justify(self) -> typing.Tuple[Justify2D.X, Justify2D.Y]:
         return self.justifyX, self.justifyY
 
-    def tile(self, width: int, height: int):
+    def resources(self) -> typing.List[AssetResource]:
+        return [self._asset, *(o.asset for o in self._overrides.values())]
+
+    def tile(self, width: int, height: int) -> Image.Image:
         """
         Tile the asset to the given dimensions.
+        Results are cached, so the returned image is a copy-on-write view;
+        use .copy() if direct pixel access is needed.
         :param width: The width to tile to.
         :param height: The height to tile to.
         :return: The tiled image.
         """
+        key = width, height, self.justifyX, self.justifyY
+        tiled = self.tile_cache.get(key)
+        if tiled is None:
+            count("tile.cache_miss")
+            tiled = self._tile(width, height)
+            self.tile_cache.put(key, tiled)
+        else:
+            count("tile.cache_hit")
+        return readonly_view(tiled)
+
+    @traced("tile.2d")
+    def _tile(self, width: int, height: int) -> Image.Image:
         img = self._asset.get()
         # Round up to the next multiple of the asset size...
-        tiled = Image.new(
-            "RGBA",
-            (
-                odd(next_multiple(width, img.width)),
-                odd(next_multiple(height, img.height)),
-            ),
+        tiled_size = (
+            odd(next_multiple(width, img.width)),
+            odd(next_multiple(height, img.height)),
         )
-        tile_count = tiled.width // img.width, tiled.height // img.height
+        tile_count = tiled_size[0] // img.width, tiled_size[1] // img.height
         # Calculate the "origin" tile
         center_pos = [0, 0]
         if self.justifyX == Justify2D.X.CENTER:
@@ -497,66 +788,171 @@ class Feature2D(Feature):
         elif self.justifyY == Justify2D.Y.BOTTOM:
             center_pos[1] = tile_count[1] - 1
 
-        # Paste that thing all over the place
-        for x in range(tile_count[0]):
-            for y in range(tile_count[1]):
-                vx, vy = x - center_pos[0], y - center_pos[1]
-                if (vx, vy) in self._overrides:
-                    override = self._overrides[(vx, vy)]
-                    tiled.paste(override.asset.get(), (x * img.width, y * img.height))
-                else:
-                    tiled.paste(img, (x * img.width, y * img.height))
+        # Fill the whole grid in bulk, then patch the overridden tiles on top
+        grid = repeat(img, *tile_count)
+        for (vx, vy), override in self._overrides.items():
+            x, y = vx + center_pos[0], vy + center_pos[1]
+            if 0 <= x < tile_count[0] and 0 <= y < tile_count[1]:
+                grid.paste(override.asset.get(), (x * img.width, y * img.height))
 
         # Crop to the desired size using the justification
+        # (anything past the grid is transparent, like the leftover odd pixels)
         crop_from = [0, 0]
         if self.justifyX == Justify2D.X.CENTER:
-            crop_from[0] = (tiled.width - width) // 2
+            crop_from[0] = (tiled_size[0] - width) // 2
         elif self.justifyX == Justify2D.X.RIGHT:
-            crop_from[0] = tiled.width - width
+            crop_from[0] = tiled_size[0] - width
         if self.justifyY == Justify2D.Y.CENTER:
-            crop_from[1] = (tiled.height - height) // 2
+            crop_from[1] = (tiled_size[1] - height) // 2
         elif self.justifyY == Justify2D.Y.BOTTOM:
-            crop_from[1] = tiled.height - height
+            crop_from[1] = tiled_size[1] - height
         crop_to = [crop_from[0] + width, crop_from[1] + height]
-        tiled = tiled.crop((crop_from[0], crop_from[1], crop_to[0], crop_to[1]))
-        return tiled
+        return grid.crop((crop_from[0], crop_from[1], crop_to[0], crop_to[1]))
 
     @classmethod
+    @traced("import.Feature2D")
     def import_(cls, json_body: JSON, theme_directory: typing.Optional[str] = None):
-        if not isinstance(json_body, dict):
-            raise ValidationError(
-                f"JSON body for Feature should be a dict, not {json_body.__class__.__name__}",
-                ValidationError.ErrorCode.WRONG_TYPE,
+        cls.SCHEMA(json_body, "JSON body for Feature")
+        return cls.from_validated(typing.cast(JSONObject, json_body), theme_directory)
+
+    @classmethod
+    def from_validated(
+        cls, json_body: JSONObject, theme_directory: typing.Optional[str] = None
+    ):
+        asset = AssetResource.from_validated(json_body, theme_directory)
+        check_feature(json_body, cls.FEATURE_TYPES)
+        justify = typing.cast(str, json_body.get("justify", "top left"))
+        overrides = [
+            Feature2DOverride.from_validated(o, theme_directory)
+            for o in typing.cast(
+                typing.List[JSONObject], json_body.get("overrides", [])
             )
-        asset = AssetResource.import_(json_body, theme_directory)
-        justify = json_body.get("justify", "top left")
-        if not isinstance(justify, str):
+        ]
+        return cls(asset, justify, overrides)
+
+
+class Overlay:
+    """
+    An image composited on top of the rendered page, placed relative to its edges.
+    """
+
+    # mode and anchor are checked against each other by import_
+    SCHEMA = theme_schema.validator(
+        {
+            "allOf": [{"$ref": "#/definitions/sourced"}],
+            "properties": {
+                "mode": {"type": "string"},
+                "anchor": {"type": "string"},
+                "above": {"type": "boolean"},
+            },
+            "required": ["anchor"],
+        }
+    )
+
+    def __init__(
+        self,
+        asset: AssetResource,
+        mode: Anchor2D.AnchorMode = Anchor2D.AnchorMode.INSIDE,
+        anchor: typing.Tuple[Anchor2D.X, Anchor2D.Y] = (
+            Anchor2D.X.CENTER,
+            Anchor2D.Y.CENTER,
+        ),
+        above: bool = False,
+    ):
+        self.asset = asset
+        self.mode = mode
+        self.anchorX, self.anchorY = anchor
+        self.above = above
+
+    @property
+    def anchor(self) -> typing.Tuple[Anchor2D.X, Anchor2D.Y]:
+        return self.anchorX, self.anchorY
+
+    @classmethod
+    @traced("import.Overlay")
+    def import_(cls, json_body: JSON, theme_directory: typing.Optional[str] = None):
+        cls.SCHEMA(json_body, "JSON body for Overlay")
+        return cls.from_validated(typing.cast(JSONObject, json_body), theme_directory)
+
+    @classmethod
+    def from_validated(
+        cls, json_body: JSONObject, theme_directory: typing.Optional[str] = None
+    ):
+        asset = AssetResource.from_validated(json_body, theme_directory)
+        mode = typing.cast(str, json_body.get("mode", "inside"))
+        if mode not in Anchor2D.mode_word:
             raise ValidationError(
-                f"JSON body for Feature justify should be a string, not {justify.__class__.__name__}",
-                ValidationError.ErrorCode.WRONG_TYPE,
+                f'Overlay mode should be one of inside, outside or edge, not "{mode}"',
+                ValidationError.ErrorCode.INVALID_VALUE,
             )
-        overrides = json_body.get("overrides", [])
-        if not isinstance(overrides, list):
+        anchor = typing.cast(str, json_body["anchor"])
+        above = typing.cast(bool, json_body.get("above", False))
+        x_anchor, y_anchor, modes = Anchor2D.lookup(anchor)
+        anchor_mode = Anchor2D.mode_word[mode]
+        if anchor_mode not in modes:
             raise ValidationError(
-                f"JSON body for Feature overrides should be a list, not {overrides.__class__.__name__}",
-                ValidationError.ErrorCode.WRONG_TYPE,
+                f'Overlay anchor "{anchor}" can\'t be used with the "{mode}" mode',
+                ValidationError.ErrorCode.INVALID_VALUE,
             )
-
-        # might throw, OK
-        overrides = [Feature2DOverride.import_(o, theme_directory) for o in overrides]
-
-        check_feature(json_body, cls.FEATURE_TYPES)
-
-        return cls(asset, justify, overrides)
+        return cls(asset, anchor_mode, (x_anchor, y_anchor), above)
 
 
 class Feature1DOverride(FeatureOverride):
+    SCHEMA = theme_schema.validator({"$ref": "#/definitions/feature_override_1d"})
+
     def __init__(self, asset: AssetResource, x: int):
         super().__init__(asset)
         self.x = x
 
+    @classmethod
+    @traced("import.Feature1DOverride")
+    def import_(cls, json_body: JSON, theme_directory: typing.Optional[str] = None):
+        cls.SCHEMA(json_body, "JSON body for FeatureOverride")
+        return cls.from_validated(typing.cast(JSONObject, json_body), theme_directory)
+
+    @classmethod
+    def from_validated(
+        cls, json_body: JSONObject, theme_directory: typing.Optional[str] = None
+    ):
+        index = int(typing.cast(float, json_body["index"]))
+        return cls(AssetResource.from_validated(json_body, theme_directory), index)
+
 
 class Feature1D(Feature):
+    FEATURE_TYPES = [
+        "top_edge",
+        "bottom_edge",
+        "left_edge",
+        "right_edge",
+        "block_quote",
+        "code_top_edge",
+        "code_bottom_edge",
+        "code_left_edge",
+        "code_right_edge",
+        "horizontal_rule",
+    ]
+    SCHEMA = theme_schema.validator(
+        {
+            "allOf": [{"$ref": "#/definitions/sourced"}],
+            "properties": {
+                "feature": {"type": "string"},
+                "justify": {"type": "string"},
+                "overrides": {
+                    "type": "array",
+                    "items": {"$ref": "#/definitions/feature_override_1d"},
+                },
+            },
+            "required": ["feature"],
+        }
+    )
+    VERTICAL_FEATURES = [
+        "left_edge",
+        "right_edge",
+        "block_quote",
+        "code_left_edge",
+        "code_right_edge",
+    ]
+
     @staticmethod
     def get_justify(code: str) -> Justify1D:
         """
@@ -573,28 +969,73 @@ class Feature1D(Feature):
         justify: typing.Union[str, Justify1D] = "center",
         direction: Direction = Direction.HORIZONTAL,
         overrides: typing.Optional[typing.List[Feature1DOverride]] = None,
+        cache_bytes: int = DEFAULT_TILE_CACHE_BYTES,
     ):
         super().__init__(asset)
         if isinstance(justify, str):
             justify = Justify1D.from_name(justify)
         self.justify = justify
         self.direction = direction
-        self.overrides: typing.Dict[int, Feature1DOverride] = {
-            o.x: o for o in (overrides or [])
-        }
+        self.tile_cache: LRUCache[
+            typing.Tuple[int, Justify1D, Direction], Image.Image
+        ] = LRUCache(cache_bytes, image_nbytes)
+        self.overrides: typing.Dict[int, Feature1DOverride] = {}
+        self._rotated_overrides: typing.Dict[
+            int, typing.Tuple[Feature1DOverride, Image.Image]
+        ] = {}
+        self.set_overrides(overrides)
 
-    def tile(self, length: int):
+    def set_overrides(self, overrides: typing.Optional[typing.List[Feature1DOverride]]):
+        self.overrides = {o.x: o for o in (overrides or [])}
+        self._rotated_overrides = {}
+        self.tile_cache.clear()
+
+    def _override_image(self, override: Feature1DOverride) -> Image.Image:
+        """
+        Get the image to paste for an override, in the strip's orientation.
+        Vertical strips have always shown their overrides turned clockwise, so the
+        rotated copy is kept around instead of being made again on every tile.
+        :param override: The override to get the image of.
+        :return: The image to paste.
+        """
+        if self.direction == Direction.HORIZONTAL:
+            return override.asset.get()
+        cached = self._rotated_overrides.get(override.x)
+        if cached is None or cached[0] is not override:
+            cached = override, override.asset.get().transpose(
+                Image.Transpose.ROTATE_270
+            )
+            self._rotated_overrides[override.x] = cached
+        return cached[1]
+
+    def tile(self, length: int) -> Image.Image:
         """
         Tile the asset to the given length.
+        Vertical strips are filled top to bottom, the same as a horizontal strip
+        rotated into place.
+        Results are cached, so the returned image is a copy-on-write view;
+        use .copy() if direct pixel access is needed.
         :param length: The length to tile to.
         :return: The tiled image.
         """
+        key = length, self.justify, self.direction
+        tiled = self.tile_cache.get(key)
+        if tiled is None:
+            count("tile.cache_miss")
+            tiled = self._tile(length)
+            self.tile_cache.put(key, tiled)
+        else:
+            count("tile.cache_hit")
+        return readonly_view(tiled)
+
+    @traced("tile.1d")
+    def _tile(self, length: int) -> Image.Image:
         img = self._asset.get()
-        if self.direction == Direction.VERTICAL:
-            img = img.transpose(Image.ROTATE_90)
+        vertical = self.direction == Direction.VERTICAL
+        step = img.height if vertical else img.width
         # Round up to the next multiple of the asset size...
-        tiled = Image.new("RGBA", (odd(next_multiple(length, img.width)), img.height))
-        tile_count = tiled.width // img.width
+        tiled_length = odd(next_multiple(length, step))
+        tile_count = tiled_length // step
         # Calculate the "origin" tile
         center_pos = 0
         if self.justify == Justify1D.CENTER:
@@ -602,26 +1043,110 @@ class Feature1D(Feature):
         elif self.justify == Justify1D.END:
             center_pos = tile_count - 1
 
-        # Paste that thing all over the place
-        for x in range(tile_count):
-            vx = x - center_pos
-            if vx in self.overrides:
-                override = self.overrides[vx]
-                tiled.paste(override.asset.get(), (x * img.width, 0))
-            else:
-                tiled.paste(img, (x * img.width, 0))
-
         # Crop to the desired size using the justification
         crop_from = 0
         if self.justify == Justify1D.CENTER:
-            crop_from = (tiled.width - length) // 2
+            crop_from = (tiled_length - length) // 2
         elif self.justify == Justify1D.END:
-            crop_from = tiled.width - length
+            crop_from = tiled_length - length
         crop_to = crop_from + length
-        tiled = tiled.crop((crop_from, 0, crop_to, img.height))
-        if self.direction == Direction.VERTICAL:
-            tiled = tiled.transpose(Image.ROTATE_270)
-        return tiled
+
+        # Fill the whole strip in bulk, then patch the overridden tiles on top
+        if vertical:
+            strip = repeat(img, 1, tile_count)
+            strip = strip.crop((0, crop_from, img.width, crop_to))
+        else:
+            strip = repeat(img, tile_count, 1)
+            strip = strip.crop((crop_from, 0, crop_to, img.height))
+        overridden = sorted(
+            x for x in (vx + center_pos for vx in self.overrides) if 0 <= x < tile_count
+        )
+        # tiles used to be pasted one by one, in order, each over the whole of its
+        # cell. a plain tile covers up whatever was pasted before it, but an
+        # override larger than a tile shows through into every cell after it that
+        # isn't plain, and into the leftover space past the last tile. so all of
+        # the overrides are pasted in order onto a transparent canvas, and only
+        # those parts of it are put in place.
+        if overridden:
+            first = overridden[0] * step
+            if vertical:
+                canvas = Image.new("RGBA", (img.width, tiled_length - first))
+            else:
+                canvas = Image.new("RGBA", (tiled_length - first, img.height))
+            for x in overridden:
+                patch = self._override_image(self.overrides[x - center_pos])
+                if vertical:
+                    # right-aligned, where the top of the unrotated strip ends up
+                    canvas.paste(patch, (img.width - patch.width, x * step - first))
+                else:
+                    canvas.paste(patch, (x * step - first, 0))
+            spans = [(x * step, (x + 1) * step) for x in overridden]
+            spans.append((tile_count * step, tiled_length))
+            for begin, end in spans:
+                if begin == end:
+                    continue
+                if vertical:
+                    piece = canvas.crop((0, begin - first, img.width, end - first))
+                    strip.paste(piece, (0, begin - crop_from))
+                else:
+                    piece = canvas.crop((begin - first, 0, end - first, img.height))
+                    strip.paste(piece, (begin - crop_from, 0))
+        return strip
+
+    @classmethod
+    @traced("import.Feature1D")
+    def import_(cls, json_body: JSON, theme_directory: typing.Optional[str] = None):
+        cls.SCHEMA(json_body, "JSON body for Feature")
+        return cls.from_validated(typing.cast(JSONObject, json_body), theme_directory)
+
+    @classmethod
+    def from_validated(
+        cls, json_body: JSONObject, theme_directory: typing.Optional[str] = None
+    ):
+        asset = AssetResource.from_validated(json_body, theme_directory)
+        feature = check_feature(json_body, cls.FEATURE_TYPES)
+        justify = typing.cast(str, json_body.get("justify", "start"))
+        try:
+            justify = cls.get_justify(justify)
+        except KeyError:
+            raise ValidationError(
+                f"Invalid justify code: {justify}; must be one of start, center, end, top, bottom, left or right",
+                ValidationError.ErrorCode.INVALID_VALUE,
+            )
+        overrides = [
+            Feature1DOverride.from_validated(o, theme_directory)
+            for o in typing.cast(
+                typing.List[JSONObject], json_body.get("overrides", [])
+            )
+        ]
+        return cls(asset, justify, cls.direction_of(feature), overrides)
+
+    @classmethod
+    def direction_of(cls, feature: str) -> Direction:
+        """
+        Get the direction a type of 1D feature runs in.
+        :param feature: The feature type, like "left_edge".
+        :return: The direction.
+        """
+        if feature in cls.VERTICAL_FEATURES:
+            return Direction.VERTICAL
+        return Direction.HORIZONTAL
+
+    def resources(self) -> typing.List[AssetResource]:
+        return [self._asset, *(o.asset for o in self.overrides.values())]
+
+
+def feature_class(name: str) -> typing.Type[Feature]:
+    """
+    Get the Feature class that handles a feature type.
+    :param name: The feature type, like "background" or "top_edge".
+    :return: Feature2D, Feature1D or Feature.
+    """
+    if name in Feature2D.FEATURE_TYPES:
+        return Feature2D
+    if name in Feature1D.FEATURE_TYPES:
+        return Feature1D
+    return Feature
 
 
 if __name__ == "__main__":
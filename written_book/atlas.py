@@ -0,0 +1,291 @@
+import json
+import os
+import typing
+
+from PIL import Image, PngImagePlugin
+
+from .asset_resource import AssetResource, normalize_path, shared_asset_cache
+from .types import JSON
+
+__all__ = [
+    "Atlas",
+    "pack",
+    "page_path",
+]
+
+ATLAS_VERSION = 1
+INDEX_KEY = "written_book.atlas"
+DEFAULT_ATLAS_SIZE = 2048
+
+Box: typing.TypeAlias = typing.Tuple[int, int, int, int]
+
+
+def pack(
+    sizes: typing.Sequence[typing.Tuple[int, int]], max_size: int
+) -> typing.Tuple[
+    typing.List[typing.Tuple[int, int, int]], typing.List[typing.Tuple[int, int]]
+]:
+    """
+    Pack rectangles into as few pages as possible, using first-fit decreasing
+    height shelves: the tallest rectangles go first, each onto the first shelf
+    (row) with room left, and a new shelf (or page) is opened when none has.
+    :param sizes: (width, height) of every rectangle.
+    :param max_size: Maximum width and height of a page. A rectangle that is
+                     bigger than this gets a page of its own.
+    :return: (page, x, y) of every rectangle in the order given,
+             and the (width, height) every page needs to be.
+    """
+    order = sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], -sizes[i][0]))
+    placements: typing.List[typing.Tuple[int, int, int]] = [(0, 0, 0)] * len(sizes)
+    pages: typing.List[typing.Tuple[int, int]] = []
+    # per page: list of [shelf y, shelf height, used width]
+    shelves: typing.List[typing.List[typing.List[int]]] = []
+    for i in order:
+        width, height = sizes[i]
+        if width > max_size or height > max_size:
+            placements[i] = len(pages), 0, 0
+            pages.append((width, height))
+            shelves.append([])
+            continue
+        for page, page_shelves in enumerate(shelves):
+            if pages[page][0] > max_size or pages[page][1] > max_size:
+                continue  # oversized page, only holds the one rectangle
+            shelf = next(
+                (
+                    s
+                    for s in page_shelves
+                    if s[1] >= height and s[2] + width <= max_size
+                ),
+                None,
+            )
+            if shelf is None:
+                top = page_shelves[-1][0] + page_shelves[-1][1] if page_shelves else 0
+                if top + height > max_size:
+                    continue
+                shelf = [top, height, 0]
+                page_shelves.append(shelf)
+            placements[i] = page, shelf[2], shelf[0]
+            shelf[2] += width
+            pages[page] = (
+                max(pages[page][0], shelf[2]),
+                max(pages[page][1], shelf[0] + shelf[1]),
+            )
+            break
+        else:
+            placements[i] = len(pages), 0, 0
+            pages.append((width, height))
+            shelves.append([[0, height, width]])
+    return placements, pages
+
+
+def page_path(path: str, page: int) -> str:
+    """
+    Get the path of a page of a multi-page image, like an atlas.
+    :param path: Path of the first page.
+    :param page: Which page, from 0.
+    :return: The first path itself for page 0, else with the page number added
+             before the extension.
+    """
+    if page == 0:
+        return path
+    base, ext = os.path.splitext(path)
+    return f"{base}.{page}{ext}"
+
+
+def _box(value: JSON) -> Box:
+    left, top, right, bottom = typing.cast(typing.List[int], value)
+    return int(left), int(top), int(right), int(bottom)
+
+
+def _stamp(path: str) -> typing.List[int]:
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+class Atlas:
+    """
+    A set of asset regions packed into a few large images ("pages").
+    Pages are saved as PNGs, with the index of where every region went stored
+    in the first page, so a warm start only has to open one file.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        regions: typing.Dict[typing.Tuple[str, Box], typing.Tuple[int, Box]],
+        sources: typing.Dict[str, typing.List[int]],
+        page_count: int,
+    ):
+        """
+        :param path: Path of the first page.
+        :param regions: (source path, crop) -> (page, region in the page)
+        :param sources: source path -> [mtime_ns, size] when the atlas was built
+        :param page_count: How many pages there are.
+        """
+        self.path = normalize_path(path)
+        self.regions = regions
+        self.sources = sources
+        self.page_count = page_count
+
+    @property
+    def pages(self) -> typing.List[str]:
+        """
+        Paths of every page.
+        """
+        return [page_path(self.path, page) for page in range(self.page_count)]
+
+    @classmethod
+    def build(
+        cls,
+        resources: typing.Iterable[AssetResource],
+        path: str,
+        max_size: int = DEFAULT_ATLAS_SIZE,
+    ) -> "Atlas":
+        """
+        Pack the regions used by some resources into an atlas and save it.
+        Resources built from in-memory images, or with empty regions, are left out.
+        :param resources: The resources to pack.
+        :param path: Where to save the first page.
+        :param max_size: Maximum width and height of a page.
+        :return: The atlas. Use apply() to point resources at it.
+        """
+        keys: typing.Dict[typing.Tuple[str, Box], AssetResource] = {}
+        for resource in resources:
+            if resource.is_file and 0 not in resource.size:
+                keys.setdefault((resource.source_path, resource.crop), resource)
+        sources = {source: _stamp(source) for source, _ in keys}
+        placements, page_sizes = pack([r.size for r in keys.values()], max_size)
+
+        # even an empty atlas has a page, to keep the index in
+        pages = [Image.new("RGBA", size) for size in page_sizes or [(1, 1)]]
+        regions: typing.Dict[typing.Tuple[str, Box], typing.Tuple[int, Box]] = {}
+        for (key, resource), (page, x, y) in zip(keys.items(), placements):
+            width, height = resource.size
+            pages[page].paste(resource.get(), (x, y))
+            regions[key] = page, (x, y, x + width, y + height)
+
+        atlas = cls(path, regions, sources, len(pages))
+        os.makedirs(os.path.dirname(atlas.path), exist_ok=True)
+        for page, (page_file, image) in enumerate(zip(atlas.pages, pages)):
+            info = PngImagePlugin.PngInfo()
+            if page == 0:
+                info.add_itxt(INDEX_KEY, json.dumps(atlas._index()), zip=True)
+            image.save(page_file, pnginfo=info)
+            # the pages were just made, no need to decode them again
+            shared_asset_cache.put(page_file, image)
+        return atlas
+
+    def _index(self) -> typing.Dict[str, typing.Any]:
+        return {
+            "version": ATLAS_VERSION,
+            "pages": self.page_count,
+            "sources": self.sources,
+            "regions": [
+                [source, list(crop), page, list(region)]
+                for (source, crop), (page, region) in self.regions.items()
+            ],
+        }
+
+    @classmethod
+    def load(cls, path: str) -> typing.Optional["Atlas"]:
+        """
+        Load a saved atlas, without decoding any pages.
+        :param path: Path of the first page.
+        :return: The atlas, or None if there isn't one or a source changed since
+                 it was built.
+        """
+        path = normalize_path(path)
+        try:
+            with Image.open(path) as image:
+                raw = typing.cast(typing.Dict[str, str], image.info).get(INDEX_KEY)
+        except (FileNotFoundError, Image.UnidentifiedImageError):
+            return None
+        if raw is None:
+            return None
+        # a damaged index is the same as a missing one: build the atlas again
+        try:
+            atlas = cls._from_index(path, json.loads(raw))
+        except (ValueError, KeyError, TypeError):
+            return None
+        return atlas if atlas is not None and atlas.valid() else None
+
+    @classmethod
+    def _from_index(cls, path: str, index: JSON) -> typing.Optional["Atlas"]:
+        """
+        :return: The atlas, or None if the index is for another version.
+        :raise TypeError: or ValueError or KeyError, if the index is malformed.
+        """
+        if not isinstance(index, dict):
+            raise TypeError("the atlas index isn't an object")
+        if index.get("version") != ATLAS_VERSION:
+            return None
+        regions: typing.Dict[typing.Tuple[str, Box], typing.Tuple[int, Box]] = {}
+        for source, crop, page, region in typing.cast(
+            typing.List[typing.List[JSON]], index["regions"]
+        ):
+            key = str(source), _box(crop)
+            regions[key] = int(typing.cast(int, page)), _box(region)
+        stamps = index["sources"]
+        if not isinstance(stamps, dict):
+            raise TypeError("the atlas sources aren't an object")
+        sources: typing.Dict[str, typing.List[int]] = {}
+        for source, stamp in stamps.items():
+            mtime_ns, size = typing.cast(typing.List[int], stamp)
+            sources[source] = [int(mtime_ns), int(size)]
+        return cls(path, regions, sources, int(typing.cast(int, index["pages"])))
+
+    @classmethod
+    def load_or_build(
+        cls,
+        resources: typing.Iterable[AssetResource],
+        path: str,
+        max_size: int = DEFAULT_ATLAS_SIZE,
+    ) -> "Atlas":
+        """
+        Load the atlas at a path if it is still valid and covers every resource,
+        otherwise build it again. Either way, the resources are pointed at it.
+        :param resources: The resources to pack.
+        :param path: Path of the first page.
+        :param max_size: Maximum width and height of a page.
+        :return: The atlas.
+        """
+        resources = list(resources)
+        atlas = cls.load(path)
+        if atlas is None or not all(atlas.covers(r) for r in resources if r.is_file):
+            atlas = cls.build(resources, path, max_size)
+        atlas.apply(resources)
+        return atlas
+
+    def valid(self) -> bool:
+        """
+        Check that no source changed since the atlas was built and that every
+        page still exists. Only looks at file metadata.
+        """
+        try:
+            return all(
+                _stamp(source) == stamp for source, stamp in self.sources.items()
+            ) and all(os.path.isfile(page) for page in self.pages)
+        except FileNotFoundError:
+            return False
+
+    def covers(self, resource: AssetResource) -> bool:
+        """
+        Check if a resource's region is in the atlas (or already points at it).
+        """
+        return (
+            resource.source_path in self.pages
+            or (resource.source_path, resource.crop) in self.regions
+        )
+
+    def apply(self, resources: typing.Iterable[AssetResource]):
+        """
+        Point resources at their regions in the atlas instead of their own files.
+        Resources that aren't in the atlas are left alone.
+        :param resources: The resources to rewrite.
+        """
+        pages = self.pages
+        for resource in resources:
+            found = self.regions.get((resource.source_path, resource.crop))
+            if found is not None:
+                page, region = found
+                resource.relocate(pages[page], region)
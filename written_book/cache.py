@@ -0,0 +1,363 @@
+import collections
+import concurrent.futures
+import hashlib
+import os
+import typing
+
+from PIL import Image
+
+from .instrument import traced
+
+__all__ = [
+    "AssetCache",
+    "AssetCacheStats",
+    "CacheStats",
+    "LRUCache",
+    "image_nbytes",
+    "readonly_view",
+]
+
+K = typing.TypeVar("K", bound=typing.Hashable)
+V = typing.TypeVar("V")
+
+
+def image_nbytes(image: Image.Image) -> int:
+    """
+    Estimate how much memory the pixel data of an image takes up.
+    :param image: The image to measure.
+    :return: Size in bytes.
+    """
+    return image.width * image.height * len(image.getbands())
+
+
+def readonly_view(image: Image.Image) -> Image.Image:
+    """
+    Make a read-only copy of an image, to hand out an image that is shared.
+    Drawing on the copy (paste, ImageDraw, ...) works as usual and can never
+    change the original. Direct pixel access raises instead.
+    :param image: The image to copy.
+    :return: The copy.
+    """
+    view = image.copy()
+    view.readonly = 1
+    return view
+
+
+class CacheStats(typing.NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    nbytes: int
+    max_bytes: int
+
+
+class LRUCache(typing.Generic[K, V]):
+    """
+    Least-recently-used cache bounded by the total size of its values.
+    """
+
+    def __init__(self, max_bytes: int, sizeof: typing.Callable[[V], int]):
+        """
+        :param max_bytes: Byte budget. The least recently used entries are evicted
+                          to stay under it; a single value larger than the budget
+                          is never stored.
+        :param sizeof: Function to get the size in bytes of a value.
+        """
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._entries: "collections.OrderedDict[K, typing.Tuple[V, int]]" = (
+            collections.OrderedDict()
+        )
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._entries
+
+    def keys(self) -> typing.List[K]:
+        return list(self._entries.keys())
+
+    def get(self, key: K) -> typing.Optional[V]:
+        """
+        Look up a value, marking it as recently used.
+        :param key: The key to look up.
+        :return: The value, or None if it isn't cached.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: K, value: V):
+        """
+        Store a value, evicting older entries if the budget requires it.
+        :param key: The key to store the value under.
+        :param value: The value.
+        """
+        self.evict(key)
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = value, size
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, (_, old_size) = self._entries.popitem(last=False)
+            self.nbytes -= old_size
+            self.evictions += 1
+
+    def evict(self, key: K) -> bool:
+        """
+        Remove a single entry.
+        :param key: The key to remove.
+        :return: True if something was removed.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self.nbytes -= entry[1]
+        return True
+
+    def clear(self):
+        """
+        Remove every entry. Statistics are kept.
+        """
+        self._entries.clear()
+        self.nbytes = 0
+
+    @property
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            self.hits,
+            self.misses,
+            self.evictions,
+            len(self._entries),
+            self.nbytes,
+            self.max_bytes,
+        )
+
+
+class AssetCacheStats(typing.NamedTuple):
+    hits: int
+    misses: int
+    stale: int
+    evictions: int
+    entries: int
+    nbytes: int
+    max_bytes: int
+
+
+class AssetCache:
+    """
+    Cache of decoded RGBA images, keyed by normalized file path.
+    Entries are checked against the file on disk every lookup, so edited files are
+    decoded again instead of being served stale.
+    """
+
+    VALIDATION_MODES = ("stat", "hash")
+
+    def __init__(self, max_bytes: int, validate: str = "stat"):
+        """
+        :param max_bytes: Byte budget for decoded images.
+        :param validate: How to notice changed files. "stat" compares modification
+                         time and size, "hash" compares a hash of the contents
+                         (slower, but catches edits that keep the timestamp).
+        """
+        if validate not in self.VALIDATION_MODES:
+            raise ValueError(
+                f"validate must be one of {', '.join(self.VALIDATION_MODES)}, not {validate}"
+            )
+        self.validate = validate
+        # whole sources are keyed by path, cropped regions by (path, box)
+        self._images: LRUCache[
+            str | typing.Tuple[str, typing.Tuple[int, int, int, int]],
+            typing.Tuple[Image.Image, typing.Tuple[int, ...] | str],
+        ] = LRUCache(max_bytes, lambda entry: image_nbytes(entry[0]))
+        # get() and get_crop() calls served without and with decoding; preload()
+        # and the lookups get_crop() makes along the way don't count
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        # goes up whenever entries are replaced or dropped on purpose, so anything
+        # holding on to an image from this cache knows to look it up again
+        self.generation = 0
+
+    @property
+    def max_bytes(self) -> int:
+        return self._images.max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, value: int):
+        self._images.max_bytes = value
+
+    def __len__(self) -> int:
+        return len(self._images)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._images
+
+    def _stamp(self, path: str) -> typing.Tuple[int, ...] | str:
+        """
+        Identify the current version of a file.
+        :param path: The file.
+        :return: Something that changes whenever the file does.
+        """
+        if self.validate == "hash":
+            with open(path, "rb") as f:
+                return hashlib.sha256(f.read()).hexdigest()
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    @traced("asset.decode")
+    def decode(path: str) -> Image.Image:
+        """
+        Read an image from disk as RGBA, without touching the cache.
+        :param path: The file.
+        :return: The fully loaded image.
+        """
+        with Image.open(path) as source:
+            image = source.convert("RGBA")
+        image.load()
+        return image
+
+    def get(self, path: str) -> Image.Image:
+        """
+        Get the decoded image for a file, decoding it if it isn't cached or the
+        file changed since.
+        :param path: Normalized path to the file.
+        :return: The image.
+        """
+        image, decoded = self._get(path, self._stamp(path))
+        self._count(decoded)
+        return image
+
+    def _count(self, decoded: bool):
+        if decoded:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+    def _get(
+        self, path: str, stamp: typing.Tuple[int, ...] | str
+    ) -> typing.Tuple[Image.Image, bool]:
+        """
+        :return: The image, and whether it had to be decoded.
+        """
+        entry = self._images.get(path)
+        if entry is not None:
+            if entry[1] == stamp:
+                return entry[0], False
+            self.stale += 1
+        image = self.decode(path)
+        self._images.put(path, (image, stamp))
+        return image, True
+
+    def get_crop(self, path: str, box: typing.Tuple[int, int, int, int]) -> Image.Image:
+        """
+        Get a region of the decoded image for a file.
+        Regions are cached alongside (and count towards the same budget as) the
+        whole images, so resources cropping the same region share one copy.
+        :param path: Normalized path to the file.
+        :param box: The region, as for Image.crop.
+        :return: The cropped image. Don't modify it.
+        """
+        stamp = self._stamp(path)
+        key = path, box
+        entry = self._images.get(key)
+        if entry is not None:
+            if entry[1] == stamp:
+                self._count(False)
+                return entry[0]
+            self.stale += 1
+        source, decoded = self._get(path, stamp)
+        self._count(decoded)
+        if box == (0, 0, source.width, source.height):
+            # no point in storing the same pixels twice
+            return source
+        cropped = source.crop(box)
+        self._images.put(key, (cropped, stamp))
+        return cropped
+
+    def preload(
+        self, paths: typing.Iterable[str], workers: typing.Optional[int] = None
+    ) -> int:
+        """
+        Decode several files at once on a thread pool (Pillow releases the GIL
+        while decoding). Files that are cached and unchanged are skipped, and
+        each file is only decoded once however many times it is listed.
+        If any file fails to decode, the error for the first one (in the order
+        given) is raised after every decode has finished.
+        :param paths: Normalized paths to the files.
+        :param workers: Number of threads, defaults to the thread pool default.
+        :return: How many files were decoded.
+        """
+        pending: typing.Dict[str, typing.Tuple[int, ...] | str] = {}
+        for path in paths:
+            if path in pending:
+                continue
+            stamp = self._stamp(path)
+            entry = self._images.get(path)
+            if entry is not None and entry[1] == stamp:
+                continue
+            if entry is not None:
+                self.stale += 1
+            pending[path] = stamp
+        if not pending:
+            return 0
+        with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+            futures = {path: pool.submit(self.decode, path) for path in pending}
+            concurrent.futures.wait(futures.values())
+        for path, future in futures.items():
+            self._images.put(path, (future.result(), pending[path]))
+        return len(pending)
+
+    def put(self, path: str, image: Image.Image):
+        """
+        Store an image that was decoded elsewhere, stamped with the file's
+        current version.
+        :param path: Normalized path to the file the image came from.
+        :param image: The image.
+        """
+        self.generation += 1
+        self._images.put(path, (image, self._stamp(path)))
+
+    def evict(self, path: str) -> bool:
+        """
+        Forget a single file, including any regions cropped from it.
+        :param path: Normalized path to the file.
+        :return: True if it was cached.
+        """
+        self.generation += 1
+        for key in self._images.keys():
+            if isinstance(key, tuple) and key[0] == path:
+                self._images.evict(key)
+        return self._images.evict(path)
+
+    def clear(self):
+        """
+        Forget every file. Statistics are kept.
+        """
+        self.generation += 1
+        self._images.clear()
+
+    @property
+    def stats(self) -> AssetCacheStats:
+        images = self._images.stats
+        return AssetCacheStats(
+            self.hits,
+            self.misses,
+            self.stale,
+            images.evictions,
+            images.entries,
+            images.nbytes,
+            images.max_bytes,
+        )
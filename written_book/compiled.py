@@ -0,0 +1,701 @@
+import functools
+import hashlib
+import json
+import os
+import struct
+import time
+import typing
+
+from PIL import Image
+
+from .asset_resource import (
+    Anchor2D,
+    AssetResource,
+    Feature,
+    Feature1D,
+    Feature1DOverride,
+    Feature2D,
+    Feature2DOverride,
+    Overlay,
+    feature_class,
+    normalize_path,
+    shared_asset_cache,
+)
+from .cache import AssetCache, LRUCache
+from .exceptions import ValidationError, ValidationErrorGroup
+from .instrument import traced
+from .schema import Validator, theme_schema
+from .types import JSON, JSONObject
+
+__all__ = [
+    "CompiledTheme",
+    "ValidatedTheme",
+    "check_theme",
+    "compile_theme",
+    "load_theme",
+    "load_theme_document",
+    "theme_digest",
+    "validate_theme",
+]
+
+T = typing.TypeVar("T")
+
+MAGIC = b"WBTHEME1"
+EXTENSION = ".wbtheme"
+_HEADER_LENGTH = struct.Struct("<I")
+
+
+def _sourced_entries(document: JSON) -> typing.Iterator[JSONObject]:
+    """
+    Find everything in a theme document that has a "source", without validating it.
+    :param document: The theme document.
+    :return: The entries: features, their overrides, overrides and overlays.
+    """
+    if not isinstance(document, dict):
+        return
+    for section in ("features", "overrides", "overlays"):
+        entries = document.get(section, [])
+        if not isinstance(entries, list):
+            continue
+        for entry in entries:
+            if not isinstance(entry, dict):
+                continue
+            yield entry
+            nested = entry.get("overrides", [])
+            if isinstance(nested, list):
+                yield from (o for o in nested if isinstance(o, dict))
+
+
+def _resolve(source: str, theme_directory: str) -> str:
+    if not os.path.isabs(source):
+        source = os.path.join(theme_directory, source)
+    return normalize_path(source)
+
+
+# remembers the contents hash of every asset by stamp, see theme_digest()
+HASHES = "asset-hashes.json"
+
+# files modified this recently might be modified again without their
+# modification time changing, so their hashes aren't remembered yet
+_RACY_NS = 2_000_000_000
+
+# how many asset hashes and cache directories a process remembers at most
+MAX_HASHES = 4096
+MAX_HASH_DIRECTORIES = 16
+
+# path -> (modification time in ns, size, sha256 of the contents)
+_hashes: LRUCache[str, typing.Tuple[int, int, str]] = LRUCache(MAX_HASHES, lambda _: 1)
+# cache directory -> the paths in its HASHES, once read into _hashes
+_stored: LRUCache[str, typing.Set[str]] = LRUCache(MAX_HASH_DIRECTORIES, lambda _: 1)
+
+
+def _load_hashes(cache_directory: str) -> typing.Set[str]:
+    known = _stored.get(cache_directory)
+    if known is not None:
+        return known
+    paths: typing.Set[str] = set()
+    _stored.put(cache_directory, paths)
+    try:
+        with open(os.path.join(cache_directory, HASHES)) as f:
+            stored: JSON = json.load(f)
+    except (OSError, ValueError):
+        return paths
+    if not isinstance(stored, dict):
+        return paths
+    for path, entry in stored.items():
+        if not isinstance(entry, list) or len(entry) != 3:
+            continue
+        mtime, size, digest = entry
+        if isinstance(mtime, int) and isinstance(size, int) and isinstance(digest, str):
+            paths.add(path)
+            if path not in _hashes:
+                _hashes.put(path, (mtime, size, digest))
+    return paths
+
+
+def _save_hashes(cache_directory: str, paths: typing.Set[str]):
+    # forget assets that are gone, so the file doesn't grow forever
+    entries: typing.Dict[str, typing.Tuple[int, int, str]] = {}
+    for path in sorted(paths):
+        known = _hashes.get(path)
+        if known is not None and os.path.exists(path):
+            entries[path] = known
+    paths.intersection_update(entries)
+    os.makedirs(cache_directory, exist_ok=True)
+    path = os.path.join(cache_directory, HASHES)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(entries, f)
+    os.replace(temporary, path)
+
+
+def _content_hash(path: str) -> typing.Tuple[typing.Optional[str], bool]:
+    """
+    Hash the contents of a file, only reading it if its modification time or
+    size changed since it was last hashed, like AssetCache's "stat" validation.
+    :return: The hex digest, or None if the file is missing, and whether the
+             file had to be read.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None, False
+    known = _hashes.get(path)
+    if known is not None and known[:2] == (stat.st_mtime_ns, stat.st_size):
+        return known[2], False
+    try:
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None, False
+    if time.time_ns() - stat.st_mtime_ns > _RACY_NS:
+        _hashes.put(path, (stat.st_mtime_ns, stat.st_size, digest))
+    else:
+        _hashes.evict(path)
+    return digest, True
+
+
+def theme_digest(theme_path: str, cache_directory: typing.Optional[str] = None) -> str:
+    """
+    Hash a theme file together with the contents of every asset it references.
+    Assets are only read again when their modification time or size changed
+    since they were last hashed.
+    :param theme_path: Path to the theme JSON.
+    :param cache_directory: Where to remember the hashes of the assets for the
+                            next process, or None to only remember them in this one.
+    :return: Hex digest; changes whenever the theme or any of its assets do.
+    """
+    theme_directory = os.path.dirname(normalize_path(theme_path))
+    with open(theme_path, "rb") as f:
+        raw = f.read()
+    digest = hashlib.sha256(raw)
+    sources: typing.Set[str] = set()
+    try:
+        document = json.loads(raw)
+    except ValueError:
+        document = None
+    for entry in _sourced_entries(document):
+        source = entry.get("source")
+        if isinstance(source, str):
+            sources.add(_resolve(source, theme_directory))
+    stored: typing.Set[str] = (
+        set() if cache_directory is None else _load_hashes(cache_directory)
+    )
+    changed = False
+    for source in sorted(sources):
+        digest.update(b"\0" + source.encode())
+        content, read = _content_hash(source)
+        changed = changed or read
+        digest.update(b"\0missing" if content is None else bytes.fromhex(content))
+    if cache_directory is not None and (changed or not sources <= stored):
+        stored.update(sources)
+        _save_hashes(cache_directory, stored)
+    return digest.hexdigest()
+
+
+THEME_SECTIONS = theme_schema.validator(
+    {
+        "type": "object",
+        "properties": {
+            "features": {"type": "array"},
+            "overrides": {"type": "array"},
+            "overlays": {"type": "array"},
+            "colors": {"type": "object"},
+        },
+    }
+)
+OVERRIDE = theme_schema.validator(
+    {
+        "type": "object",
+        "properties": {"feature": {"type": "string"}},
+        "required": ["feature"],
+    }
+)
+
+
+class _Problems:
+    """
+    Runs validators over the entries of a theme, either raising the first
+    problem or collecting all of them.
+    """
+
+    def __init__(self, all_errors: bool):
+        self.all_errors = all_errors
+        self.errors: typing.List[ValidationError] = []
+
+    def check(self, validator: Validator, value: JSON, label: str) -> bool:
+        """
+        Run a compiled schema validator.
+        :return: True if the value passed.
+        """
+        if not self.all_errors:
+            validator(value, label)
+            return True
+        found = validator.errors(value, label)
+        self.errors.extend(found)
+        return not found
+
+    def run(self, label: str, function: typing.Callable[[], typing.Any]) -> bool:
+        """
+        Run a check that raises ValidationError.
+        :return: True if it passed.
+        """
+        try:
+            function()
+        except ValidationError as e:
+            self._failed(label, e)
+            return False
+        return True
+
+    def build(self, label: str, function: typing.Callable[[], T]) -> typing.Optional[T]:
+        """
+        Run an import_, keeping what it built.
+        :return: The built object, or None if it failed.
+        """
+        try:
+            return function()
+        except ValidationError as e:
+            self._failed(label, e)
+            return None
+
+    def _failed(self, label: str, error: ValidationError):
+        if not self.all_errors:
+            raise error
+        self.errors.append(
+            ValidationError(f"{label}: {error.message}", error.error_code)
+        )
+
+    def report(self, message: str, error_code: ValidationError.ErrorCode):
+        """
+        Report a problem found outside of any validator.
+        """
+        error = ValidationError(message, error_code)
+        if not self.all_errors:
+            raise error
+        self.errors.append(error)
+
+    def raise_found(self):
+        if len(self.errors) == 1:
+            raise self.errors[0]
+        if self.errors:
+            raise ValidationErrorGroup(self.errors)
+
+
+class ValidatedTheme(typing.NamedTuple):
+    """
+    A validated theme document, along with the features and overlays it describes.
+    """
+
+    # the document, with absolute sources
+    document: JSONObject
+    # by feature type, with the top-level overrides attached
+    features: typing.Dict[str, Feature]
+    overlays: typing.List[Overlay]
+
+
+@traced("theme.validate")
+def check_theme(
+    document: JSON, theme_directory: str, all_errors: bool = True
+) -> ValidatedTheme:
+    """
+    Run every import_ check over a theme document, validating each entry against
+    its schema once. The objects built by the checks are kept, so nothing has to
+    be built, or have its header read, a second time.
+    :param document: The theme document, by json.load[s].
+    :param theme_directory: Directory that sources are relative to.
+    :param all_errors: Find every problem in one pass and raise them together as a
+                       ValidationErrorGroup (a single problem is raised as is),
+                       instead of stopping at the first one.
+    :return: The document, with every source made absolute, and its objects.
+    """
+    problems = _Problems(all_errors)
+    if not problems.check(THEME_SECTIONS, document, "JSON body for Theme"):
+        if not isinstance(document, dict):
+            problems.raise_found()
+    document = typing.cast(JSONObject, document)
+    sections: typing.Dict[str, typing.List[JSON]] = {}
+    for section in ("features", "overrides", "overlays"):
+        entries = document.get(section, [])
+        # a section of the wrong type was reported above
+        sections[section] = entries if isinstance(entries, list) else []
+
+    features: typing.Dict[str, Feature] = {}
+    declared: typing.Set[str] = set()
+    for i, feature in enumerate(sections["features"]):
+        label = f"Theme features[{i}]"
+        name = feature.get("feature") if isinstance(feature, dict) else None
+        kind = feature_class(name if isinstance(name, str) else "")
+        if not problems.check(kind.SCHEMA, feature, label):
+            continue
+        built = problems.build(
+            label,
+            lambda: kind.from_validated(
+                typing.cast(JSONObject, feature), theme_directory
+            ),
+        )
+        if built is None:
+            continue
+        name = typing.cast(str, name)
+        if name in declared:
+            problems.report(
+                f'Theme has more than one "{name}" feature.',
+                ValidationError.ErrorCode.INVALID_VALUE,
+            )
+        declared.add(name)
+        features[name] = built
+    # top-level overrides, attached once every feature is built
+    attached: typing.Dict[str, typing.List[Feature2DOverride | Feature1DOverride]] = {}
+    for i, override in enumerate(sections["overrides"]):
+        label = f"Theme overrides[{i}]"
+        if not problems.check(OVERRIDE, override, label):
+            continue
+        name = typing.cast(str, typing.cast(JSONObject, override)["feature"])
+        if name not in declared:
+            problems.report(
+                f'{label} is for the "{name}" feature, which the theme doesn\'t have.',
+                ValidationError.ErrorCode.INVALID_VALUE,
+            )
+            continue
+        kind = feature_class(name)
+        override_kind: typing.Type[Feature2DOverride | Feature1DOverride]
+        if kind is Feature2D:
+            override_kind = Feature2DOverride
+        elif kind is Feature1D:
+            override_kind = Feature1DOverride
+        else:
+            problems.report(
+                f'{label} is for the "{name}" feature, which isn\'t tiled.',
+                ValidationError.ErrorCode.INVALID_VALUE,
+            )
+            continue
+        if not problems.check(override_kind.SCHEMA, override, label):
+            continue
+        built = problems.build(
+            label,
+            lambda: override_kind.from_validated(
+                typing.cast(JSONObject, override), theme_directory
+            ),
+        )
+        if built is None:
+            continue
+        feature = features[name]
+        if isinstance(feature, Feature2D) and not problems.run(
+            label,
+            functools.partial(
+                feature.check_override, typing.cast(Feature2DOverride, built)
+            ),
+        ):
+            continue
+        attached.setdefault(name, []).append(built)
+    overlays: typing.List[Overlay] = []
+    for i, overlay in enumerate(sections["overlays"]):
+        label = f"Theme overlays[{i}]"
+        if not problems.check(Overlay.SCHEMA, overlay, label):
+            continue
+        built = problems.build(
+            label,
+            lambda: Overlay.from_validated(
+                typing.cast(JSONObject, overlay), theme_directory
+            ),
+        )
+        if built is not None:
+            overlays.append(built)
+    problems.raise_found()
+
+    for name, extra in attached.items():
+        feature = features[name]
+        if isinstance(feature, Feature2D):
+            extra_2d = typing.cast(typing.List[Feature2DOverride], extra)
+            feature.set_overrides([*feature.overrides.values(), *extra_2d])
+        elif isinstance(feature, Feature1D):
+            extra_1d = typing.cast(typing.List[Feature1DOverride], extra)
+            feature.set_overrides([*feature.overrides.values(), *extra_1d])
+    normalized = typing.cast(JSONObject, json.loads(json.dumps(document)))
+    for entry in _sourced_entries(normalized):
+        entry["source"] = _resolve(typing.cast(str, entry["source"]), theme_directory)
+    return ValidatedTheme(normalized, features, overlays)
+
+
+def validate_theme(
+    document: JSON, theme_directory: str, all_errors: bool = True
+) -> JSONObject:
+    """
+    Validate a theme document, see check_theme().
+    :param document: The theme document, by json.load[s].
+    :param theme_directory: Directory that sources are relative to.
+    :param all_errors: Raise every problem at once, see check_theme().
+    :return: The same document, with every source made absolute.
+    """
+    return check_theme(document, theme_directory, all_errors).document
+
+
+def _resource(entry: JSONObject) -> AssetResource:
+    crop = entry.get("crop")
+    if not crop:
+        return AssetResource(typing.cast(str, entry["source"]))
+    left, top, right, bottom = typing.cast(typing.List[int], crop)
+    return AssetResource(typing.cast(str, entry["source"]), (left, top, right, bottom))
+
+
+def _override_2d(entry: JSONObject) -> Feature2DOverride:
+    x, y = typing.cast(typing.List[float], entry["index"])
+    return Feature2DOverride(_resource(entry), int(x), int(y))
+
+
+def _override_1d(entry: JSONObject) -> Feature1DOverride:
+    return Feature1DOverride(_resource(entry), int(typing.cast(float, entry["index"])))
+
+
+def _build_feature(entry: JSONObject, overrides: typing.List[JSONObject]) -> Feature:
+    """
+    Build a feature from an already validated entry.
+    :param entry: The feature's entry in the theme document.
+    :param overrides: Top-level overrides for this feature.
+    :return: The feature.
+    """
+    name = typing.cast(str, entry["feature"])
+    kind = feature_class(name)
+    nested = typing.cast(typing.List[JSONObject], entry.get("overrides", []))
+    if kind is Feature2D:
+        return Feature2D(
+            _resource(entry),
+            typing.cast(str, entry.get("justify", "top left")),
+            [_override_2d(o) for o in nested + overrides],
+        )
+    if kind is Feature1D:
+        return Feature1D(
+            _resource(entry),
+            typing.cast(str, entry.get("justify", "start")),
+            Feature1D.direction_of(name),
+            [_override_1d(o) for o in nested + overrides],
+        )
+    return Feature(_resource(entry))
+
+
+def _overlay(entry: JSONObject) -> Overlay:
+    return Overlay(
+        _resource(entry),
+        Anchor2D.mode_word[typing.cast(str, entry.get("mode", "inside"))],
+        Anchor2D.parse(typing.cast(str, entry["anchor"])),
+        typing.cast(bool, entry.get("above", False)),
+    )
+
+
+def _build_theme(document: JSONObject) -> ValidatedTheme:
+    """
+    Build the objects of a document that was validated before, like one from a
+    compiled theme.
+    :param document: The validated document, with absolute sources.
+    :return: The document and its objects.
+    """
+    overrides: typing.Dict[str, typing.List[JSONObject]] = {}
+    for override in typing.cast(typing.List[JSONObject], document.get("overrides", [])):
+        overrides.setdefault(typing.cast(str, override["feature"]), []).append(override)
+    features: typing.Dict[str, Feature] = {}
+    for entry in typing.cast(typing.List[JSONObject], document.get("features", [])):
+        name = typing.cast(str, entry["feature"])
+        features[name] = _build_feature(entry, overrides.get(name, []))
+    overlays = [
+        _overlay(overlay)
+        for overlay in typing.cast(
+            typing.List[JSONObject], document.get("overlays", [])
+        )
+    ]
+    return ValidatedTheme(document, features, overlays)
+
+
+class CompiledTheme:
+    """
+    A validated theme document, along with the decoded pixels of every asset it uses.
+    Saved as one binary file: a JSON header followed by raw RGBA buffers.
+    """
+
+    def __init__(
+        self, digest: str, document: JSONObject, images: typing.Dict[str, Image.Image]
+    ):
+        """
+        :param digest: theme_digest() of the theme this was compiled from.
+        :param document: The validated document, with absolute sources.
+        :param images: Decoded RGBA image for every source path.
+        """
+        self.digest = digest
+        self.document = document
+        self.images = images
+
+    def save(self, path: str):
+        """
+        Write the compiled theme to a file.
+        :param path: Where to write it.
+        """
+        entries: typing.List[JSONObject] = []
+        buffers: typing.List[bytes] = []
+        offset = 0
+        for source, image in self.images.items():
+            data = image.tobytes()
+            entries.append(
+                {
+                    "source": source,
+                    "size": list(image.size),
+                    "offset": offset,
+                    "length": len(data),
+                }
+            )
+            buffers.append(data)
+            offset += len(data)
+        header = json.dumps(
+            {"digest": self.digest, "document": self.document, "images": entries}
+        ).encode()
+        os.makedirs(os.path.dirname(normalize_path(path)), exist_ok=True)
+        # write to the side and swap it in, so readers never see half a file
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(MAGIC)
+            f.write(_HEADER_LENGTH.pack(len(header)))
+            f.write(header)
+            for data in buffers:
+                f.write(data)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: str) -> typing.Optional["CompiledTheme"]:
+        """
+        Read a compiled theme with a single read. The images share memory with
+        the file contents and are read-only.
+        :param path: The file to read.
+        :return: The compiled theme, or None if the file is missing, truncated or
+                 not one.
+        """
+        try:
+            with open(path, "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return None
+        start = len(MAGIC) + _HEADER_LENGTH.size
+        if len(raw) < start or not raw.startswith(MAGIC):
+            return None
+        (header_length,) = _HEADER_LENGTH.unpack_from(raw, len(MAGIC))
+        data = memoryview(raw)[start + header_length :]
+        images: typing.Dict[str, Image.Image] = {}
+        # a damaged file is the same as a missing one: compile the theme again
+        try:
+            header = typing.cast(
+                JSONObject, json.loads(raw[start : start + header_length])
+            )
+            digest = typing.cast(str, header["digest"])
+            document = typing.cast(JSONObject, header["document"])
+            for entry in typing.cast(typing.List[JSONObject], header["images"]):
+                width, height = typing.cast(typing.List[int], entry["size"])
+                offset = typing.cast(int, entry["offset"])
+                length = typing.cast(int, entry["length"])
+                if offset + length > len(data):
+                    return None
+                # any buffer works, and this one shares memory with the file
+                buffer = typing.cast(bytes, data[offset : offset + length])
+                images[typing.cast(str, entry["source"])] = Image.frombuffer(
+                    "RGBA",
+                    (width, height),
+                    buffer,
+                    "raw",
+                    "RGBA",
+                    0,
+                    1,
+                )
+        except (ValueError, KeyError, TypeError):
+            return None
+        return cls(digest, document, images)
+
+    def install(self, cache: AssetCache = shared_asset_cache):
+        """
+        Put the decoded images into an asset cache, so nothing has to be decoded.
+        :param cache: The cache to fill.
+        """
+        for source, image in self.images.items():
+            cache.put(source, image)
+
+
+def compile_theme(
+    theme_path: str,
+    workers: typing.Optional[int] = None,
+    digest: typing.Optional[str] = None,
+) -> CompiledTheme:
+    """
+    Validate a theme and decode all of its assets.
+    :param theme_path: Path to the theme JSON.
+    :param workers: Number of decoding threads, see AssetCache.preload().
+    :param digest: theme_digest() of the theme, if it is already known.
+    :return: The compiled theme.
+    """
+    digest = digest or theme_digest(theme_path)
+    with open(theme_path) as f:
+        document: JSON = json.load(f)
+    theme_directory = os.path.dirname(normalize_path(theme_path))
+    normalized = validate_theme(document, theme_directory)
+    sources = sorted(
+        {typing.cast(str, e["source"]) for e in _sourced_entries(normalized)}
+    )
+    shared_asset_cache.preload(sources, workers)
+    images = {source: shared_asset_cache.get(source) for source in sources}
+    # spell out the default crops, so loading doesn't have to read PNG headers
+    for entry in _sourced_entries(normalized):
+        if "crop" not in entry:
+            entry["crop"] = [0, 0, *images[typing.cast(str, entry["source"])].size]
+    return CompiledTheme(digest, normalized, images)
+
+
+def _check_file(theme_path: str) -> ValidatedTheme:
+    # nothing to save, so leave decoding until the assets are used
+    with open(theme_path) as f:
+        document: JSON = json.load(f)
+    return check_theme(document, os.path.dirname(normalize_path(theme_path)))
+
+
+def load_theme(
+    theme_path: str,
+    cache_directory: typing.Optional[str] = None,
+    workers: typing.Optional[int] = None,
+) -> ValidatedTheme:
+    """
+    Load a theme, see load_theme_document(). Without a cache directory, the
+    objects built while validating the theme are used as they are.
+    :param theme_path: Path to the theme JSON.
+    :param cache_directory: Where compiled themes are kept, or None to not cache.
+    :param workers: Number of decoding threads, see AssetCache.preload().
+    :return: The validated document, with absolute sources, and its objects.
+    """
+    if cache_directory is None:
+        return _check_file(theme_path)
+    # compiled documents spell out every crop, so building reads no headers
+    return _build_theme(load_theme_document(theme_path, cache_directory, workers))
+
+
+def load_theme_document(
+    theme_path: str,
+    cache_directory: typing.Optional[str] = None,
+    workers: typing.Optional[int] = None,
+) -> JSONObject:
+    """
+    Get the validated document of a theme, using a compiled theme from the cache
+    directory when neither the theme nor its assets changed. With a cache
+    directory, the assets also end up decoded in shared_asset_cache.
+    :param theme_path: Path to the theme JSON.
+    :param cache_directory: Where compiled themes are kept, or None to not cache.
+    :param workers: Number of decoding threads, see AssetCache.preload().
+    :return: The validated document, with absolute sources.
+    """
+    if cache_directory is None:
+        return _check_file(theme_path).document
+    digest = theme_digest(theme_path, cache_directory)
+    # one file per theme: the prefix identifies the theme, the rest its contents
+    prefix = hashlib.sha256(normalize_path(theme_path).encode()).hexdigest()[:16] + "-"
+    path = os.path.join(cache_directory, prefix + digest + EXTENSION)
+    compiled = CompiledTheme.load(path)
+    if compiled is not None and compiled.digest == digest:
+        compiled.install()
+        return compiled.document
+    compiled = compile_theme(theme_path, workers, digest)
+    if os.path.isdir(cache_directory):
+        for name in os.listdir(cache_directory):
+            if name.startswith(prefix) and name.endswith(EXTENSION):
+                os.remove(os.path.join(cache_directory, name))
+    compiled.save(path)
+    return compiled.document
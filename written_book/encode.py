@@ -0,0 +1,152 @@
+import concurrent.futures
+import io
+import typing
+
+import numpy as np
+from PIL import Image
+
+from .instrument import traced
+
+__all__ = [
+    "COMPRESSION_PROFILES",
+    "DEFAULT_COMPRESSION",
+    "MAX_PALETTE_COLORS",
+    "CompressionProfile",
+    "Encoder",
+    "exact_palette",
+    "png_bytes",
+]
+
+# the most colors a paletted PNG can have
+MAX_PALETTE_COLORS = 256
+
+
+class CompressionProfile(typing.NamedTuple):
+    """
+    How hard to try to make PNG files small. Every profile is lossless: the
+    files decode to exactly the pixels that were encoded.
+    """
+
+    # zlib level, from 0 (no compression) to 9 (smallest)
+    level: int = 6
+    # let Pillow try every PNG filter, which is much slower
+    optimize: bool = False
+    # write images with few enough colors as paletted PNGs, see exact_palette()
+    palette: bool = True
+
+
+# name -> profile, for the "compression" option
+COMPRESSION_PROFILES: typing.Dict[str, CompressionProfile] = {
+    "speed": CompressionProfile(1),
+    "balanced": CompressionProfile(6),
+    "size": CompressionProfile(9, optimize=True),
+}
+DEFAULT_COMPRESSION = "balanced"
+
+
+@traced("render.quantize")
+def exact_palette(image: Image.Image) -> typing.Optional[Image.Image]:
+    """
+    Convert an image to a paletted one, if it has few enough colors that every
+    one of them, alpha included, can be in the palette. Nothing is ever rounded
+    to a nearby color, so the paletted image looks exactly the same.
+    :param image: An RGB or RGBA image.
+    :return: A "P" image with transparency in its info, or None if the image has
+             too many colors, or isn't RGB or RGBA.
+    """
+    if image.mode not in ("RGB", "RGBA"):
+        return None
+    colors = image.getcolors(MAX_PALETTE_COLORS)
+    if colors is None:
+        return None
+    rgba = image if image.mode == "RGBA" else image.convert("RGBA")
+    palette = np.array([color for _, color in colors], dtype=np.uint8)
+    if palette.shape[1] == 3:
+        palette = np.pad(palette, ((0, 0), (0, 1)), constant_values=255)
+    # opaque colors last, so the alpha of the palette can stop before them
+    palette = palette[np.argsort(palette[:, 3] == 255, kind="stable")]
+    # every RGBA color as a single number, to look pixels up in the palette
+    keys = palette.view(np.uint32)[:, 0]
+    pixels = np.asarray(rgba).view(np.uint32)[..., 0]
+    order = np.argsort(keys)
+    indices = order[np.searchsorted(keys, pixels, sorter=order)]
+    paletted = Image.frombytes("P", image.size, indices.astype(np.uint8).tobytes())
+    paletted.putpalette(palette[:, :3].tobytes())
+    transparent = int(np.count_nonzero(palette[:, 3] != 255))
+    if transparent:
+        paletted.info["transparency"] = palette[:transparent, 3].tobytes()
+    return paletted
+
+
+@traced("render.encode")
+def png_bytes(
+    image: Image.Image,
+    profile: CompressionProfile = COMPRESSION_PROFILES[DEFAULT_COMPRESSION],
+) -> bytes:
+    """
+    Encode a rendered page as a PNG file.
+    :param image: The page.
+    :param profile: How hard to compress it.
+    :return: The contents of the file.
+    """
+    if profile.palette:
+        image = exact_palette(image) or image
+    buffer = io.BytesIO()
+    image.save(buffer, "png", compress_level=profile.level, optimize=profile.optimize)
+    return buffer.getvalue()
+
+
+class Encoder:
+    """
+    Encodes images as PNG files on a pool of threads, so that pages can be
+    encoded while the next one is rendering. Pillow lets go of the GIL while
+    zlib compresses, so the threads really do run at the same time.
+    """
+
+    def __init__(
+        self,
+        profile: CompressionProfile = COMPRESSION_PROFILES[DEFAULT_COMPRESSION],
+        threads: int = 0,
+    ):
+        """
+        :param profile: How hard to compress.
+        :param threads: How many images to encode at once; 0 encodes each one in
+                        the calling thread, as it is submitted.
+        """
+        if threads < 0:
+            raise ValueError(f"threads must be at least 0, not {threads}")
+        self.profile = profile
+        self.threads = threads
+        self._executor = (
+            concurrent.futures.ThreadPoolExecutor(
+                threads, thread_name_prefix="written_book.encode"
+            )
+            if threads
+            else None
+        )
+
+    def __enter__(self) -> "Encoder":
+        return self
+
+    def __exit__(self, *args: typing.Any):
+        self.close()
+
+    def close(self):
+        """
+        Wait for the images being encoded, and stop the threads.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def submit(self, image: Image.Image) -> "concurrent.futures.Future[bytes]":
+        """
+        Start encoding an image. The image can be closed as soon as this returns:
+        the threads encode a copy of it.
+        :param image: The image.
+        :return: The contents of the PNG file, when it is done.
+        """
+        if self._executor is None:
+            future: "concurrent.futures.Future[bytes]" = concurrent.futures.Future()
+            future.set_result(png_bytes(image, self.profile))
+            return future
+        return self._executor.submit(png_bytes, image.copy(), self.profile)
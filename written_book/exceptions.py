@@ -1,3 +1,4 @@
+import typing
 from enum import Enum
 
 
@@ -19,4 +20,23 @@ class ValidationError(ValueError):
                 message,
             )
         )
+        self.message = message
         self.error_code = error_code
+
+
+class ValidationErrorGroup(ValidationError):
+    """
+    Several problems found in one pass, like every problem in a theme file.
+    """
+
+    def __init__(self, errors: typing.Sequence[ValidationError]):
+        """
+        :param errors: The problems, at least one. The group takes the error
+                       code of the first.
+        """
+        self.errors = list(errors)
+        super().__init__(
+            f"{len(self.errors)} problems found:\n"
+            + "\n".join(f"  {error}" for error in self.errors),
+            self.errors[0].error_code,
+        )
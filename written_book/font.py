@@ -0,0 +1,394 @@
+import hashlib
+import json
+import os
+import typing
+
+import PIL
+from PIL import Image, ImageDraw, ImageFont, PngImagePlugin
+
+from .asset_resource import normalize_path
+from .atlas import page_path
+from .tiling import composite
+
+__all__ = [
+    "DEFAULT_STYLES",
+    "FontStyle",
+    "Fonts",
+    "Glyph",
+    "GlyphAtlas",
+    "fonts_digest",
+]
+
+GLYPHS_VERSION = 1
+INDEX_KEY = "written_book.glyphs"
+DEFAULT_PAGE_SIZE = 256
+
+Box: typing.TypeAlias = typing.Tuple[int, int, int, int]
+Color: typing.TypeAlias = typing.Tuple[int, int, int, int]
+
+
+class FontStyle(typing.NamedTuple):
+    """
+    How the text of one style, like "body" or "h1", looks.
+    """
+
+    size: int = 10
+    # TrueType or OpenType file, or None for Pillow's built in font
+    source: typing.Optional[str] = None
+    color: Color = (0, 0, 0, 255)
+
+    @property
+    def key(self) -> str:
+        """
+        Identifies the rasterized glyphs of the style; styles that only differ
+        in color share them.
+        """
+        return f"{normalize_path(self.source) if self.source else ''}:{self.size}"
+
+
+DEFAULT_STYLES: typing.Dict[str, FontStyle] = {
+    "body": FontStyle(10),
+    "code": FontStyle(10),
+    "h1": FontStyle(16),
+    "h2": FontStyle(14),
+    "h3": FontStyle(12),
+}
+
+
+def fonts_digest(styles: typing.Mapping[str, FontStyle]) -> str:
+    """
+    Hash font styles together with the modification time and size of their font
+    files, so the files don't have to be read on every build.
+    :param styles: The styles.
+    :return: Hex digest; changes whenever text would be drawn differently.
+    """
+    # rasterization can change between Pillow (and FreeType) versions
+    digest = hashlib.sha256(PIL.__version__.encode())
+    for name, style in sorted(styles.items()):
+        stamp = None
+        if style.source is not None:
+            stat = os.stat(style.source)
+            stamp = [style.source, stat.st_mtime_ns, stat.st_size]
+        digest.update(json.dumps([name, style.size, list(style.color), stamp]).encode())
+    return digest.hexdigest()
+
+
+class Glyph(typing.NamedTuple):
+    # atlas page the glyph is on
+    page: int
+    # where in the page, like for Image.crop; empty for blank glyphs like spaces
+    box: Box
+    # of the glyph's top left corner, from the pen position at the top of the line
+    offset: typing.Tuple[int, int]
+    # how far the pen moves after the glyph
+    advance: float
+
+
+class GlyphAtlas:
+    """
+    Every glyph rasterized so far, as coverage masks packed onto a few grayscale
+    pages, along with the metrics of each glyph.
+    Saved as PNGs with the glyph table stored in the first page, like an Atlas,
+    so a warm build doesn't rasterize anything.
+    """
+
+    def __init__(self, page_size: int = DEFAULT_PAGE_SIZE):
+        """
+        :param page_size: Width and height of a page.
+        """
+        self.page_size = page_size
+        self.pages: typing.List[Image.Image] = []
+        # (font key, character) -> glyph
+        self.glyphs: typing.Dict[typing.Tuple[str, str], Glyph] = {}
+        # per page: list of [shelf y, shelf height, used width], like in pack()
+        self._shelves: typing.List[typing.List[typing.List[int]]] = []
+        self._masks: typing.Dict[typing.Tuple[str, str], Image.Image] = {}
+        # glyphs were added since the atlas was loaded
+        self.dirty = False
+
+    def __len__(self) -> int:
+        return len(self.glyphs)
+
+    def _allocate(self, width: int, height: int) -> typing.Tuple[int, int, int]:
+        # first fit onto the shelves, like pack(), but one glyph at a time
+        for page, shelves in enumerate(self._shelves):
+            for shelf in shelves:
+                if shelf[1] >= height and shelf[2] + width <= self.page_size:
+                    shelf[2] += width
+                    return page, shelf[2] - width, shelf[0]
+            top = shelves[-1][0] + shelves[-1][1] if shelves else 0
+            if top + height <= self.page_size:
+                shelves.append([top, height, width])
+                return page, 0, top
+        size = max(self.page_size, width, height)
+        self.pages.append(Image.new("L", (size, size)))
+        self._shelves.append([[0, height, width]])
+        return len(self.pages) - 1, 0, 0
+
+    def add(
+        self,
+        key: str,
+        character: str,
+        mask: typing.Optional[Image.Image],
+        offset: typing.Tuple[int, int],
+        advance: float,
+    ) -> Glyph:
+        """
+        Store a rasterized glyph.
+        :param key: The font, see FontStyle.key.
+        :param character: The character.
+        :param mask: Coverage of the glyph ("L" mode), or None if it is blank.
+        :param offset: See Glyph.offset.
+        :param advance: See Glyph.advance.
+        :return: The glyph.
+        """
+        if mask is None or 0 in mask.size:
+            glyph = Glyph(0, (0, 0, 0, 0), offset, advance)
+        else:
+            width, height = mask.size
+            page, x, y = self._allocate(width, height)
+            self.pages[page].paste(mask, (x, y))
+            glyph = Glyph(page, (x, y, x + width, y + height), offset, advance)
+        self.glyphs[key, character] = glyph
+        self.dirty = True
+        return glyph
+
+    def get(self, key: str, character: str) -> typing.Optional[Glyph]:
+        return self.glyphs.get((key, character))
+
+    def mask(self, key: str, character: str) -> typing.Optional[Image.Image]:
+        """
+        Get the coverage mask of a glyph.
+        :return: The mask, or None if the glyph is blank or not in the atlas.
+        """
+        mask = self._masks.get((key, character))
+        if mask is None:
+            glyph = self.glyphs.get((key, character))
+            if glyph is None or glyph.box[2] == glyph.box[0]:
+                return None
+            mask = self._masks[key, character] = self.pages[glyph.page].crop(glyph.box)
+        return mask
+
+    def save(self, path: str):
+        """
+        Save the atlas.
+        :param path: Where to save the first page.
+        """
+        path = normalize_path(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        index = {
+            "version": GLYPHS_VERSION,
+            "page_size": self.page_size,
+            "pages": len(self.pages),
+            "glyphs": [
+                [key, character, glyph.page, list(glyph.box), list(glyph.offset)]
+                + [glyph.advance]
+                for (key, character), glyph in self.glyphs.items()
+            ],
+            "shelves": self._shelves,
+        }
+        pages = self.pages or [Image.new("L", (1, 1))]
+        for page, image in enumerate(pages):
+            info = PngImagePlugin.PngInfo()
+            if page == 0:
+                info.add_itxt(INDEX_KEY, json.dumps(index), zip=True)
+            image.save(page_path(path, page), pnginfo=info)
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path: str) -> typing.Optional["GlyphAtlas"]:
+        """
+        Load a saved atlas.
+        :param path: Path of the first page.
+        :return: The atlas, or None if there isn't one.
+        """
+        path = normalize_path(path)
+        try:
+            with Image.open(path) as image:
+                raw = typing.cast(typing.Dict[str, str], image.info).get(INDEX_KEY)
+                first = image.convert("L")
+        except (FileNotFoundError, Image.UnidentifiedImageError):
+            return None
+        if raw is None:
+            return None
+        index = json.loads(raw)
+        if index.get("version") != GLYPHS_VERSION:
+            return None
+        atlas = cls(index["page_size"])
+        try:
+            for page in range(index["pages"]):
+                if page == 0:
+                    atlas.pages.append(first)
+                else:
+                    with Image.open(page_path(path, page)) as image:
+                        atlas.pages.append(image.convert("L"))
+        except (FileNotFoundError, Image.UnidentifiedImageError):
+            return None
+        atlas._shelves = index["shelves"]
+        for key, character, page, box, offset, advance in index["glyphs"]:
+            atlas.glyphs[key, character] = Glyph(
+                page, tuple(box), tuple(offset), advance
+            )
+        return atlas
+
+
+class Fonts:
+    """
+    Measures and draws text, in styles like "body" or "h1".
+    Every glyph of every font and size is rasterized once, into a GlyphAtlas,
+    and a line of text is drawn by pasting its glyphs from the atlas into one
+    mask, then compositing the line onto the page in a single step.
+    Can be used as the TextMetrics of a Layout.
+    """
+
+    def __init__(
+        self,
+        styles: typing.Mapping[str, FontStyle] = DEFAULT_STYLES,
+        atlas: typing.Optional[GlyphAtlas] = None,
+    ):
+        """
+        :param styles: Style name -> style. Unknown styles are drawn like "body".
+        :param atlas: Glyphs rasterized before, like by a previous build.
+        """
+        self.styles = dict(styles)
+        self.atlas = atlas if atlas is not None else GlyphAtlas()
+        self._fonts: typing.Dict[str, ImageFont.FreeTypeFont] = {}
+        self.rasterized = 0
+
+    @classmethod
+    def atlas_path(cls, styles: typing.Mapping[str, FontStyle], directory: str) -> str:
+        """
+        Get where the glyph atlas of some styles is kept.
+        :param styles: The styles.
+        :param directory: Where compiled themes are kept.
+        """
+        return os.path.join(directory, f"glyphs-{fonts_digest(styles)[:16]}.png")
+
+    @classmethod
+    def load(cls, styles: typing.Mapping[str, FontStyle], directory: str) -> "Fonts":
+        """
+        Make fonts, with the glyph atlas saved in a directory by save() if there
+        is one for the same styles.
+        :param styles: The styles.
+        :param directory: Where compiled themes are kept.
+        """
+        return cls(styles, GlyphAtlas.load(cls.atlas_path(styles, directory)))
+
+    def save(self, directory: str):
+        """
+        Save the glyph atlas, if any glyphs were rasterized since it was loaded.
+        Atlases of other styles are deleted.
+        :param directory: Where compiled themes are kept.
+        """
+        if not self.atlas.dirty:
+            return
+        path = self.atlas_path(self.styles, directory)
+        if os.path.isdir(directory):
+            prefix = os.path.basename(path).split(".")[0]
+            for name in os.listdir(directory):
+                if name.startswith("glyphs-") and not name.startswith(prefix):
+                    os.remove(os.path.join(directory, name))
+        self.atlas.save(path)
+
+    def style(self, name: str) -> FontStyle:
+        return self.styles.get(name) or self.styles.get("body") or FontStyle()
+
+    def font(self, name: str) -> ImageFont.FreeTypeFont:
+        """
+        Get the font of a style, opened once.
+        """
+        style = self.style(name)
+        font = self._fonts.get(style.key)
+        if font is None:
+            if style.source is None:
+                # sized default fonts need Pillow 10.1
+                font = typing.cast(
+                    ImageFont.FreeTypeFont, ImageFont.load_default(style.size)
+                )
+            else:
+                font = ImageFont.truetype(style.source, style.size)
+            self._fonts[style.key] = font
+        return font
+
+    def glyph(self, character: str, style: str) -> Glyph:
+        """
+        Get a glyph, rasterizing it only if it never was before.
+        :param character: The character.
+        :param style: The style.
+        :return: The glyph.
+        """
+        key = self.style(style).key
+        glyph = self.atlas.get(key, character)
+        if glyph is not None:
+            return glyph
+        font = self.font(style)
+        left, top, right, bottom = map(int, font.getbbox(character))
+        mask = None
+        if right > left and bottom > top:
+            mask = Image.new("L", (right - left, bottom - top))
+            ImageDraw.Draw(mask).text((-left, -top), character, 255, font)
+        self.rasterized += 1
+        return self.atlas.add(
+            key, character, mask, (left, top), font.getlength(character)
+        )
+
+    def advances(self, text: str, style: str) -> typing.List[float]:
+        """
+        Get how far the pen moves after every character of some text.
+        """
+        return [self.glyph(character, style).advance for character in text]
+
+    def line_height(self, style: str) -> int:
+        ascent, descent = self.font(style).getmetrics()
+        return ascent + descent
+
+    def width(self, text: str, style: str) -> int:
+        return round(sum(self.advances(text, style)))
+
+    def render(self, text: str, style: str) -> typing.Optional[Image.Image]:
+        """
+        Draw a line of text into a new image.
+        :param text: The text.
+        :param style: The style.
+        :return: The line, as tall as the style's line height, or None if
+                 nothing in it is visible.
+        """
+        key = self.style(style).key
+        glyphs = [(c, self.glyph(c, style)) for c in text]
+        if not glyphs:
+            return None
+        width = max(1, self.width(text, style) + 1)
+        line = Image.new("L", (width, self.line_height(style)))
+        pen = 0.0
+        drawn = False
+        for character, glyph in glyphs:
+            mask = self.atlas.mask(key, character)
+            if mask is not None:
+                position = (round(pen) + glyph.offset[0], glyph.offset[1])
+                # pasting the mask through itself keeps the overlaps of glyphs
+                line.paste(mask, position, mask)
+                drawn = True
+            pen += glyph.advance
+        if not drawn:
+            return None
+        image = Image.new("RGBA", line.size, self.style(style).color)
+        image.putalpha(line)
+        return image
+
+    def draw(
+        self,
+        image: Image.Image,
+        position: typing.Tuple[int, int],
+        text: str,
+        style: str,
+    ):
+        """
+        Draw a line of text onto an image.
+        :param image: RGBA image to draw on.
+        :param position: Top left corner of the line.
+        :param text: The text.
+        :param style: The style.
+        """
+        line = self.render(text, style)
+        if line is not None:
+            composite(image, line, position)
@@ -0,0 +1,310 @@
+import abc
+import typing
+
+from PIL import Image
+
+from .asset_resource import Direction, Feature, Feature1D, Feature2D
+from .theme import Theme
+from .tiling import composite
+
+__all__ = [
+    "BLOCK_QUOTE",
+    "Bar",
+    "BarStyle",
+    "CODE",
+    "Frame",
+    "FrameStyle",
+    "HORIZONTAL_RULE",
+    "PAGE",
+]
+
+Piece: typing.TypeAlias = typing.Tuple[Image.Image, typing.Tuple[int, int]]
+
+
+class FrameStyle(typing.NamedTuple):
+    """
+    The feature types that make up a frame.
+    """
+
+    top_left: str
+    top_right: str
+    bottom_left: str
+    bottom_right: str
+    top: str
+    bottom: str
+    left: str
+    right: str
+    fill: str
+
+
+PAGE = FrameStyle(
+    "top_left_corner",
+    "top_right_corner",
+    "bottom_left_corner",
+    "bottom_right_corner",
+    "top_edge",
+    "bottom_edge",
+    "left_edge",
+    "right_edge",
+    "background",
+)
+
+CODE = FrameStyle(
+    "code_top_left_corner",
+    "code_top_right_corner",
+    "code_bottom_left_corner",
+    "code_bottom_right_corner",
+    "code_top_edge",
+    "code_bottom_edge",
+    "code_left_edge",
+    "code_right_edge",
+    "code_background",
+)
+
+
+class BarStyle(typing.NamedTuple):
+    """
+    The feature types that make up a bar: a cap at each end and a tiled middle.
+    """
+
+    start: str
+    middle: str
+    end: str
+
+
+BLOCK_QUOTE = BarStyle("block_quote_top_cap", "block_quote", "block_quote_bottom_cap")
+
+HORIZONTAL_RULE = BarStyle(
+    "horizontal_rule_left_cap", "horizontal_rule", "horizontal_rule_right_cap"
+)
+
+
+def _size(feature: typing.Optional[Feature]) -> typing.Tuple[int, int]:
+    return feature.asset.size if feature is not None else (0, 0)
+
+
+class _Panel(abc.ABC):
+    @abc.abstractmethod
+    def _pieces(self, width: int, height: int) -> typing.Iterator[Piece]:
+        """
+        Cut the panel into pieces that cover a box without overlapping.
+        :return: (image, position in the box) for every piece.
+        """
+
+    def _render(self, width: int, height: int) -> Image.Image:
+        canvas = Image.new("RGBA", (width, height))
+        # the pieces don't overlap, so there is nothing to blend with
+        for piece, position in self._pieces(width, height):
+            canvas.paste(piece, position)
+        return canvas
+
+    def _draw(self, image: Image.Image, x: int, y: int, width: int, height: int):
+        for piece, (piece_x, piece_y) in self._pieces(width, height):
+            composite(image, piece, (x + piece_x, y + piece_y))
+
+
+class Frame(_Panel):
+    """
+    A bordered panel: four corners, four tiled edges and a tiled fill inside them.
+    Any of the parts can be missing. Edges and the fill come from the tile caches
+    of their features, so frames of any size mostly reuse strips already made.
+    """
+
+    def __init__(
+        self,
+        top_left: typing.Optional[Feature] = None,
+        top_right: typing.Optional[Feature] = None,
+        bottom_left: typing.Optional[Feature] = None,
+        bottom_right: typing.Optional[Feature] = None,
+        top: typing.Optional[Feature1D] = None,
+        bottom: typing.Optional[Feature1D] = None,
+        left: typing.Optional[Feature1D] = None,
+        right: typing.Optional[Feature1D] = None,
+        fill: typing.Optional[Feature2D] = None,
+    ):
+        """
+        :param top_left: Corner, drawn at the top left.
+        :param top_right: Corner, drawn at the top right.
+        :param bottom_left: Corner, drawn at the bottom left.
+        :param bottom_right: Corner, drawn at the bottom right.
+        :param top: Horizontal edge, along the top between the corners.
+        :param bottom: Horizontal edge, along the bottom between the corners.
+        :param left: Vertical edge, along the left between the corners.
+        :param right: Vertical edge, along the right between the corners.
+        :param fill: Tiled inside the border.
+        """
+        self.top_left = top_left
+        self.top_right = top_right
+        self.bottom_left = bottom_left
+        self.bottom_right = bottom_right
+        self.top = top
+        self.bottom = bottom
+        self.left = left
+        self.right = right
+        self.fill = fill
+        # border thickness on each side: (left, top, right, bottom)
+        self.border = (
+            max(_size(top_left)[0], _size(left)[0], _size(bottom_left)[0]),
+            max(_size(top_left)[1], _size(top)[1], _size(top_right)[1]),
+            max(_size(top_right)[0], _size(right)[0], _size(bottom_right)[0]),
+            max(_size(bottom_left)[1], _size(bottom)[1], _size(bottom_right)[1]),
+        )
+
+    @classmethod
+    def from_theme(cls, theme: Theme, style: FrameStyle = PAGE) -> "Frame":
+        """
+        Make a frame out of a theme's features.
+        :param theme: The theme.
+        :param style: Which features to use, like PAGE or CODE.
+        :return: The frame, without the parts the theme doesn't have.
+        """
+        return cls(
+            theme.get(style.top_left),
+            theme.get(style.top_right),
+            theme.get(style.bottom_left),
+            theme.get(style.bottom_right),
+            theme.get(style.top, Feature1D),
+            theme.get(style.bottom, Feature1D),
+            theme.get(style.left, Feature1D),
+            theme.get(style.right, Feature1D),
+            theme.get(style.fill, Feature2D),
+        )
+
+    def inside(self, width: int, height: int) -> typing.Tuple[int, int, int, int]:
+        """
+        Get the area of a frame that is inside the border.
+        :param width: Width of the frame.
+        :param height: Height of the frame.
+        :return: The area, as a box like for Image.crop.
+        """
+        left, top, right, bottom = self.border
+        return left, top, max(left, width - right), max(top, height - bottom)
+
+    def _pieces(self, width: int, height: int) -> typing.Iterator[Piece]:
+        left, top, right, bottom = self.inside(width, height)
+        inner_width, inner_height = right - left, bottom - top
+        if self.fill is not None and inner_width and inner_height:
+            yield self.fill.tile(inner_width, inner_height), (left, top)
+        if inner_width:
+            if self.top is not None:
+                yield self.top.tile(inner_width), (left, 0)
+            if self.bottom is not None:
+                strip = self.bottom.tile(inner_width)
+                yield strip, (left, height - strip.height)
+        if inner_height:
+            if self.left is not None:
+                yield self.left.tile(inner_height), (0, top)
+            if self.right is not None:
+                strip = self.right.tile(inner_height)
+                yield strip, (width - strip.width, top)
+        for corner, right_side, bottom_side in (
+            (self.top_left, False, False),
+            (self.top_right, True, False),
+            (self.bottom_left, False, True),
+            (self.bottom_right, True, True),
+        ):
+            if corner is not None:
+                image = corner.asset.get()
+                yield image, (
+                    width - image.width if right_side else 0,
+                    height - image.height if bottom_side else 0,
+                )
+
+    def render(self, width: int, height: int) -> Image.Image:
+        """
+        Render the frame into a new image.
+        :param width: Width of the frame.
+        :param height: Height of the frame.
+        :return: The frame, safe to modify.
+        """
+        return self._render(width, height)
+
+    def draw(self, image: Image.Image, box: typing.Tuple[int, int, int, int]):
+        """
+        Composite the frame onto an existing image, without making a new one.
+        :param image: RGBA image to draw on.
+        :param box: Where to draw the frame, like for Image.crop.
+        """
+        self._draw(image, box[0], box[1], box[2] - box[0], box[3] - box[1])
+
+
+class Bar(_Panel):
+    """
+    A cap at each end with a tiled strip between them, like a block quote bar or
+    a horizontal rule. Pieces are centered across the bar.
+    """
+
+    def __init__(
+        self,
+        start: typing.Optional[Feature] = None,
+        middle: typing.Optional[Feature1D] = None,
+        end: typing.Optional[Feature] = None,
+        direction: Direction = Direction.HORIZONTAL,
+    ):
+        """
+        :param start: Cap at the left (or top).
+        :param middle: Tiled between the caps.
+        :param end: Cap at the right (or bottom).
+        :param direction: Which way the bar runs.
+        """
+        self.start = start
+        self.middle = middle
+        self.end = end
+        self.direction = direction
+        across = 1 if direction == Direction.HORIZONTAL else 0
+        along = 1 - across
+        self.thickness = max(_size(f)[across] for f in (start, middle, end))
+        self._caps = _size(start)[along], _size(end)[along]
+
+    @classmethod
+    def from_theme(cls, theme: Theme, style: BarStyle = HORIZONTAL_RULE) -> "Bar":
+        """
+        Make a bar out of a theme's features.
+        :param theme: The theme.
+        :param style: Which features to use, like HORIZONTAL_RULE or BLOCK_QUOTE.
+        :return: The bar, without the parts the theme doesn't have.
+        """
+        return cls(
+            theme.get(style.start),
+            theme.get(style.middle, Feature1D),
+            theme.get(style.end),
+            Feature1D.direction_of(style.middle),
+        )
+
+    def _size(self, length: int) -> typing.Tuple[int, int]:
+        if self.direction == Direction.HORIZONTAL:
+            return length, self.thickness
+        return self.thickness, length
+
+    def _place(self, image: Image.Image, along: int) -> Piece:
+        if self.direction == Direction.HORIZONTAL:
+            return image, (along, (self.thickness - image.height) // 2)
+        return image, ((self.thickness - image.width) // 2, along)
+
+    def _pieces(self, width: int, height: int) -> typing.Iterator[Piece]:
+        length = width if self.direction == Direction.HORIZONTAL else height
+        start, end = self._caps
+        middle = max(0, length - start - end)
+        if self.middle is not None and middle:
+            yield self._place(self.middle.tile(middle), start)
+        if self.start is not None:
+            yield self._place(self.start.asset.get(), 0)
+        if self.end is not None:
+            yield self._place(self.end.asset.get(), length - end)
+
+    def render(self, length: int) -> Image.Image:
+        """
+        Render the bar into a new image.
+        :param length: Length of the bar.
+        :return: The bar, thickness wide (or tall), safe to modify.
+        """
+        return self._render(*self._size(length))
+
+    def draw(self, image: Image.Image, position: typing.Tuple[int, int], length: int):
+        """
+        Composite the bar onto an existing image, without making a new one.
+        :param image: RGBA image to draw on.
+        :param position: Top left corner of the bar.
+        :param length: Length of the bar.
+        """
+        self._draw(image, *position, *self._size(length))
@@ -0,0 +1,276 @@
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+import typing
+
+__all__ = [
+    "ENVIRONMENT_VARIABLE",
+    "Recorder",
+    "SpanStats",
+    "count",
+    "disable",
+    "enable",
+    "recorder",
+    "span",
+    "traced",
+]
+
+# "1" to print a summary after a build, or a path to also write a trace there
+ENVIRONMENT_VARIABLE = "WRITTEN_BOOK_PROFILE"
+
+F = typing.TypeVar("F", bound=typing.Callable[..., typing.Any])
+
+
+class SpanStats(typing.NamedTuple):
+    calls: int
+    # seconds spent inside the span
+    total: float
+    # seconds spent inside the span, but not inside a span nested in it
+    own: float
+
+
+class _CacheStats(typing.Protocol):
+    @property
+    def hits(self) -> int:
+        ...
+
+    @property
+    def misses(self) -> int:
+        ...
+
+
+class _Cache(typing.Protocol):
+    @property
+    def stats(self) -> _CacheStats:
+        ...
+
+
+class _Span:
+    __slots__ = ("stack", "finish", "name", "start", "nested")
+
+    def __init__(
+        self,
+        stack: typing.Callable[[], typing.List["_Span"]],
+        finish: typing.Callable[[str, float, float, float], None],
+        name: str,
+    ):
+        """
+        :param stack: Gets the spans open in the current thread.
+        :param finish: Records a span: its name, start, duration and the time
+                       spent in spans nested in it.
+        :param name: Name of the span.
+        """
+        self.stack = stack
+        self.finish = finish
+        self.name = name
+
+    def __enter__(self):
+        self.stack().append(self)
+        self.nested = 0.0
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info: typing.Any):
+        end = time.perf_counter()
+        stack = self.stack()
+        stack.pop()
+        duration = end - self.start
+        if stack:
+            stack[-1].nested += duration
+        self.finish(self.name, self.start, duration, self.nested)
+
+
+class Recorder:
+    """
+    Collects spans, counters and cache statistics while it is enabled, from every
+    thread of this process.
+    """
+
+    def __init__(self, trace: bool = False):
+        """
+        :param trace: Keep every span, not just totals, so they can be written out
+                      as a trace.
+        """
+        self.trace = trace
+        self.spans: typing.Dict[str, SpanStats] = {}
+        self.counters: typing.Dict[str, int] = {}
+        self.events: typing.List[typing.Tuple[str, float, float, int]] = []
+        self.started = time.perf_counter()
+        self._caches: typing.Dict[str, typing.Tuple[_Cache, int, int]] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _stack(self) -> typing.List[_Span]:
+        stack: typing.Optional[typing.List[_Span]] = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = []
+            self._local.stack = stack
+        return stack
+
+    def _finish(self, name: str, start: float, duration: float, nested: float):
+        with self._lock:
+            calls, total, own = self.spans.get(name, (0, 0.0, 0.0))
+            self.spans[name] = SpanStats(
+                calls + 1, total + duration, own + duration - nested
+            )
+            if self.trace:
+                self.events.append((name, start, duration, threading.get_ident()))
+
+    def span(self, name: str) -> typing.ContextManager[None]:
+        return _Span(self._stack, self._finish, name)
+
+    def count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def watch(self, name: str, cache: _Cache):
+        """
+        Report the hits and misses of a cache from now on.
+        :param name: Name of the cache in the report.
+        :param cache: Anything with a stats property that has hits and misses.
+        """
+        stats = cache.stats
+        self._caches[name] = cache, stats.hits, stats.misses
+
+    def caches(self) -> typing.Dict[str, typing.Tuple[int, int]]:
+        """
+        Get the hits and misses of the watched caches since they were watched.
+        """
+        caches: typing.Dict[str, typing.Tuple[int, int]] = {}
+        for name, (cache, hits, misses) in self._caches.items():
+            stats = cache.stats
+            caches[name] = stats.hits - hits, stats.misses - misses
+        return caches
+
+    def summary(self) -> str:
+        """
+        Format everything recorded as a table, slowest spans first.
+        """
+        lines = [
+            f"{'span':<32} {'calls':>8} {'total ms':>10} {'own ms':>10} {'mean ms':>9}"
+        ]
+        for name, stats in sorted(self.spans.items(), key=lambda item: -item[1].total):
+            lines.append(
+                f"{name:<32} {stats.calls:>8} {stats.total * 1000:>10.1f} "
+                f"{stats.own * 1000:>10.1f} {stats.total * 1000 / stats.calls:>9.3f}"
+            )
+        if self.counters:
+            lines.append("")
+            lines.append(f"{'counter':<32} {'count':>8}")
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"{name:<32} {value:>8}")
+        caches = self.caches()
+        if caches:
+            lines.append("")
+            lines.append(f"{'cache':<32} {'hits':>8} {'misses':>10} {'hit rate':>10}")
+            for name, (hits, misses) in caches.items():
+                rate = f"{hits / (hits + misses):.1%}" if hits + misses else "-"
+                lines.append(f"{name:<32} {hits:>8} {misses:>10} {rate:>10}")
+        return "\n".join(lines)
+
+    def chrome_trace(self) -> typing.Dict[str, typing.Any]:
+        """
+        Get the recorded spans in the Chrome trace event format, for
+        chrome://tracing or Perfetto. Counters and caches go in the metadata.
+        """
+        pid = os.getpid()
+        events: typing.List[typing.Dict[str, typing.Any]] = [
+            {
+                "name": name,
+                "ph": "X",
+                "ts": (start - self.started) * 1e6,
+                "dur": duration * 1e6,
+                "pid": pid,
+                "tid": thread,
+            }
+            for name, start, duration, thread in self.events
+        ]
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "counters": dict(self.counters),
+                "caches": {
+                    name: {"hits": hits, "misses": misses}
+                    for name, (hits, misses) in self.caches().items()
+                },
+            },
+        }
+
+    def write_trace(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+
+_recorder: typing.Optional[Recorder] = None
+
+# shared by every span while disabled
+_NOTHING: typing.ContextManager[None] = contextlib.nullcontext()
+
+
+def recorder() -> typing.Optional[Recorder]:
+    """
+    Get the enabled recorder, or None if instrumentation is disabled.
+    """
+    return _recorder
+
+
+def enable(trace: bool = False) -> Recorder:
+    """
+    Start recording, replacing any recorder that was enabled.
+    :param trace: Keep every span, see Recorder.
+    :return: The new recorder.
+    """
+    global _recorder
+    _recorder = Recorder(trace)
+    return _recorder
+
+
+def disable() -> typing.Optional[Recorder]:
+    """
+    Stop recording.
+    :return: The recorder that was enabled, if any.
+    """
+    global _recorder
+    previous, _recorder = _recorder, None
+    return previous
+
+
+def span(name: str) -> typing.ContextManager[None]:
+    """
+    Time a block of code, as a span nested in any span it is in.
+    Does nothing unless instrumentation is enabled.
+    :param name: Name of the span, like "tile".
+    """
+    if _recorder is None:
+        return _NOTHING
+    return _recorder.span(name)
+
+
+def count(name: str, amount: int = 1):
+    """
+    Add to a counter, unless instrumentation is disabled.
+    """
+    if _recorder is not None:
+        _recorder.count(name, amount)
+
+
+def traced(name: str) -> typing.Callable[[F], F]:
+    """
+    Decorate a function to time every call in a span.
+    :param name: Name of the span.
+    """
+
+    def decorate(function: F) -> F:
+        @functools.wraps(function)
+        def wrapper(*args: typing.Any, **kwargs: typing.Any) -> typing.Any:
+            if _recorder is None:
+                return function(*args, **kwargs)
+            with _recorder.span(name):
+                return function(*args, **kwargs)
+
+        return typing.cast(F, wrapper)
+
+    return decorate
@@ -0,0 +1,531 @@
+import hashlib
+import itertools
+import os
+import pickle
+import typing
+
+import cmarkgfm
+from bs4 import BeautifulSoup
+from bs4.element import NavigableString, Tag
+
+from .cache import LRUCache
+from .frame import BLOCK_QUOTE, CODE, HORIZONTAL_RULE, PAGE, Bar, Frame
+from .instrument import count, traced
+from .render import (
+    BarCommand,
+    DrawCommand,
+    FeatureCommand,
+    FrameCommand,
+    Page,
+    TextCommand,
+)
+from .text import FixedMetrics, TextFitter, TextMetrics
+from .theme import Theme
+
+__all__ = [
+    "Block",
+    "Code",
+    "Geometry",
+    "Items",
+    "Layout",
+    "ParseCache",
+    "Quote",
+    "Rule",
+    "Text",
+    "parse",
+]
+
+
+class Text(typing.NamedTuple):
+    """
+    A paragraph or heading.
+    """
+
+    # "body", or "h1" to "h6"
+    style: str
+    text: str
+
+
+class Code(typing.NamedTuple):
+    """
+    A code block; lines are kept as they are.
+    """
+
+    text: str
+
+
+class Quote(typing.NamedTuple):
+    blocks: typing.Tuple["Block", ...]
+
+
+class Items(typing.NamedTuple):
+    """
+    A list. Every item is a sequence of blocks.
+    """
+
+    # number of the first item, or None for bullets
+    start: typing.Optional[int]
+    items: typing.Tuple[typing.Tuple["Block", ...], ...]
+
+
+class Rule(typing.NamedTuple):
+    """
+    A horizontal rule.
+    """
+
+
+Block: typing.TypeAlias = typing.Union[Text, Code, Quote, Items, Rule]
+
+# elements that are part of the text of a block, not blocks of their own
+_INLINE = frozenset(
+    ["a", "b", "br", "code", "del", "em", "i", "img", "s", "span", "strong", "sup"]
+)
+
+
+def _collapse(text: str) -> str:
+    return " ".join(text.split())
+
+
+def _blocks(parent: Tag) -> typing.Tuple[Block, ...]:
+    blocks: typing.List[Block] = []
+    # text directly inside the parent, like in the items of tight lists
+    loose: typing.List[str] = []
+
+    def flush():
+        text = _collapse("".join(loose))
+        if text:
+            blocks.append(Text("body", text))
+        loose.clear()
+
+    for child in parent.children:
+        if isinstance(child, NavigableString):
+            loose.append(str(child))
+            continue
+        if not isinstance(child, Tag):
+            continue
+        if child.name in _INLINE:
+            loose.append(child.get_text())
+            continue
+        flush()
+        name = child.name
+        if name == "p":
+            text = _collapse(child.get_text())
+            if text:
+                blocks.append(Text("body", text))
+        elif name in ("h1", "h2", "h3", "h4", "h5", "h6"):
+            blocks.append(Text(name, _collapse(child.get_text())))
+        elif name == "pre":
+            blocks.append(Code(child.get_text().rstrip("\n")))
+        elif name == "blockquote":
+            blocks.append(Quote(_blocks(child)))
+        elif name in ("ul", "ol"):
+            start = None
+            if name == "ol":
+                start = int(typing.cast(str, child.get("start", "1")))
+            items = child.find_all("li", recursive=False)
+            blocks.append(Items(start, tuple(_blocks(item) for item in items)))
+        elif name == "hr":
+            blocks.append(Rule())
+        elif name == "table":
+            for row in child.find_all("tr"):
+                cells = [
+                    _collapse(cell.get_text()) for cell in row.find_all(["th", "td"])
+                ]
+                blocks.append(Text("body", " | ".join(cells)))
+        else:
+            # anything else (html blocks, ...) is only a container
+            blocks.extend(_blocks(child))
+    flush()
+    return tuple(blocks)
+
+
+@traced("layout.parse")
+def parse(markdown: str) -> typing.Tuple[Block, ...]:
+    """
+    Parse a markdown document into a tree of blocks, keeping only what matters for
+    layout.
+    :param markdown: The document, GitHub flavored.
+    :return: The blocks of the document.
+    """
+    html = cmarkgfm.github_flavored_markdown_to_html(markdown)
+    return _blocks(BeautifulSoup(html, "html.parser"))
+
+
+def _sizeof_tree(entry: typing.Tuple[typing.Tuple[Block, ...], int]) -> int:
+    return entry[1]
+
+
+class ParseCache:
+    """
+    Parse trees of markdown documents, keyed by a hash of their contents, so a
+    document is only ever parsed once. Trees are kept in memory and, given a
+    directory, on disk, so later builds can lay documents out again (after a
+    theme change, say) without parsing them.
+    """
+
+    EXTENSION = ".tree"
+    # part of every file name; bump it whenever the blocks change shape, so trees
+    # pickled by an older version are parsed again instead of loaded
+    FORMAT = 1
+
+    def __init__(
+        self, directory: typing.Optional[str] = None, max_bytes: int = 16 * 1024**2
+    ):
+        """
+        :param directory: Where to keep parse trees between builds, or None to
+                          only keep them in memory.
+        :param max_bytes: Byte budget of the in memory trees, measured by the size
+                          of their markdown.
+        """
+        self.directory = directory
+        self._trees: LRUCache[
+            str, typing.Tuple[typing.Tuple[Block, ...], int]
+        ] = LRUCache(max_bytes, _sizeof_tree)
+        self.parsed = 0
+
+    def _path(self, digest: str) -> str:
+        assert self.directory is not None
+        return os.path.join(self.directory, f"{digest}.{self.FORMAT}{self.EXTENSION}")
+
+    def get(
+        self, markdown: str, digest: typing.Optional[str] = None
+    ) -> typing.Tuple[Block, ...]:
+        """
+        Get the parse tree of a document, parsing it only if it hasn't been yet.
+        :param markdown: The document.
+        :param digest: Hex digest identifying the document, like file_digest() of
+                       its file, if it is already known; defaults to SHA-256 of
+                       the document encoded as UTF-8.
+        :return: The blocks of the document.
+        """
+        digest = digest or hashlib.sha256(markdown.encode()).hexdigest()
+        entry = self._trees.get(digest)
+        if entry is not None:
+            count("parse_cache.hit")
+            return entry[0]
+        tree: typing.Optional[typing.Tuple[Block, ...]] = None
+        if self.directory is not None:
+            try:
+                with open(self._path(digest), "rb") as f:
+                    tree = pickle.load(f)
+            # a damaged tree, or one of classes that changed without FORMAT being
+            # bumped, is parsed again
+            except (
+                OSError,
+                pickle.UnpicklingError,
+                EOFError,
+                AttributeError,
+                ImportError,
+                TypeError,
+            ):
+                tree = None
+        if tree is None:
+            count("parse_cache.miss")
+            tree = parse(markdown)
+            self.parsed += 1
+            if self.directory is not None:
+                os.makedirs(self.directory, exist_ok=True)
+                temporary = f"{self._path(digest)}.{os.getpid()}.tmp"
+                with open(temporary, "wb") as f:
+                    pickle.dump(tree, f)
+                os.replace(temporary, self._path(digest))
+        self._trees.put(digest, (tree, len(markdown)))
+        return tree
+
+    def prune(self, keep: typing.Iterable[str]):
+        """
+        Delete the trees on disk of documents that don't exist anymore, and any
+        trees in an older format.
+        :param keep: Digests of the documents to keep.
+        """
+        if self.directory is None or not os.path.isdir(self.directory):
+            return
+        keep = {f"{digest}.{self.FORMAT}" for digest in keep}
+        for name in os.listdir(self.directory):
+            stem, extension = os.path.splitext(name)
+            if extension == self.EXTENSION and stem not in keep:
+                os.remove(os.path.join(self.directory, name))
+
+
+class Geometry(typing.NamedTuple):
+    """
+    Spacing of laid out pages, in pixels.
+    """
+
+    # between the border of the page frame and the content
+    padding: int = 4
+    # between blocks
+    spacing: int = 4
+    # of list items, the bullets go in it
+    indent: int = 10
+    # between a block quote bar and the quote
+    quote_indent: int = 4
+    # inside code frames, on top of their border
+    code_padding: int = 2
+
+
+class _Atom(typing.NamedTuple):
+    """
+    The smallest thing pages are made of: a line of text, a rule, or space.
+    """
+
+    # "text", "rule", "gap" (space between blocks, dropped at the top of a page)
+    # or "pad" (space inside a code frame)
+    kind: str
+    height: int
+    x: int
+    width: int
+    # (id, x) of every block quote this is in
+    quotes: typing.Tuple[typing.Tuple[int, int], ...] = ()
+    # id of the code block this is in
+    code: typing.Optional[int] = None
+    text: str = ""
+    style: str = "body"
+    # "bullet" or a number like "3.", for the first line of a list item
+    marker: typing.Optional[str] = None
+
+
+class Layout:
+    """
+    Lays out parse trees into pages of a theme: the content goes inside the page
+    frame, and block quotes, code blocks, rules and bullets are drawn with the
+    theme's features.
+    """
+
+    def __init__(
+        self,
+        theme: Theme,
+        page_size: typing.Tuple[int, int],
+        metrics: typing.Optional[TextMetrics] = None,
+        geometry: Geometry = Geometry(),
+        breaking: str = "greedy",
+    ):
+        """
+        :param theme: The theme.
+        :param page_size: (width, height) of a page.
+        :param metrics: Measures text; defaults to FixedMetrics().
+        :param geometry: Spacing.
+        :param breaking: How to break lines of text, "greedy" or "optimal".
+        """
+        self.theme = theme
+        self.page_size = page_size
+        self.metrics = metrics or FixedMetrics()
+        self.fitter = TextFitter(self.metrics, breaking)
+        self.geometry = geometry
+        self.quote_bar = Bar.from_theme(theme, BLOCK_QUOTE)
+        self.rule_bar = Bar.from_theme(theme, HORIZONTAL_RULE)
+        self.code_frame = Frame.from_theme(theme, CODE)
+        bullet = self.theme.get("bullet")
+        self.bullet_size = bullet.asset.size if bullet is not None else (0, 0)
+        left, top, right, bottom = Frame.from_theme(theme, PAGE).inside(*page_size)
+        padding = geometry.padding
+        # where content goes on a page, like for Image.crop
+        self.content = (
+            left + padding,
+            top + padding,
+            max(left + padding, right - padding),
+            max(top + padding, bottom - padding),
+        )
+        self._ids = itertools.count()
+
+    @property
+    def _code_pad(self) -> typing.Tuple[int, int, int, int]:
+        left, top, right, bottom = self.code_frame.border
+        pad = self.geometry.code_padding
+        return left + pad, top + pad, right + pad, bottom + pad
+
+    def _atoms(
+        self,
+        blocks: typing.Sequence[Block],
+        x: int,
+        width: int,
+        quotes: typing.Tuple[typing.Tuple[int, int], ...],
+    ) -> typing.List[_Atom]:
+        atoms: typing.List[_Atom] = []
+        for index, block in enumerate(blocks):
+            if index:
+                atoms.append(_Atom("gap", self.geometry.spacing, x, width, quotes))
+            if isinstance(block, Text):
+                height = self.metrics.line_height(block.style)
+                for line in self.fitter.lines(block.text, width, block.style):
+                    atoms.append(
+                        _Atom(
+                            "text",
+                            height,
+                            x,
+                            width,
+                            quotes,
+                            text=line,
+                            style=block.style,
+                        )
+                    )
+            elif isinstance(block, Code):
+                code = next(self._ids)
+                left, top, right, bottom = self._code_pad
+                inner = max(1, width - left - right)
+                height = self.metrics.line_height("code")
+                atoms.append(_Atom("pad", top, x, width, quotes, code))
+                for source_line in block.text.split("\n"):
+                    for line in self.fitter.lines(source_line, inner, "code"):
+                        atoms.append(
+                            _Atom(
+                                "text",
+                                height,
+                                x + left,
+                                inner,
+                                quotes,
+                                code,
+                                line,
+                                "code",
+                            )
+                        )
+                atoms.append(_Atom("pad", bottom, x, width, quotes, code))
+            elif isinstance(block, Quote):
+                quote = next(self._ids)
+                indent = self.quote_bar.thickness + self.geometry.quote_indent
+                atoms.extend(
+                    self._atoms(
+                        block.blocks,
+                        x + indent,
+                        max(1, width - indent),
+                        quotes + ((quote, x),),
+                    )
+                )
+            elif isinstance(block, Items):
+                indent = self.geometry.indent
+                for number, item in enumerate(block.items):
+                    item_atoms = self._atoms(
+                        item, x + indent, max(1, width - indent), quotes
+                    )
+                    marker = (
+                        "bullet" if block.start is None else f"{block.start + number}."
+                    )
+                    for i, atom in enumerate(item_atoms):
+                        if atom.kind == "text":
+                            item_atoms[i] = atom._replace(marker=marker)
+                            break
+                    atoms.extend(item_atoms)
+            else:
+                height = max(1, self.rule_bar.thickness)
+                atoms.append(_Atom("rule", height, x, width, quotes))
+        return atoms
+
+    def _fit(
+        self, atoms: typing.List[_Atom]
+    ) -> typing.List[typing.List[typing.Tuple[_Atom, int]]]:
+        """
+        Split atoms into pages.
+        :return: For every page, its atoms with their y relative to the content.
+        """
+        height = self.content[3] - self.content[1]
+        pad = self._code_pad
+        pages: typing.List[typing.List[typing.Tuple[_Atom, int]]] = [[]]
+        y = 0
+        for atom in atoms:
+            current = pages[-1]
+            if atom.kind == "gap" and not current:
+                continue
+            # a code line leaves room to close the frame under it
+            needed = atom.height + (
+                pad[3] if atom.kind == "text" and atom.code is not None else 0
+            )
+            if current and y + needed > height:
+                pages.append([])
+                current = pages[-1]
+                y = 0
+                if atom.kind == "gap":
+                    continue
+                if atom.kind == "text" and atom.code is not None:
+                    # the frame carries on from the last page
+                    y = pad[1]
+            current.append((atom, y))
+            y += atom.height
+        return pages
+
+    def _commands(
+        self, atoms: typing.List[typing.Tuple[_Atom, int]]
+    ) -> typing.List[DrawCommand]:
+        left, top = self.content[0], self.content[1]
+        pad = self._code_pad
+        # [x, width, top, bottom] of every code block on the page
+        codes: typing.Dict[int, typing.List[int]] = {}
+        # [x, top, bottom] of every block quote on the page
+        quotes: typing.Dict[int, typing.List[int]] = {}
+        rules: typing.List[DrawCommand] = []
+        markers: typing.List[DrawCommand] = []
+        text: typing.List[DrawCommand] = []
+        for atom, y in atoms:
+            bottom = y + atom.height
+            for quote, x in atom.quotes:
+                quotes.setdefault(quote, [x, y, bottom])[2] = bottom
+            if atom.code is not None:
+                if atom.kind == "text":
+                    # the frame's top and bottom are part of the pads
+                    y_top, y_bottom = y - pad[1], bottom + pad[3]
+                else:
+                    y_top, y_bottom = y, bottom
+                frame_x = atom.x - (pad[0] if atom.kind == "text" else 0)
+                frame_width = atom.width + (
+                    pad[0] + pad[2] if atom.kind == "text" else 0
+                )
+                span = codes.setdefault(
+                    atom.code, [frame_x, frame_width, y_top, y_bottom]
+                )
+                span[2] = min(span[2], y_top)
+                span[3] = max(span[3], y_bottom)
+            if atom.kind == "rule":
+                rules.append(
+                    BarCommand((left + atom.x, top + y), atom.width, HORIZONTAL_RULE)
+                )
+            elif atom.kind == "text":
+                text.append(
+                    TextCommand((left + atom.x, top + y), atom.text, atom.style)
+                )
+                if atom.marker == "bullet":
+                    bullet_width, bullet_height = self.bullet_size
+                    markers.append(
+                        FeatureCommand(
+                            (
+                                left
+                                + atom.x
+                                - self.geometry.indent
+                                + (self.geometry.indent - bullet_width) // 2,
+                                top + y + (atom.height - bullet_height) // 2,
+                            ),
+                            "bullet",
+                        )
+                    )
+                elif atom.marker is not None:
+                    markers.append(
+                        TextCommand(
+                            (left + atom.x - self.geometry.indent, top + y),
+                            atom.marker,
+                            atom.style,
+                        )
+                    )
+        commands: typing.List[DrawCommand] = []
+        for x, width, y_top, y_bottom in codes.values():
+            commands.append(
+                FrameCommand(
+                    (left + x, top + y_top, left + x + width, top + y_bottom), CODE
+                )
+            )
+        for x, y_top, y_bottom in quotes.values():
+            commands.append(
+                BarCommand((left + x, top + y_top), y_bottom - y_top, BLOCK_QUOTE)
+            )
+        return commands + rules + markers + text
+
+    @traced("layout.paginate")
+    def paginate(self, blocks: typing.Sequence[Block]) -> typing.List[Page]:
+        """
+        Lay out a document.
+        :param blocks: The parse tree of the document.
+        :return: Its pages, at least one.
+        """
+        width = self.content[2] - self.content[0]
+        atoms = self._atoms(blocks, 0, max(1, width), ())
+        return [
+            Page(number, self.page_size, self._commands(page))
+            for number, page in enumerate(self._fit(atoms))
+        ]
@@ -0,0 +1,224 @@
+import hashlib
+import json
+import os
+import typing
+
+from PIL import Image
+
+from .render import Page
+from .types import JSON, JSONObject
+
+__all__ = [
+    "Manifest",
+    "file_digest",
+    "page_digest",
+]
+
+MANIFEST_FILE = "manifest.json"
+PAGES_DIRECTORY = "pages"
+
+
+def file_digest(path: str) -> str:
+    """
+    Hash the contents of a file.
+    :param path: The file.
+    :return: Hex digest.
+    """
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def page_digest(page: Page, theme: str) -> str:
+    """
+    Hash everything that goes into rendering a page, so identical pages are only
+    ever rendered once. The page number isn't part of it, only what is drawn.
+    :param page: The page.
+    :param theme: Digest of the theme, fonts and options it is rendered with.
+    :return: Hex digest.
+    """
+    digest = hashlib.sha256(theme.encode())
+    digest.update(repr(tuple(page.size)).encode())
+    for command in page.commands:
+        digest.update(b"\0" + type(command).__name__.encode())
+        for value in command:
+            if isinstance(value, Image.Image):
+                digest.update(repr((value.mode, value.size)).encode())
+                digest.update(value.tobytes())
+            else:
+                digest.update(repr(value).encode())
+    return digest.hexdigest()
+
+
+class Manifest:
+    """
+    What the last build made out of every document, so the next build can skip
+    everything that didn't change.
+    Documents are recorded by their hash along with the digests of their pages.
+    Rendered pages are kept as PNGs named after the image_digest() of their
+    pixels, next to the manifest, so pages that look the same share one file.
+    """
+
+    VERSION = 2
+
+    def __init__(self, directory: str):
+        """
+        :param directory: Where the manifest and rendered pages are kept, like a
+                          beet cache directory. Nothing is read; see load().
+        """
+        self.directory = directory
+        # digest of the theme, fonts and layout options of the last build
+        self.theme: typing.Optional[str] = None
+        self.documents: typing.Dict[str, JSONObject] = {}
+        # page digest -> image digest
+        self.images: typing.Dict[str, str] = {}
+        self._seen: typing.Set[str] = set()
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, MANIFEST_FILE)
+
+    @classmethod
+    def load(cls, directory: str) -> "Manifest":
+        """
+        Read the manifest from a directory.
+        :param directory: The directory.
+        :return: The manifest; empty if there wasn't one or it can't be used.
+        """
+        manifest = cls(directory)
+        try:
+            with open(manifest.path) as f:
+                data: JSON = json.load(f)
+        except (OSError, ValueError):
+            return manifest
+        if not isinstance(data, dict) or data.get("version") != cls.VERSION:
+            return manifest
+        manifest.theme = typing.cast(typing.Optional[str], data.get("theme"))
+        manifest.documents = typing.cast(
+            typing.Dict[str, JSONObject], data.get("documents", {})
+        )
+        manifest.images = typing.cast(typing.Dict[str, str], data.get("images", {}))
+        return manifest
+
+    def save(self):
+        """
+        Write the manifest, forgetting documents that weren't part of this build
+        and deleting the pages nothing uses anymore.
+        """
+        self.documents = {
+            name: entry for name, entry in self.documents.items() if name in self._seen
+        }
+        used = {
+            digest
+            for entry in self.documents.values()
+            for digest in typing.cast(typing.List[str], entry["pages"])
+        }
+        self.images = {
+            page: image for page, image in self.images.items() if page in used
+        }
+        images = set(self.images.values())
+        pages = os.path.join(self.directory, PAGES_DIRECTORY)
+        if os.path.isdir(pages):
+            for name in os.listdir(pages):
+                if os.path.splitext(name)[0] not in images:
+                    os.remove(os.path.join(pages, name))
+        os.makedirs(self.directory, exist_ok=True)
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(
+                {
+                    "version": self.VERSION,
+                    "theme": self.theme,
+                    "documents": self.documents,
+                    "images": self.images,
+                },
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+        os.replace(temporary, self.path)
+
+    def unchanged(
+        self, name: str, digest: str, theme: str
+    ) -> typing.Optional[typing.List[str]]:
+        """
+        Look up the pages of a document from the last build.
+        :param name: The document, like its path relative to the project.
+        :param digest: file_digest() of the document now.
+        :param theme: Digest of the theme, fonts and options now, that the
+                      document's pages were laid out with.
+        :return: The digests of its pages, or None if the document or theme
+                 changed since, or any of the pages went missing.
+        """
+        entry = self.documents.get(name)
+        if entry is None or entry["hash"] != digest or self.theme != theme:
+            return None
+        pages = typing.cast(typing.List[str], entry["pages"])
+        if not all(self.has_page(page) for page in pages):
+            return None
+        return list(pages)
+
+    def record(self, name: str, digest: str, pages: typing.Sequence[str]):
+        """
+        Remember what a document was made into in this build.
+        :param name: The document.
+        :param digest: file_digest() of the document.
+        :param pages: The digests of its pages, in order.
+        """
+        self.documents[name] = {"hash": digest, "pages": list(pages)}
+        self._seen.add(name)
+
+    def image_path(self, image: str) -> str:
+        """
+        Get where a rendered image is kept.
+        :param image: image_digest() of the image.
+        """
+        return os.path.join(self.directory, PAGES_DIRECTORY, image + ".png")
+
+    def has_image(self, image: str) -> bool:
+        return os.path.isfile(self.image_path(image))
+
+    def page_image(self, digest: str) -> typing.Optional[str]:
+        """
+        Get the image a page was rendered into.
+        :param digest: page_digest() of the page.
+        :return: image_digest() of the image, or None if it isn't kept.
+        """
+        image = self.images.get(digest)
+        if image is None or not self.has_image(image):
+            return None
+        return image
+
+    def page_path(self, digest: str) -> str:
+        """
+        Get where a rendered page is kept.
+        :param digest: page_digest() of the page, which must have been stored.
+        """
+        return self.image_path(self.images[digest])
+
+    def has_page(self, digest: str) -> bool:
+        return self.page_image(digest) is not None
+
+    def store_image(self, image: str, png: bytes) -> str:
+        """
+        Keep a rendered image.
+        :param image: image_digest() of the image.
+        :param png: The image, as the contents of a PNG file.
+        :return: Where it was saved.
+        """
+        path = self.image_path(image)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(png)
+        return path
+
+    def store_page(self, digest: str, image: str, png: typing.Optional[bytes] = None):
+        """
+        Remember what a page was rendered into.
+        :param digest: page_digest() of the page.
+        :param image: image_digest() of what it looks like.
+        :param png: The image as the contents of a PNG file, unless it is already
+                    kept for another page.
+        """
+        if png is not None:
+            self.store_image(image, png)
+        self.images[digest] = image
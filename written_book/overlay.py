@@ -0,0 +1,160 @@
+import typing
+
+from PIL import Image
+
+from .asset_resource import Anchor2D, Overlay
+from .tiling import composite
+
+__all__ = [
+    "OverlayLayer",
+    "Placement",
+    "placement",
+]
+
+Mode = Anchor2D.AnchorMode
+
+# Where an overlay goes along one axis, as (page, overlay) multipliers in halves:
+# offset = (page * page length + overlay * overlay length) // 2
+# keyed by the anchor word, which is the same for x ("left") and y ("top").
+_OFFSETS: typing.Dict[Mode, typing.Dict[str, typing.Tuple[int, int]]] = {
+    # fully inside the page, against the anchored side
+    Mode.INSIDE: {"start": (0, 0), "center": (1, -1), "end": (2, -2)},
+    # centered on the anchored side
+    Mode.EDGE: {"start": (0, -1), "center": (1, -1), "end": (2, -1)},
+    # just past the anchored side; "inside-" words stay inside along that axis
+    Mode.OUTSIDE: {
+        "start": (0, -2),
+        "center": (1, -1),
+        "end": (2, 0),
+        "inside-start": (0, 0),
+        "inside-end": (2, -2),
+    },
+}
+
+_SIDES = {
+    "left": "start",
+    "top": "start",
+    "center": "center",
+    "right": "end",
+    "bottom": "end",
+    "inside-left": "inside-start",
+    "inside-top": "inside-start",
+    "inside-right": "inside-end",
+    "inside-bottom": "inside-end",
+}
+
+
+class Placement(typing.NamedTuple):
+    """
+    Where an overlay goes on a page, as multipliers (in halves) of the page and
+    overlay sizes along each axis. See placement().
+    """
+
+    x_page: int
+    x_size: int
+    y_page: int
+    y_size: int
+
+    def position(
+        self, page: typing.Tuple[int, int], size: typing.Tuple[int, int]
+    ) -> typing.Tuple[int, int]:
+        """
+        Get the position of an overlay on a page.
+        :param page: (width, height) of the page.
+        :param size: (width, height) of the overlay.
+        :return: Top left corner of the overlay, relative to the page; can be
+                 negative or past the page for the edge and outside modes.
+        """
+        return (
+            (self.x_page * page[0] + self.x_size * size[0]) // 2,
+            (self.y_page * page[1] + self.y_size * size[1]) // 2,
+        )
+
+
+def placement(
+    mode: Anchor2D.AnchorMode, anchor: typing.Tuple[Anchor2D.X, Anchor2D.Y]
+) -> Placement:
+    """
+    Work out where an anchor puts an overlay, once, so placing it on a page is
+    just arithmetic.
+    :param mode: How the overlay is aligned with the page edges.
+    :param anchor: (x anchor, y anchor), like Overlay.anchor.
+    :return: The placement.
+    """
+    offsets = _OFFSETS[mode]
+    x_page, x_size = offsets[_SIDES[anchor[0].value[0]]]
+    y_page, y_size = offsets[_SIDES[anchor[1].value[0]]]
+    return Placement(x_page, x_size, y_page, y_size)
+
+
+class OverlayLayer:
+    """
+    A theme's overlays with their placements worked out, ready to be composited
+    onto pages. Overlays are split into those drawn below the page content and
+    those drawn above it.
+    """
+
+    def __init__(self, overlays: typing.Iterable[Overlay]):
+        """
+        :param overlays: The overlays, in drawing order.
+        """
+        self.below: typing.List[typing.Tuple[Overlay, Placement]] = []
+        self.above: typing.List[typing.Tuple[Overlay, Placement]] = []
+        for overlay in overlays:
+            layer = self.above if overlay.above else self.below
+            layer.append((overlay, placement(overlay.mode, overlay.anchor)))
+
+    def __len__(self) -> int:
+        return len(self.below) + len(self.above)
+
+    def positions(
+        self, width: int, height: int, above: bool = False
+    ) -> typing.List[typing.Tuple[Overlay, typing.Tuple[int, int]]]:
+        """
+        Get where every overlay of one layer goes on a page.
+        :param width: Width of the page.
+        :param height: Height of the page.
+        :param above: True for the overlays drawn above the content.
+        :return: (overlay, top left corner relative to the page), in drawing order.
+        """
+        layer = self.above if above else self.below
+        return [
+            (overlay, place.position((width, height), overlay.asset.size))
+            for overlay, place in layer
+        ]
+
+    def bounds(self, width: int, height: int) -> typing.Tuple[int, int, int, int]:
+        """
+        Get the area covered by a page and all of its overlays, which can reach
+        past the page in the edge and outside modes.
+        :param width: Width of the page.
+        :param height: Height of the page.
+        :return: The area relative to the page, as a box like for Image.crop.
+        """
+        left, top, right, bottom = 0, 0, width, height
+        for above in (False, True):
+            for overlay, (x, y) in self.positions(width, height, above):
+                overlay_width, overlay_height = overlay.asset.size
+                left, top = min(left, x), min(top, y)
+                right = max(right, x + overlay_width)
+                bottom = max(bottom, y + overlay_height)
+        return left, top, right, bottom
+
+    def composite(
+        self,
+        image: Image.Image,
+        above: bool = False,
+        page: typing.Optional[typing.Tuple[int, int, int, int]] = None,
+    ):
+        """
+        Composite one layer of overlays onto a page, in place. Each overlay only
+        touches its own area, clipped to the image.
+        :param image: RGBA image to draw on.
+        :param above: True for the overlays drawn above the content.
+        :param page: Where the page is in the image, as a box like for Image.crop;
+                     defaults to all of it.
+        """
+        page = page or (0, 0, image.width, image.height)
+        width, height = page[2] - page[0], page[3] - page[1]
+        for overlay, (x, y) in self.positions(width, height, above):
+            composite(image, overlay.asset.get(), (page[0] + x, page[1] + y))
@@ -1,10 +1,346 @@
 __all__ = [
+    "PAGES_KEY",
+    "BuildStats",
+    "Options",
     "beet_default",
+    "build",
 ]
 
+import hashlib
+import os
+import re
+import typing
+
 import click
-from beet import Context
+from beet import Context, Texture
+
+from .asset_resource import shared_asset_cache
+from .compiled import theme_digest
+from .encode import COMPRESSION_PROFILES, DEFAULT_COMPRESSION, CompressionProfile
+from .font import DEFAULT_STYLES, Fonts, FontStyle, fonts_digest
+from .instrument import ENVIRONMENT_VARIABLE, count, disable, enable, span
+from .layout import Layout, ParseCache
+from .manifest import Manifest, file_digest, page_digest
+from .render import Page, PageRenderer, RenderPool, encode_unique
+from .schema import SchemaCompiler
+from .text import BREAKING_METHODS
+from .theme import Theme
+from .types import JSON, JSONObject
+
+# ctx.meta key of the pages of every document: document path -> texture location
+# of every page, in order; pages that look the same share one texture
+PAGES_KEY = "written_book.pages"
+
+# threads encoding pages while the next ones render, when not using a pool
+_ENCODE_THREADS = 2
+
+Color: typing.TypeAlias = typing.Tuple[int, int, int, int]
+
+CONFIG_SCHEMA: JSONObject = {
+    "type": "object",
+    "properties": {
+        "theme": {"type": "string"},
+        "documents": {"type": "string"},
+        "namespace": {"type": "string"},
+        "page_size": {
+            "type": "array",
+            "items": {"type": "integer", "minimum": 1},
+            "minItems": 2,
+            "maxItems": 2,
+        },
+        "workers": {"type": "integer", "minimum": 1},
+        "line_breaking": {"enum": list(BREAKING_METHODS)},
+        "compression": {"enum": list(COMPRESSION_PROFILES)},
+        "profile": {"anyOf": [{"type": "boolean"}, {"type": "string"}]},
+        "fonts": {
+            "type": "object",
+            "additionalProperties": {
+                "type": "object",
+                "properties": {
+                    "size": {"type": "integer", "minimum": 1},
+                    "source": {"type": "string"},
+                    "color": {
+                        "type": "array",
+                        "items": {"type": "integer", "minimum": 0},
+                        "minItems": 4,
+                        "maxItems": 4,
+                    },
+                },
+            },
+        },
+    },
+    "required": ["theme"],
+}
+_CONFIG = SchemaCompiler(CONFIG_SCHEMA).validator(CONFIG_SCHEMA)
+
+
+class Options(typing.NamedTuple):
+    """
+    Configuration of the plugin, from the "written_book" key of the beet.json meta.
+    """
+
+    # theme JSON, relative to the project
+    theme: str
+    # glob of the markdown documents, relative to the project
+    documents: str = "book/**/*.md"
+    # namespace the rendered pages go into
+    namespace: str = "written_book"
+    page_size: typing.Tuple[int, int] = (146, 180)
+    # processes to render pages on, defaults to the number of CPUs
+    workers: typing.Optional[int] = None
+    # style name -> how its text looks; font sources are relative to the project
+    fonts: typing.Mapping[str, FontStyle] = DEFAULT_STYLES
+    # "greedy", or "optimal" for evenly filled lines
+    line_breaking: str = "greedy"
+    # how hard to compress the rendered pages: "speed", "balanced" or "size"
+    compression: str = DEFAULT_COMPRESSION
+    # print where the build spent its time, and with a path, write a Chrome trace
+    # there (relative to the project); also see instrument.ENVIRONMENT_VARIABLE
+    profile: typing.Union[bool, str] = False
+
+    @classmethod
+    def from_meta(cls, config: JSON) -> "Options":
+        """
+        Read the plugin configuration.
+        :param config: ctx.meta["written_book"].
+        :return: The options, with defaults for anything missing.
+        """
+        _CONFIG(config, 'Meta "written_book"')
+        config = typing.cast(JSONObject, config)
+        options = cls(typing.cast(str, config["theme"]))
+        for key in (
+            "documents",
+            "namespace",
+            "workers",
+            "line_breaking",
+            "compression",
+            "profile",
+        ):
+            if key in config:
+                options = options._replace(**{key: config[key]})
+        if "page_size" in config:
+            width, height = typing.cast(typing.List[int], config["page_size"])
+            options = options._replace(page_size=(width, height))
+        if "fonts" in config:
+            fonts = dict(DEFAULT_STYLES)
+            for name, style in typing.cast(JSONObject, config["fonts"]).items():
+                style = typing.cast(JSONObject, style)
+                base = fonts.get(name, FontStyle())
+                fonts[name] = FontStyle(
+                    typing.cast(int, style.get("size", base.size)),
+                    typing.cast(typing.Optional[str], style.get("source")),
+                    typing.cast(
+                        Color, tuple(style.get("color", base.color))  # type: ignore
+                    ),
+                )
+            options = options._replace(fonts=fonts)
+        return options
+
+
+class BuildStats(typing.NamedTuple):
+    # documents found
+    documents: int
+    # documents unchanged since the last build, that weren't even read
+    skipped: int
+    # pages rendered in this build
+    rendered: int
+    # pages of changed documents that didn't need rendering again
+    reused: int
+    # pages that look the same as an earlier page, and share its texture
+    duplicates: int = 0
+    # bytes of PNG files the duplicates would have added to the resource pack
+    saved: int = 0
+
+
+def _location(namespace: str, name: str, number: int) -> str:
+    path = re.sub(r"[^a-z0-9_./-]", "_", name.rsplit(".", 1)[0].lower())
+    return f"{namespace}:{path}/{number}"
+
+
+def _render(
+    pages: typing.Sequence[Page],
+    theme_path: str,
+    cache_directory: str,
+    workers: typing.Optional[int],
+    fonts: Fonts,
+    known: typing.Collection[str],
+    profile: CompressionProfile,
+) -> typing.Iterator[typing.Tuple[Page, str, typing.Optional[bytes]]]:
+    """
+    Render pages into PNG files, on a pool of processes if there are enough
+    pages to be worth starting one. Images that look the same as one that was
+    already encoded, or is known, come back without a PNG file.
+    """
+    if not pages:
+        return
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(pages) == 1:
+        theme = Theme(theme_path, cache_directory)
+        renderer = PageRenderer(theme, fonts=fonts)
+        yield from encode_unique(renderer.pages(pages), known, profile, _ENCODE_THREADS)
+        return
+    # the workers start from the glyphs rasterized for the layout
+    fonts.save(cache_directory)
+    with RenderPool(
+        theme_path, cache_directory, min(workers, len(pages)), fonts.styles, profile
+    ) as pool:
+        yield from pool.render(pages, known)
+
+
+def _profile(ctx: Context, options: Options) -> typing.Union[bool, str]:
+    """
+    Whether to profile the build, from the environment or else the options.
+    :return: False, True to print a summary, or where to also write a trace.
+    """
+    setting = os.environ.get(ENVIRONMENT_VARIABLE, "")
+    if setting.lower() in ("", "0", "false", "no"):
+        if isinstance(options.profile, str):
+            return str(ctx.directory / options.profile)
+        return options.profile
+    if setting.lower() in ("1", "true", "yes"):
+        return True
+    return setting
+
+
+def build(ctx: Context, options: Options) -> BuildStats:
+    """
+    Render every document into textures of the context's resource pack,
+    skipping the documents that haven't changed since the last build and
+    pages that were already rendered.
+    :param ctx: The beet context.
+    :param options: The plugin configuration.
+    :return: What was done.
+    """
+    cache = ctx.cache["written_book"]
+    manifest = Manifest.load(str(cache.directory))
+    theme_path = str(ctx.directory / options.theme)
+    styles = {
+        name: style._replace(source=str(ctx.directory / style.source))
+        if style.source
+        else style
+        for name, style in options.fonts.items()
+    }
+    # everything but the documents that changes how pages are laid out or look
+    digest = hashlib.sha256(
+        repr(
+            (
+                theme_digest(theme_path, str(cache.directory)),
+                fonts_digest(styles),
+                options.page_size,
+                options.line_breaking,
+            )
+        ).encode()
+    ).hexdigest()
+    documents = sorted(
+        path for path in ctx.directory.glob(options.documents) if path.is_file()
+    )
+    trees = ParseCache(os.path.join(cache.directory, "trees"))
+    layout: typing.Optional[Layout] = None
+    fonts = Fonts.load(styles, str(cache.directory))
+    outputs: typing.List[typing.Tuple[str, typing.List[str]]] = []
+    # every page that has to be rendered, by digest, in document order
+    missing: typing.Dict[str, Page] = {}
+    skipped = reused = 0
+    with span("build.layout"):
+        for path in documents:
+            name = path.relative_to(ctx.directory).as_posix()
+            source_digest = file_digest(str(path))
+            digests = manifest.unchanged(name, source_digest, digest)
+            if digests is None:
+                if layout is None:
+                    # only load the theme if something has to be laid out
+                    theme = Theme(theme_path, str(cache.directory))
+                    layout = Layout(
+                        theme, options.page_size, fonts, breaking=options.line_breaking
+                    )
+                tree = trees.get(path.read_text("utf-8"), source_digest)
+                pages = layout.paginate(tree)
+                digests = [page_digest(page, digest) for page in pages]
+                for page, page_hash in zip(pages, digests):
+                    if manifest.has_page(page_hash) or page_hash in missing:
+                        reused += 1
+                    else:
+                        missing[page_hash] = page
+            else:
+                skipped += 1
+            manifest.record(name, source_digest, digests)
+            outputs.append((name, digests))
+
+    pages = list(missing.values())
+    # images kept from earlier builds don't need encoding again
+    known = {image for image in manifest.images.values() if manifest.has_image(image)}
+    with span("build.render"):
+        for page_hash, (_, image, png) in zip(
+            missing,
+            _render(
+                pages,
+                theme_path,
+                str(cache.directory),
+                options.workers,
+                fonts,
+                known,
+                COMPRESSION_PROFILES[options.compression],
+            ),
+        ):
+            manifest.store_page(page_hash, image, png)
+    count("fonts.rasterized", fonts.rasterized)
+    with span("build.save"):
+        fonts.save(str(cache.directory))
+        # image digest -> the location of the first page that looks like it
+        textures: typing.Dict[str, str] = {}
+        index: typing.Dict[str, typing.List[str]] = {}
+        duplicates = saved = 0
+        for name, digests in outputs:
+            locations = index[name] = []
+            for number, page_hash in enumerate(digests):
+                image = manifest.images[page_hash]
+                location = textures.get(image)
+                if location is None:
+                    location = textures[image] = _location(
+                        options.namespace, name, number
+                    )
+                    ctx.assets[location] = Texture(
+                        source_path=manifest.image_path(image)
+                    )
+                else:
+                    duplicates += 1
+                    saved += os.path.getsize(manifest.image_path(image))
+                locations.append(location)
+        ctx.meta[PAGES_KEY] = index
+        manifest.theme = digest
+        manifest.save()
+        trees.prune(
+            typing.cast(str, entry["hash"]) for entry in manifest.documents.values()
+        )
+    return BuildStats(len(documents), skipped, len(pages), reused, duplicates, saved)
 
 
 def beet_default(ctx: Context):
     click.secho("Loading documentation configuration files...", fg="yellow")
+    config = ctx.meta.get("written_book")
+    if config is None:
+        # nothing configured, nothing to do
+        return
+    options = Options.from_meta(config)
+    profile = _profile(ctx, options)
+    recorder = None
+    if profile:
+        recorder = enable(trace=isinstance(profile, str))
+        recorder.watch("assets", shared_asset_cache)
+    try:
+        with span("beet_default"):
+            stats = build(ctx, options)
+    finally:
+        if recorder is not None:
+            disable()
+    click.secho(
+        f"{stats.documents} documents, {stats.skipped} unchanged; "
+        f"{stats.rendered} pages rendered, {stats.reused} reused; "
+        f"{stats.duplicates} duplicate pages, {stats.saved / 1024:.1f} KiB saved",
+        fg="yellow",
+    )
+    if recorder is not None:
+        click.echo(recorder.summary())
+        if isinstance(profile, str):
+            recorder.write_trace(profile)
+            click.secho(f"Trace written to {profile}", fg="yellow")
@@ -0,0 +1,448 @@
+import collections
+import concurrent.futures
+import hashlib
+import multiprocessing
+import os
+import queue
+import threading
+import typing
+
+from PIL import Image
+
+from .compiled import load_theme_document
+from .encode import (
+    COMPRESSION_PROFILES,
+    DEFAULT_COMPRESSION,
+    CompressionProfile,
+    Encoder,
+    png_bytes,
+)
+from .font import Fonts, FontStyle
+from .frame import CODE, HORIZONTAL_RULE, PAGE, Bar, BarStyle, Frame, FrameStyle
+from .instrument import traced
+from .theme import Theme
+from .tiling import composite
+
+__all__ = [
+    "BarCommand",
+    "DrawCommand",
+    "FeatureCommand",
+    "FrameCommand",
+    "ImageCommand",
+    "Page",
+    "PageRenderer",
+    "RenderPool",
+    "TextCommand",
+    "encode_unique",
+    "image_digest",
+]
+
+Box: typing.TypeAlias = typing.Tuple[int, int, int, int]
+Point: typing.TypeAlias = typing.Tuple[int, int]
+
+
+class FrameCommand(typing.NamedTuple):
+    """
+    Draw a frame, like the border and background of a code block.
+    """
+
+    box: Box
+    style: FrameStyle = CODE
+
+
+class BarCommand(typing.NamedTuple):
+    """
+    Draw a bar, like a horizontal rule or the side of a block quote.
+    """
+
+    position: Point
+    length: int
+    style: BarStyle = HORIZONTAL_RULE
+
+
+class FeatureCommand(typing.NamedTuple):
+    """
+    Draw a single (0-dimensional) feature, like a bullet.
+    """
+
+    position: Point
+    feature: str = "bullet"
+
+
+class ImageCommand(typing.NamedTuple):
+    """
+    Draw an image that was made elsewhere, like a line of text.
+    """
+
+    position: Point
+    image: Image.Image
+
+
+class TextCommand(typing.NamedTuple):
+    """
+    Draw a line of text, in a style like "body", "code" or "h1".
+    """
+
+    position: Point
+    text: str
+    style: str = "body"
+
+
+DrawCommand: typing.TypeAlias = typing.Union[
+    FrameCommand, BarCommand, FeatureCommand, ImageCommand, TextCommand
+]
+
+
+class Page(typing.NamedTuple):
+    """
+    Everything needed to render one page, without any pixels.
+    """
+
+    number: int
+    size: Point
+    commands: typing.Sequence[DrawCommand] = ()
+
+
+class _Failed(typing.NamedTuple):
+    error: BaseException
+
+
+# what the prefetch thread hands over: a page, its error, or None after the last page
+_Prefetched = typing.Union[typing.Tuple[Page, Image.Image], _Failed, None]
+
+
+class PageRenderer:
+    """
+    Renders pages one at a time: the theme's page frame, the overlays below the
+    content, the page's draw commands, then the overlays above the content.
+    Pages are streamed, so however long a book is only a few page buffers are
+    ever alive at once.
+    """
+
+    def __init__(
+        self, theme: Theme, prefetch: int = 0, fonts: typing.Optional[Fonts] = None
+    ):
+        """
+        :param theme: The theme to render with.
+        :param prefetch: How many pages to render ahead on a background thread
+                         while the current one is being used; 0 renders each
+                         page on demand in the calling thread.
+        :param fonts: Draws text; defaults to Fonts() with the default styles.
+        """
+        if prefetch < 0:
+            raise ValueError(f"prefetch must be at least 0, not {prefetch}")
+        self.theme = theme
+        self.prefetch = prefetch
+        self.fonts = fonts or Fonts()
+        self.page_frame = Frame.from_theme(theme, PAGE)
+        self._frames: typing.Dict[FrameStyle, Frame] = {PAGE: self.page_frame}
+        self._bars: typing.Dict[BarStyle, Bar] = {}
+
+    def frame(self, style: FrameStyle) -> Frame:
+        """
+        Get the theme's frame for a style, made once.
+        """
+        frame = self._frames.get(style)
+        if frame is None:
+            frame = self._frames[style] = Frame.from_theme(self.theme, style)
+        return frame
+
+    def bar(self, style: BarStyle) -> Bar:
+        """
+        Get the theme's bar for a style, made once.
+        """
+        bar = self._bars.get(style)
+        if bar is None:
+            bar = self._bars[style] = Bar.from_theme(self.theme, style)
+        return bar
+
+    def draw(self, image: Image.Image, command: DrawCommand):
+        """
+        Carry out a single draw command on a page.
+        :param image: The page.
+        :param command: What to draw.
+        """
+        if isinstance(command, FrameCommand):
+            self.frame(command.style).draw(image, command.box)
+        elif isinstance(command, BarCommand):
+            self.bar(command.style).draw(image, command.position, command.length)
+        elif isinstance(command, FeatureCommand):
+            feature = self.theme.get(command.feature)
+            if feature is not None:
+                composite(image, feature.asset.get(), command.position)
+        elif isinstance(command, ImageCommand):
+            composite(image, command.image, command.position)
+        else:
+            self.fonts.draw(image, command.position, command.text, command.style)
+
+    @traced("render.page")
+    def render(self, page: Page) -> Image.Image:
+        """
+        Render one page.
+        :param page: The page.
+        :return: A new RGBA image of the page.
+        """
+        image = self.page_frame.render(*page.size)
+        overlays = self.theme.overlay_layer
+        overlays.composite(image)
+        for command in page.commands:
+            self.draw(image, command)
+        overlays.composite(image, above=True)
+        return image
+
+    def pages(
+        self, pages: typing.Iterable[Page]
+    ) -> typing.Generator[typing.Tuple[Page, Image.Image], None, None]:
+        """
+        Render pages lazily, one at a time.
+        Each image is closed (and its memory freed) as soon as the next page is
+        asked for, so save or copy it before moving on.
+        :param pages: The pages; can be a generator, it is only read as needed.
+        :return: (page, image) for every page, in order.
+        """
+        rendered = self._prefetched(pages) if self.prefetch else self._serial(pages)
+        for page, image in rendered:
+            try:
+                yield page, image
+            finally:
+                image.close()
+
+    def write(
+        self,
+        pages: typing.Iterable[Page],
+        sink: typing.Callable[[Page, Image.Image], None],
+    ) -> int:
+        """
+        Render pages and hand each one to a sink, like a function saving it into
+        the output pack, freeing it before rendering continues.
+        :param pages: The pages.
+        :param sink: Called with every page and its image.
+        :return: How many pages were written.
+        """
+        count = 0
+        for page, image in self.pages(pages):
+            sink(page, image)
+            count += 1
+        return count
+
+    def _serial(
+        self, pages: typing.Iterable[Page]
+    ) -> typing.Iterator[typing.Tuple[Page, Image.Image]]:
+        for page in pages:
+            yield page, self.render(page)
+
+    def _prefetched(
+        self, pages: typing.Iterable[Page]
+    ) -> typing.Iterator[typing.Tuple[Page, Image.Image]]:
+        # bounded, so the thread can only get prefetch pages ahead
+        ready: "queue.Queue[_Prefetched]" = queue.Queue(self.prefetch)
+        stop = threading.Event()
+
+        def put(item: _Prefetched) -> bool:
+            while not stop.is_set():
+                try:
+                    ready.put(item, timeout=0.05)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                for page in pages:
+                    image = self.render(page)
+                    if not put((page, image)):
+                        image.close()
+                        return
+                put(None)
+            except BaseException as e:
+                put(_Failed(e))
+
+        thread = threading.Thread(
+            target=produce, name="written_book.render", daemon=True
+        )
+        thread.start()
+        try:
+            while True:
+                item = ready.get()
+                if item is None:
+                    return
+                if isinstance(item, _Failed):
+                    raise item.error
+                yield item
+        finally:
+            stop.set()
+            # let go of anything rendered ahead that won't be used
+            while thread.is_alive() or not ready.empty():
+                try:
+                    item = ready.get(timeout=0.05)
+                except queue.Empty:
+                    continue
+                if item is not None and not isinstance(item, _Failed):
+                    item[1].close()
+            thread.join()
+
+
+@traced("render.hash")
+def image_digest(image: Image.Image) -> str:
+    """
+    Hash the pixels of an image, so that images that look the same are only
+    encoded and stored once.
+    :param image: The image.
+    :return: Hex digest.
+    """
+    digest = hashlib.sha256(repr((image.mode, image.size)).encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def encode_unique(
+    rendered: typing.Iterable[typing.Tuple[Page, Image.Image]],
+    known: typing.Iterable[str] = (),
+    profile: CompressionProfile = COMPRESSION_PROFILES[DEFAULT_COMPRESSION],
+    threads: int = 0,
+) -> typing.Iterator[typing.Tuple[Page, str, typing.Optional[bytes]]]:
+    """
+    Encode rendered pages as PNG files, skipping the ones that look the same as
+    a page encoded before.
+    :param rendered: (page, image) pairs, like from PageRenderer.pages().
+    :param known: image_digest() of images that don't need encoding at all.
+    :param profile: How hard to compress.
+    :param threads: Encode this many pages on threads while the next pages
+                    render, see Encoder; 0 encodes each page before moving on.
+    :return: (page, image digest, PNG file contents or None for a duplicate),
+             in order.
+    """
+    seen = set(known)
+    pending: typing.Deque[
+        typing.Tuple[Page, str, typing.Optional["concurrent.futures.Future[bytes]"]]
+    ] = collections.deque()
+
+    def finish() -> typing.Tuple[Page, str, typing.Optional[bytes]]:
+        page, digest, png = pending.popleft()
+        return page, digest, None if png is None else png.result()
+
+    with Encoder(profile, threads) as encoder:
+        for page, image in rendered:
+            digest = image_digest(image)
+            png = None
+            if digest not in seen:
+                seen.add(digest)
+                png = encoder.submit(image)
+            pending.append((page, digest, png))
+            # in order, and with no more than threads pages encoding at once
+            while pending and (
+                len(pending) > threads or pending[0][2] is None or pending[0][2].done()
+            ):
+                yield finish()
+        while pending:
+            yield finish()
+
+
+# the renderer of a RenderPool worker process
+_worker: typing.Optional[PageRenderer] = None
+# image digest -> pid of the worker encoding it, shared by the workers of a pool
+_claims: typing.Optional[typing.MutableMapping[str, int]] = None
+# images this worker encoded
+_encoded: typing.Set[str] = set()
+_profile = COMPRESSION_PROFILES[DEFAULT_COMPRESSION]
+
+
+def _start_worker(
+    theme_path: str,
+    cache_directory: str,
+    styles: typing.Optional[typing.Mapping[str, FontStyle]],
+    claims: typing.MutableMapping[str, int],
+    profile: CompressionProfile,
+):
+    global _worker, _claims, _profile
+    fonts = Fonts.load(styles, cache_directory) if styles is not None else None
+    _worker = PageRenderer(Theme(theme_path, cache_directory), fonts=fonts)
+    _claims = claims
+    _profile = profile
+
+
+def _render_worker(page: Page) -> typing.Tuple[str, typing.Optional[bytes]]:
+    assert _worker is not None and _claims is not None
+    image = _worker.render(page)
+    try:
+        digest = image_digest(image)
+        if digest in _encoded:
+            return digest, None
+        # the first worker to get to an image encodes it
+        pid = os.getpid()
+        if _claims.setdefault(digest, pid) != pid:
+            return digest, None
+        _encoded.add(digest)
+        return digest, png_bytes(image, _profile)
+    finally:
+        image.close()
+
+
+class RenderPool:
+    """
+    Renders pages on several processes at once.
+    The theme is compiled once, up front, and every worker loads the compiled
+    theme: a single read per worker, without decoding any PNGs. Glyphs come from
+    the saved glyph atlas in the same way. Pages come back
+    encoded as PNG files, in the order they were given, so the results are the
+    same as rendering them one by one with encode_unique(): every image is
+    encoded by only one of the workers.
+    """
+
+    def __init__(
+        self,
+        theme_path: str,
+        cache_directory: str,
+        workers: typing.Optional[int] = None,
+        styles: typing.Optional[typing.Mapping[str, FontStyle]] = None,
+        profile: CompressionProfile = COMPRESSION_PROFILES[DEFAULT_COMPRESSION],
+    ):
+        """
+        :param theme_path: Path to the theme JSON.
+        :param cache_directory: Where compiled themes are kept.
+        :param workers: Number of processes; defaults to the number of CPUs.
+        :param styles: Font styles. Workers load the glyph atlas saved for them
+                       with Fonts.save(), so save it first to not rasterize
+                       glyphs in every worker.
+        :param profile: How hard to compress the PNG files.
+        """
+        self.workers = workers or os.cpu_count() or 1
+        load_theme_document(theme_path, cache_directory)
+        self._manager = multiprocessing.Manager()
+        self._claims = self._manager.dict()
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            self.workers,
+            initializer=_start_worker,
+            initargs=(theme_path, cache_directory, styles, self._claims, profile),
+        )
+
+    def __enter__(self) -> "RenderPool":
+        return self
+
+    def __exit__(self, *args: typing.Any):
+        self.close()
+
+    def close(self):
+        """
+        Stop the worker processes.
+        """
+        self._executor.shutdown(cancel_futures=True)
+        self._manager.shutdown()
+
+    def render(
+        self, pages: typing.Sequence[Page], known: typing.Iterable[str] = ()
+    ) -> typing.Iterator[typing.Tuple[Page, str, typing.Optional[bytes]]]:
+        """
+        Render pages in the worker processes.
+        :param pages: The pages.
+        :param known: image_digest() of images that don't need encoding at all.
+        :return: (page, image digest, PNG file contents or None for a duplicate)
+                 for every page, in order.
+        """
+        self._claims.update(dict.fromkeys(known, 0))
+        # a few chunks per worker: big enough to keep pickling overhead down,
+        # small enough to spread uneven pages around
+        chunksize = max(1, len(pages) // (self.workers * 4))
+        results = self._executor.map(_render_worker, pages, chunksize=chunksize)
+        return ((page, digest, png) for page, (digest, png) in zip(pages, results))
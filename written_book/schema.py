@@ -0,0 +1,408 @@
+import json
+import os
+import typing
+
+from .exceptions import ValidationError
+from .types import JSON, JSONObject
+
+__all__ = [
+    "SchemaCompiler",
+    "THEME_SCHEMA",
+    "Validator",
+    "theme_schema",
+]
+
+THEME_SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "theme-schema.json")
+
+# keywords that don't affect validation
+IGNORED_KEYWORDS = frozenset(
+    [
+        "$schema",
+        "$id",
+        "$comment",
+        "title",
+        "description",
+        "default",
+        "examples",
+        "definitions",
+    ]
+)
+
+# keyword -> SchemaCompiler method building its check
+KEYWORDS = {
+    "$ref": "_ref",
+    "type": "_type",
+    "enum": "_enum",
+    "const": "_const",
+    "required": "_required",
+    "properties": "_properties",
+    "items": "_items",
+    "minimum": "_minimum",
+    "allOf": "_allOf",
+    "anyOf": "_anyOf",
+    "oneOf": "_oneOf",
+}
+# keywords checked by the builder of another keyword
+SECONDARY_KEYWORDS = frozenset(["additionalProperties", "minItems", "maxItems"])
+
+
+class _Errors(typing.List[ValidationError]):
+    """
+    Where a compiled check reports problems.
+    In first-error mode, reporting a problem raises it straight away.
+    """
+
+    def __init__(self, raise_first: bool):
+        super().__init__()
+        self.raise_first = raise_first
+
+    def add(self, message: str, error_code: ValidationError.ErrorCode):
+        self.report(ValidationError(message, error_code))
+
+    def report(self, error: ValidationError):
+        if self.raise_first:
+            raise error
+        self.append(error)
+
+
+Check: typing.TypeAlias = typing.Callable[[JSON, str, _Errors], None]
+
+
+def _is_integer(value: JSON) -> bool:
+    return (isinstance(value, int) and not isinstance(value, bool)) or (
+        isinstance(value, float) and value.is_integer()
+    )
+
+
+def _is_number(value: JSON) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+# JSON schema type -> (test, description used in messages)
+TYPES: typing.Dict[str, typing.Tuple[typing.Callable[[JSON], bool], str]] = {
+    "object": (lambda value: isinstance(value, dict), "a dict"),
+    "array": (lambda value: isinstance(value, list), "a list"),
+    "string": (lambda value: isinstance(value, str), "a string"),
+    "integer": (_is_integer, "an integer"),
+    "number": (_is_number, "a number"),
+    "boolean": (lambda value: isinstance(value, bool), "a boolean"),
+    "null": (lambda value: value is None, "null"),
+}
+
+
+def _type_name(value: JSON) -> str:
+    return value.__class__.__name__
+
+
+class Validator:
+    """
+    A compiled schema. Call it to raise the first problem found, or use
+    errors() to get every problem at once.
+    """
+
+    def __init__(self, check: Check):
+        self._check = check
+
+    def __call__(self, value: JSON, label: str):
+        """
+        Validate a value, raising a ValidationError for the first problem.
+        :param value: JSON python representation, by json.load[s].
+        :param label: What the value is, used to start error messages;
+                      like "JSON body for AssetResource".
+        """
+        self._check(value, label, _Errors(True))
+
+    def errors(self, value: JSON, label: str) -> typing.List[ValidationError]:
+        """
+        Validate a value, collecting every problem.
+        :param value: JSON python representation, by json.load[s].
+        :param label: What the value is, used to start error messages.
+        :return: The problems, empty if the value is valid.
+        """
+        errors = _Errors(False)
+        self._check(value, label, errors)
+        return errors
+
+
+class SchemaCompiler:
+    """
+    Turns (the parts of) JSON schema (draft 7) used by the theme schema into
+    plain python functions, so a schema is only interpreted once.
+    """
+
+    def __init__(self, root: JSONObject):
+        """
+        :param root: The document that "$ref"s are resolved in.
+        """
+        self.root = root
+        self._refs: typing.Dict[str, Check] = {}
+
+    def validator(self, node: JSON) -> Validator:
+        """
+        Compile a schema (or a part of one, like {"$ref": "#/definitions/x"}).
+        :param node: The schema.
+        :return: The compiled validator.
+        """
+        return Validator(self.compile(node))
+
+    def _resolve(self, pointer: str) -> Check:
+        if pointer in self._refs:
+            return self._refs[pointer]
+        if not pointer.startswith("#"):
+            raise ValueError(
+                f"Only local schema references are supported, not {pointer}"
+            )
+        target: JSON = self.root
+        for part in pointer[1:].split("/")[1:]:
+            part = part.replace("~1", "/").replace("~0", "~")
+            if not isinstance(target, dict) or part not in target:
+                raise ValueError(f"Schema reference {pointer} doesn't point anywhere")
+            target = target[part]
+        # compiled lazily, so recursive references work
+        compiled: typing.List[Check] = []
+
+        def check(value: JSON, label: str, errors: _Errors):
+            if not compiled:
+                compiled.append(self.compile(target))
+            compiled[0](value, label, errors)
+
+        self._refs[pointer] = check
+        return check
+
+    def compile(self, node: JSON) -> Check:
+        """
+        Compile a schema node into a check function.
+        :param node: The schema node.
+        :return: A function taking (value, label, errors).
+        """
+        if node is True or node == {}:
+            return lambda value, label, errors: None
+        if node is False:
+
+            def never(value: JSON, label: str, errors: _Errors):
+                errors.add(
+                    f"{label} isn't allowed", ValidationError.ErrorCode.INVALID_VALUE
+                )
+
+            return never
+        if not isinstance(node, dict):
+            raise ValueError(f"Schema nodes should be objects, not {_type_name(node)}")
+
+        checks: typing.List[Check] = []
+        for keyword in node:
+            if keyword in IGNORED_KEYWORDS or keyword in SECONDARY_KEYWORDS:
+                continue
+            if keyword not in KEYWORDS:
+                raise ValueError(f"Schema keyword {keyword} isn't supported")
+            checks.append(getattr(self, KEYWORDS[keyword])(node))
+        if "additionalProperties" in node and "properties" not in node:
+            checks.append(self._properties({**node, "properties": {}}))
+        if ("minItems" in node or "maxItems" in node) and "items" not in node:
+            checks.append(self._items({**node, "items": {}}))
+
+        if len(checks) == 1:
+            return checks[0]
+
+        def check_all(value: JSON, label: str, errors: _Errors):
+            for check in checks:
+                check(value, label, errors)
+
+        return check_all
+
+    # one builder per keyword
+
+    def _ref(self, node: JSONObject) -> Check:
+        return self._resolve(typing.cast(str, node["$ref"]))
+
+    def _type(self, node: JSONObject) -> Check:
+        names = node["type"]
+        names = (
+            [names] if isinstance(names, str) else typing.cast(typing.List[str], names)
+        )
+        tests = [TYPES[name][0] for name in names]
+        expected = " or ".join(TYPES[name][1] for name in names)
+
+        def check(value: JSON, label: str, errors: _Errors):
+            if not any(test(value) for test in tests):
+                errors.add(
+                    f"{label} should be {expected}, not {_type_name(value)}",
+                    ValidationError.ErrorCode.WRONG_TYPE,
+                )
+
+        return check
+
+    def _enum(self, node: JSONObject) -> Check:
+        options = typing.cast(typing.List[JSON], node["enum"])
+        listing = ", ".join(json.dumps(option) for option in options)
+        if all(isinstance(o, (str, int, float, bool, type(None))) for o in options):
+            allowed = frozenset(
+                (type(o), o) for o in typing.cast(typing.List[typing.Hashable], options)
+            )
+
+            def contains(value: JSON) -> bool:
+                try:
+                    return (type(value), value) in allowed
+                except TypeError:  # unhashable, so can't be one of them
+                    return False
+
+        else:
+
+            def contains(value: JSON) -> bool:
+                return value in options
+
+        def check(value: JSON, label: str, errors: _Errors):
+            if not contains(value):
+                errors.add(
+                    f"{label} should be one of {listing}, not {json.dumps(value)}",
+                    ValidationError.ErrorCode.INVALID_VALUE,
+                )
+
+        return check
+
+    def _const(self, node: JSONObject) -> Check:
+        expected = node["const"]
+
+        def check(value: JSON, label: str, errors: _Errors):
+            if value != expected or type(value) is not type(expected):
+                errors.add(
+                    f"{label} should be {json.dumps(expected)}, not {json.dumps(value)}",
+                    ValidationError.ErrorCode.INVALID_VALUE,
+                )
+
+        return check
+
+    def _required(self, node: JSONObject) -> Check:
+        keys = typing.cast(typing.List[str], node["required"])
+
+        def check(value: JSON, label: str, errors: _Errors):
+            if not isinstance(value, dict):
+                return
+            for key in keys:
+                if key not in value:
+                    errors.add(
+                        f'{label} requires a "{key}".',
+                        ValidationError.ErrorCode.MISSING_VALUE,
+                    )
+
+        return check
+
+    def _properties(self, node: JSONObject) -> Check:
+        properties = {
+            key: self.compile(sub)
+            for key, sub in typing.cast(JSONObject, node["properties"]).items()
+        }
+        extra = node.get("additionalProperties", True)
+        check_extra = None if extra is True else self.compile(extra)
+
+        def check(value: JSON, label: str, errors: _Errors):
+            if not isinstance(value, dict):
+                return
+            for key, item in value.items():
+                sub = properties.get(key, check_extra)
+                if sub is not None:
+                    sub(item, f"{label} {key}", errors)
+
+        return check
+
+    def _items(self, node: JSONObject) -> Check:
+        items = node["items"]
+        if isinstance(items, list):
+            raise ValueError("Tuple-style items aren't supported")
+        sub = None if items in (True, {}) else self.compile(items)
+        min_items = typing.cast(typing.Optional[int], node.get("minItems"))
+        max_items = typing.cast(typing.Optional[int], node.get("maxItems"))
+
+        def check(value: JSON, label: str, errors: _Errors):
+            if not isinstance(value, list):
+                return
+            count = len(value)
+            if min_items is not None and count < min_items:
+                errors.add(
+                    f"{label} should have at least {min_items} items, got {count}",
+                    ValidationError.ErrorCode.INVALID_VALUE,
+                )
+            if max_items is not None and count > max_items:
+                errors.add(
+                    f"{label} should have at most {max_items} items, got {count}",
+                    ValidationError.ErrorCode.INVALID_VALUE,
+                )
+            if sub is not None:
+                for index, item in enumerate(value):
+                    sub(item, f"{label}[{index}]", errors)
+
+        return check
+
+    def _minimum(self, node: JSONObject) -> Check:
+        minimum = typing.cast(float, node["minimum"])
+
+        def check(value: JSON, label: str, errors: _Errors):
+            if _is_number(value) and typing.cast(float, value) < minimum:
+                errors.add(
+                    f"{label} should be at least {minimum}, got {value}",
+                    ValidationError.ErrorCode.INVALID_VALUE,
+                )
+
+        return check
+
+    def _allOf(self, node: JSONObject) -> Check:
+        branches = [
+            self.compile(sub) for sub in typing.cast(typing.List[JSON], node["allOf"])
+        ]
+
+        def check(value: JSON, label: str, errors: _Errors):
+            for branch in branches:
+                branch(value, label, errors)
+
+        return check
+
+    def _branches(
+        self, node: JSONObject, keyword: str
+    ) -> typing.Callable[[JSON, str], typing.List[typing.List[ValidationError]]]:
+        branches = [
+            self.compile(sub) for sub in typing.cast(typing.List[JSON], node[keyword])
+        ]
+
+        def run(value: JSON, label: str) -> typing.List[typing.List[ValidationError]]:
+            results: typing.List[typing.List[ValidationError]] = []
+            for branch in branches:
+                found = _Errors(False)
+                branch(value, label, found)
+                results.append(found)
+            return results
+
+        return run
+
+    def _anyOf(self, node: JSONObject) -> Check:
+        run = self._branches(node, "anyOf")
+
+        def check(value: JSON, label: str, errors: _Errors):
+            results = run(value, label)
+            if all(results):
+                # report the option that came closest
+                for error in min(results, key=len):
+                    errors.report(error)
+
+        return check
+
+    def _oneOf(self, node: JSONObject) -> Check:
+        run = self._branches(node, "oneOf")
+
+        def check(value: JSON, label: str, errors: _Errors):
+            results = run(value, label)
+            passed = sum(1 for found in results if not found)
+            if passed == 0:
+                for error in min(results, key=len):
+                    errors.report(error)
+            elif passed > 1:
+                errors.add(
+                    f"{label} matches more than one of the allowed forms",
+                    ValidationError.ErrorCode.INVALID_VALUE,
+                )
+
+        return check
+
+
+with open(THEME_SCHEMA_PATH) as _f:
+    THEME_SCHEMA: JSONObject = json.load(_f)
+
+theme_schema = SchemaCompiler(THEME_SCHEMA)
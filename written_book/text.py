@@ -0,0 +1,257 @@
+import typing
+
+import numpy as np
+
+from .cache import LRUCache
+
+__all__ = [
+    "BREAKING_METHODS",
+    "FixedMetrics",
+    "MeasuredText",
+    "TextFitter",
+    "TextMetrics",
+]
+
+BREAKING_METHODS = ("greedy", "optimal")
+
+# widths are sums of float advances
+_EPSILON = 1e-6
+
+
+class TextMetrics(typing.Protocol):
+    """
+    Measures text, so it can be laid out.
+    """
+
+    def line_height(self, style: str) -> int:
+        ...
+
+    def width(self, text: str, style: str) -> int:
+        ...
+
+    def advances(self, text: str, style: str) -> typing.Sequence[float]:
+        ...
+
+
+class FixedMetrics:
+    """
+    Text metrics of a monospaced font: every character is as wide as any other.
+    """
+
+    def __init__(self, char_width: int = 6, line_height: int = 10):
+        self.char_width = char_width
+        self._line_height = line_height
+
+    def line_height(self, style: str) -> int:
+        return self._line_height
+
+    def width(self, text: str, style: str) -> int:
+        return len(text) * self.char_width
+
+    def advances(self, text: str, style: str) -> typing.Sequence[float]:
+        return [float(self.char_width)] * len(text)
+
+
+class MeasuredText:
+    """
+    A line of text (like a paragraph) measured once, so it can be broken into
+    lines of any width without measuring anything again: the width of any part
+    of it is the difference of two cumulative sums.
+    Lines break at spaces; words wider than a whole line are split.
+    """
+
+    def __init__(self, text: str, advances: typing.Sequence[float]):
+        """
+        :param text: The text.
+        :param advances: How far the pen moves after each character of it.
+        """
+        self.text = text
+        # offsets[i] is the width of text[:i]
+        self.offsets = np.zeros(len(text) + 1)
+        np.cumsum(np.asarray(advances, dtype=np.float64), out=self.offsets[1:])
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+        word = codes != ord(" ")
+        before = np.concatenate(([False], word[:-1]))
+        after = np.concatenate((word[1:], [False]))
+        # character spans of the words; the first also takes any leading spaces
+        self.starts = np.flatnonzero(word & ~before)
+        self.ends = np.flatnonzero(word & ~after) + 1
+        if len(self.starts):
+            self.starts[0] = 0
+
+    @classmethod
+    def measure(cls, text: str, metrics: TextMetrics, style: str) -> "MeasuredText":
+        return cls(text, metrics.advances(text, style))
+
+    @property
+    def nbytes(self) -> int:
+        return self.offsets.nbytes + self.starts.nbytes + self.ends.nbytes
+
+    def width(self, start: int = 0, end: typing.Optional[int] = None) -> float:
+        """
+        Get the width of text[start:end].
+        """
+        return float(self.offsets[len(self.text) if end is None else end]) - float(
+            self.offsets[start]
+        )
+
+    def _words(self, width: float) -> typing.Tuple[np.ndarray, np.ndarray]:
+        starts, ends = self.starts, self.ends
+        offsets = self.offsets
+        wide = np.flatnonzero(offsets[ends] - offsets[starts] > width + _EPSILON)
+        if not len(wide):
+            return starts, ends
+        # split the words that don't fit on a line at all
+        new_starts: typing.List[int] = []
+        new_ends: typing.List[int] = []
+        previous = 0
+        for index in wide:
+            new_starts.extend(starts[previous:index])
+            new_ends.extend(ends[previous:index])
+            start, end = int(starts[index]), int(ends[index])
+            while offsets[end] - offsets[start] > width + _EPSILON:
+                cut = int(
+                    np.searchsorted(
+                        offsets, float(offsets[start]) + width + _EPSILON, "right"
+                    )
+                )
+                cut = max(start + 1, cut - 1)
+                new_starts.append(start)
+                new_ends.append(cut)
+                start = cut
+            new_starts.append(start)
+            new_ends.append(end)
+            previous = index + 1
+        new_starts.extend(starts[previous:])
+        new_ends.extend(ends[previous:])
+        return np.array(new_starts), np.array(new_ends)
+
+    def greedy(self, width: float) -> typing.List[typing.Tuple[int, int]]:
+        """
+        Break into lines greedily: every line takes as many words as fit.
+        One binary search per line.
+        :param width: Width of a line.
+        :return: Character spans of the lines.
+        """
+        starts, ends = self._words(width)
+        if not len(starts):
+            return [(0, 0)]
+        line_starts = self.offsets[starts]
+        line_ends = self.offsets[ends]
+        lines: typing.List[typing.Tuple[int, int]] = []
+        first = 0
+        while first < len(starts):
+            last = int(
+                np.searchsorted(
+                    line_ends, float(line_starts[first]) + width + _EPSILON, "right"
+                )
+            )
+            last = max(first + 1, last)
+            lines.append((int(starts[first]), int(ends[last - 1])))
+            first = last
+        return lines
+
+    def optimal(self, width: float) -> typing.List[typing.Tuple[int, int]]:
+        """
+        Break into lines so that they are as even as possible, like Knuth and
+        Plass: the sum of the squares of the space left at the end of every line
+        but the last is minimal. Only breaks that fit are considered, so the cost
+        is linear in the number of words times the words on a line.
+        :param width: Width of a line.
+        :return: Character spans of the lines.
+        """
+        starts, ends = self._words(width)
+        count = len(starts)
+        if not count:
+            return [(0, 0)]
+        line_starts = self.offsets[starts]
+        line_ends = self.offsets[ends]
+        # the first word of the longest line that can end with every word
+        earliest = np.searchsorted(line_starts, line_ends - width - _EPSILON, "left")
+        # cost[i]: of breaking the first i words into lines; start[i]: where the
+        # last of those lines starts
+        cost = np.zeros(count + 1)
+        start = np.zeros(count + 1, dtype=np.int64)
+        for last in range(count):
+            first = min(int(earliest[last]), last)
+            candidates = cost[first : last + 1]
+            if last == count - 1:
+                # the last line can be as short as it likes
+                slack = np.zeros(last + 1 - first)
+            else:
+                slack = width - (line_ends[last] - line_starts[first : last + 1])
+            total = candidates + slack * slack
+            best = int(np.argmin(total))
+            cost[last + 1] = total[best]
+            start[last + 1] = first + best
+        lines: typing.List[typing.Tuple[int, int]] = []
+        end = count
+        while end > 0:
+            first = int(start[end])
+            lines.append((int(starts[first]), int(ends[end - 1])))
+            end = first
+        lines.reverse()
+        return lines
+
+    def lines(self, width: float, method: str = "greedy") -> typing.List[str]:
+        """
+        Break into lines.
+        :param width: Width of a line.
+        :param method: "greedy" or "optimal".
+        :return: The text of every line.
+        """
+        if method == "greedy":
+            spans = self.greedy(width)
+        elif method == "optimal":
+            spans = self.optimal(width)
+        else:
+            raise ValueError(
+                f"method must be one of {', '.join(BREAKING_METHODS)}, not {method}"
+            )
+        return [self.text[start:end] for start, end in spans]
+
+
+class TextFitter:
+    """
+    Breaks text into lines, remembering how wide the text was, so laying out a
+    book again at another width doesn't measure any text.
+    """
+
+    def __init__(
+        self,
+        metrics: TextMetrics,
+        method: str = "greedy",
+        max_bytes: int = 64 * 1024**2,
+    ):
+        """
+        :param metrics: Measures text.
+        :param method: How to break lines, "greedy" or "optimal".
+        :param max_bytes: Byte budget of the measurements kept.
+        """
+        if method not in BREAKING_METHODS:
+            raise ValueError(
+                f"method must be one of {', '.join(BREAKING_METHODS)}, not {method}"
+            )
+        self.metrics = metrics
+        self.method = method
+        self._measured: LRUCache[typing.Tuple[str, str], MeasuredText] = LRUCache(
+            max_bytes, lambda measured: measured.nbytes
+        )
+
+    def measure(self, text: str, style: str) -> MeasuredText:
+        measured = self._measured.get((style, text))
+        if measured is None:
+            measured = MeasuredText.measure(text, self.metrics, style)
+            self._measured.put((style, text), measured)
+        return measured
+
+    def lines(self, text: str, width: int, style: str = "body") -> typing.List[str]:
+        """
+        Break text into lines no wider than a width (except for single
+        characters that are wider).
+        :param text: The text.
+        :param width: Width of a line.
+        :param style: Style of the text.
+        :return: The lines, at least one.
+        """
+        return self.measure(text, style).lines(width, self.method)
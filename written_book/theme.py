@@ -1,3 +1,109 @@
+import os
+import types
+import typing
+
+from .asset_resource import AssetResource, Feature, Overlay, normalize_path
+from .compiled import load_theme
+from .instrument import traced
+from .overlay import OverlayLayer
+from .types import JSON, JSONObject
+
+__all__ = [
+    "Theme",
+]
+
+F = typing.TypeVar("F", bound=Feature)
+
+
 class Theme:
-    def __init__(self, config_path: str):
-        self.config_path = config_path
+    """
+    A loaded theme file: features indexed by their type, with their overrides
+    attached, plus overlays and colors.
+    The structure can't be changed after loading, so it can be shared.
+    """
+
+    __slots__ = ("config_path", "_features", "_overlays", "_overlay_layer", "_colors")
+
+    @traced("theme.load")
+    def __init__(
+        self,
+        config_path: str,
+        cache_directory: typing.Optional[str] = None,
+        workers: typing.Optional[int] = None,
+    ):
+        """
+        :param config_path: Path to the theme JSON.
+        :param cache_directory: Where to keep compiled themes, or None to not cache.
+        :param workers: Number of threads for decoding assets.
+        """
+        config_path = normalize_path(config_path)
+        loaded = load_theme(config_path, cache_directory, workers)
+        features = loaded.features
+        overlays = tuple(loaded.overlays)
+        colors = typing.cast(JSONObject, loaded.document.get("colors", {}))
+
+        object.__setattr__(self, "config_path", config_path)
+        object.__setattr__(self, "_features", types.MappingProxyType(features))
+        object.__setattr__(self, "_overlays", overlays)
+        # placements are worked out here, once, instead of for every page
+        object.__setattr__(self, "_overlay_layer", OverlayLayer(overlays))
+        object.__setattr__(self, "_colors", types.MappingProxyType(dict(colors)))
+
+    def __setattr__(self, name: str, value: typing.Any):
+        raise AttributeError(f"Theme is read-only, can't set {name}")
+
+    def __delattr__(self, name: str):
+        raise AttributeError(f"Theme is read-only, can't delete {name}")
+
+    @property
+    def theme_directory(self) -> str:
+        return os.path.dirname(self.config_path)
+
+    @property
+    def features(self) -> typing.Mapping[str, Feature]:
+        """
+        Every feature, by feature type.
+        """
+        return self._features
+
+    @property
+    def overlays(self) -> typing.Tuple[Overlay, ...]:
+        return self._overlays
+
+    @property
+    def overlay_layer(self) -> OverlayLayer:
+        """
+        The overlays, placed and ready to composite onto pages.
+        """
+        return self._overlay_layer
+
+    @property
+    def colors(self) -> typing.Mapping[str, JSON]:
+        return self._colors
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._features
+
+    def get(self, name: str, kind: typing.Type[F] = Feature) -> typing.Optional[F]:
+        """
+        Look up a feature by type.
+        :param name: The feature type, like "background".
+        :param kind: The Feature class expected, for type checking.
+        :return: The feature, or None if the theme doesn't have it.
+        """
+        feature = self._features.get(name)
+        if feature is not None and not isinstance(feature, kind):
+            raise TypeError(
+                f'The "{name}" feature is a {feature.__class__.__name__}, not a {kind.__name__}'
+            )
+        return feature
+
+    def resources(self) -> typing.List[AssetResource]:
+        """
+        Every asset the theme uses: features, their overrides and overlays.
+        """
+        found: typing.List[AssetResource] = []
+        for feature in self._features.values():
+            found.extend(feature.resources())
+        found.extend(overlay.asset for overlay in self._overlays)
+        return found
@@ -0,0 +1,63 @@
+import typing
+
+from PIL import Image
+
+__all__ = [
+    "composite",
+    "repeat",
+]
+
+
+def _double(canvas: Image.Image, filled: int, total: int, span: int, horizontal: bool):
+    """
+    Grow the filled part of an image along one axis by copying it onto itself.
+    Every step doubles the filled part, so the axis is covered in O(log n) pastes.
+    :param canvas: The image to fill in place.
+    :param filled: How much of the axis (starting from 0) is already filled.
+    :param total: How much of the axis needs to be filled.
+    :param span: How much of the other axis (starting from 0) to copy.
+    :param horizontal: True to grow along the x axis, False for the y axis.
+    """
+    while filled < total:
+        step = min(filled, total - filled)
+        if horizontal:
+            canvas.paste(canvas.crop((0, 0, step, span)), (filled, 0))
+        else:
+            canvas.paste(canvas.crop((0, 0, span, step)), (0, filled))
+        filled += step
+
+
+def repeat(image: Image.Image, columns: int, rows: int) -> Image.Image:
+    """
+    Repeat an image into a grid of identical tiles.
+    Same result as pasting the image into every cell, but only takes O(log n) pastes.
+    :param image: The tile to repeat.
+    :param columns: Number of tiles across.
+    :param rows: Number of tiles down.
+    :return: The tiled image, exactly columns * rows tiles in size.
+    """
+    columns, rows = max(columns, 0), max(rows, 0)
+    grid = Image.new(image.mode, (image.width * columns, image.height * rows))
+    if columns == 0 or rows == 0:
+        return grid
+    grid.paste(image, (0, 0))
+    _double(grid, image.width, grid.width, image.height, True)
+    _double(grid, image.height, grid.height, grid.width, False)
+    return grid
+
+
+def composite(image: Image.Image, piece: Image.Image, position: typing.Tuple[int, int]):
+    """
+    Alpha composite a piece onto an image in place, clipping whatever falls
+    outside of it. Only the overlapping region is touched, so the cost depends
+    on the size of the piece and not of the image.
+    :param image: RGBA image to draw on.
+    :param piece: RGBA image to draw.
+    :param position: Where the top left corner of the piece goes; can be negative.
+    """
+    x, y = position
+    left, top = max(0, -x), max(0, -y)
+    right = min(piece.width, image.width - x)
+    bottom = min(piece.height, image.height - y)
+    if right > left and bottom > top:
+        image.alpha_composite(piece, (x + left, y + top), (left, top, right, bottom))